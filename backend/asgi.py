@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Bajo ASGI se sirven las vistas asíncronas de predicción y pagos
+os.environ.setdefault('SCOUTML_ASYNC', '1')
 
 application = get_asgi_application()
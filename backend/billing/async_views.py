@@ -0,0 +1,70 @@
+from rest_framework import status
+
+from backend.predictions.async_views import AsyncAPIView, json_response, request_data
+from backend.predictions.quota import quota
+from backend.users.supabase_client import get_async_supabase
+from .paypal import get_async_paypal_client
+from .views import PLAN_PRICES, order_data, plan_update, request_key
+
+
+# Versiones asíncronas de las vistas de views.py: las llamadas a PayPal y Supabase no bloquean el event loop
+
+class AsyncCreatePayPalOrderView(AsyncAPIView):
+    async def post(self, request, *args, **kwargs):
+        plan = request_data(request).get('plan')
+        if plan not in PLAN_PRICES:
+            return json_response({"error": "Plan no válido"}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            order = await get_async_paypal_client().create_order(order_data(plan), request_id=request_key(request))
+            return json_response(order, status.HTTP_201_CREATED)
+        except Exception as e:
+            return json_response({"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncCapturePayPalOrderView(AsyncAPIView):
+    async def post(self, request, *args, **kwargs):
+        data = request_data(request)
+        order_id = data.get('orderID')
+        user_id = data.get('userID')
+        plan_purchased = data.get('plan')
+
+        if not all([order_id, user_id, plan_purchased]):
+            return json_response({"error": "Faltan datos requeridos"}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            capture = await get_async_paypal_client().capture_order(order_id, request_id=request_key(request))
+
+            if capture.get('status') != 'COMPLETED':
+                return json_response({"error": "El pago no pudo ser completado"}, status.HTTP_400_BAD_REQUEST)
+
+            supabase = await get_async_supabase()
+            update_response = await supabase.table("profiles").update(plan_update(plan_purchased)).eq("user_id", user_id).execute()
+            if not update_response.data:
+                raise Exception("No se pudo actualizar el perfil del usuario después del pago.")
+
+            quota.invalidate(user_id)
+            return json_response({"message": "Pago exitoso y plan actualizado"}, status.HTTP_200_OK)
+
+        except Exception as e:
+            return json_response({"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncCancelSubscriptionView(AsyncAPIView):
+    async def post(self, request, *args, **kwargs):
+        user_id = request_data(request).get('userID')
+
+        if not user_id:
+            return json_response({"error": "Falta el userID"}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            supabase = await get_async_supabase()
+            update_response = await supabase.table("profiles").update(plan_update("gratis")).eq("user_id", user_id).execute()
+            if not update_response.data:
+                raise Exception("No se pudo actualizar el perfil del usuario para cancelar la suscripción.")
+
+            quota.invalidate(user_id)
+            return json_response({"message": "Suscripción cancelada. Has vuelto al plan Gratis."}, status.HTTP_200_OK)
+
+        except Exception as e:
+            return json_response({"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Tiempo máximo de conexión y de lectura (segundos) de cada petición a PayPal
+DEFAULT_TIMEOUT = (3.05, 15)
+# Margen antes de `expires_in` en el que el token ya se considera caducado
+TOKEN_MARGIN = 60
+# Respuestas de PayPal que se reintentan con espera exponencial
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class PayPalClient:
+    """Cliente de la API REST de PayPal.
+
+    Reutiliza una sesión HTTP keep-alive con timeouts y reintentos, y guarda el token
+    OAuth hasta poco antes de que caduque. Si varias peticiones lo necesitan a la vez,
+    solo una lo pide a PayPal y las demás esperan a que esté listo.
+    """
+
+    def __init__(self, base_url, client_id, client_secret, timeout=DEFAULT_TIMEOUT, retries=2):
+        self.base_url = base_url.rstrip('/')
+        self.auth = (client_id, client_secret)
+        self.timeout = timeout
+        self._token = None
+        self._token_expires = 0
+        self._lock = threading.Lock()
+
+        # Solo se reintentan errores de conexión y respuestas 429/5xx; los POST se incluyen
+        # porque PayPal los hace idempotentes con PayPal-Request-Id
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(max_retries=retry))
+        self.session.mount('http://', HTTPAdapter(max_retries=retry))
+
+    def access_token(self):
+        """Token OAuth vigente; se pide uno nuevo solo cuando el guardado está por caducar."""
+        with self._lock:
+            if self._token is None or time.monotonic() >= self._token_expires:
+                response = self.session.post(
+                    f"{self.base_url}/v1/oauth2/token",
+                    headers={"Accept": "application/json", "Accept-Language": "en_US"},
+                    data={"grant_type": "client_credentials"},
+                    auth=self.auth,
+                    timeout=self.timeout,
+                )
+                response.raise_for_status()
+                data = response.json()
+                self._token = data["access_token"]
+                self._token_expires = time.monotonic() + max(0, int(data.get("expires_in", 0)) - TOKEN_MARGIN)
+            return self._token
+
+    def invalidate_token(self):
+        with self._lock:
+            self._token = None
+
+    def post(self, path, json=None, request_id=None):
+        """POST autenticado a `path`. Si PayPal rechaza el token (401), se renueva y se reintenta una vez."""
+        for attempt in range(2):
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.access_token()}",
+            }
+            if request_id:
+                headers["PayPal-Request-Id"] = request_id
+            response = self.session.post(f"{self.base_url}{path}", headers=headers, json=json, timeout=self.timeout)
+            if response.status_code == 401 and attempt == 0:
+                self.invalidate_token()
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def create_order(self, data, request_id=None):
+        return self.post("/v2/checkout/orders", json=data, request_id=request_id)
+
+    def capture_order(self, order_id, request_id=None):
+        # `request_id` identifica este intento de captura: los reintentos de transporte lo repiten y
+        # PayPal no cobra dos veces, pero un intento nuevo del usuario trae su propia clave
+        return self.post(f"/v2/checkout/orders/{order_id}/capture", request_id=request_id)
+
+
+class AsyncPayPalClient:
+    """Versión asíncrona de PayPalClient para las vistas ASGI, sobre httpx.AsyncClient."""
+
+    def __init__(self, base_url, client_id, client_secret, timeout=DEFAULT_TIMEOUT, retries=2):
+        self.base_url = base_url.rstrip('/')
+        self.auth = (client_id, client_secret)
+        self.retries = retries
+        self._token = None
+        self._token_expires = 0
+        self._lock = asyncio.Lock()
+        connect, read = timeout
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+        )
+
+    async def _send(self, path, **kwargs):
+        for attempt in range(self.retries + 1):
+            response = await self.http.post(f"{self.base_url}{path}", **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def access_token(self):
+        async with self._lock:
+            if self._token is None or time.monotonic() >= self._token_expires:
+                response = await self._send(
+                    "/v1/oauth2/token",
+                    headers={"Accept": "application/json", "Accept-Language": "en_US"},
+                    data={"grant_type": "client_credentials"},
+                    auth=self.auth,
+                )
+                response.raise_for_status()
+                data = response.json()
+                self._token = data["access_token"]
+                self._token_expires = time.monotonic() + max(0, int(data.get("expires_in", 0)) - TOKEN_MARGIN)
+            return self._token
+
+    async def post(self, path, json=None, request_id=None):
+        for attempt in range(2):
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {await self.access_token()}",
+            }
+            if request_id:
+                headers["PayPal-Request-Id"] = request_id
+            response = await self._send(path, headers=headers, json=json)
+            if response.status_code == 401 and attempt == 0:
+                self._token = None
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    async def create_order(self, data, request_id=None):
+        return await self.post("/v2/checkout/orders", json=data, request_id=request_id)
+
+    async def capture_order(self, order_id, request_id=None):
+        return await self.post(f"/v2/checkout/orders/{order_id}/capture", request_id=request_id)
+
+
+_client = None
+_client_lock = threading.Lock()
+# Un cliente asíncrono por event loop (sus conexiones no se pueden usar desde otro loop)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_paypal_client():
+    """Cliente compartido por todas las peticiones del proceso, configurado desde settings."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = PayPalClient(settings.PAYPAL_API_BASE, settings.PAYPAL_CLIENT_ID, settings.PAYPAL_CLIENT_SECRET)
+        return _client
+
+
+def get_async_paypal_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncPayPalClient(settings.PAYPAL_API_BASE, settings.PAYPAL_CLIENT_ID, settings.PAYPAL_CLIENT_SECRET)
+        _async_clients[loop] = client
+    return client
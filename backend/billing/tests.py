@@ -1,3 +1,153 @@
-from django.test import TestCase
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+
+from .async_views import AsyncCancelSubscriptionView, AsyncCapturePayPalOrderView, AsyncCreatePayPalOrderView
+from .paypal import AsyncPayPalClient, PayPalClient
+
+urlpatterns = [
+    path('create-order/', AsyncCreatePayPalOrderView.as_view()),
+    path('capture-order/', AsyncCapturePayPalOrderView.as_view()),
+    path('cancel-subscription/', AsyncCancelSubscriptionView.as_view()),
+]
+
+
+class _StubPayPal(BaseHTTPRequestHandler):
+    # Servidor local que imita los endpoints de PayPal usados en el checkout
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        server.calls.append(self.path)
+        if self.path != '/v1/oauth2/token':
+            server.request_ids.append(self.headers.get('PayPal-Request-Id'))
+        if self.path == '/v1/oauth2/token':
+            server.tokens += 1
+            body = {"access_token": f"token-{server.tokens}", "expires_in": server.expires_in}
+            status = 200
+        elif self.headers.get('Authorization') in server.revoked:
+            body, status = {"error": "invalid_token"}, 401
+        elif self.path.endswith('/capture') and server.failures:
+            server.failures -= 1
+            body, status = {"name": "SERVICE_UNAVAILABLE"}, 503
+        elif self.path.endswith('/capture'):
+            body, status = {"id": self.path.split('/')[-2], "status": "COMPLETED"}, 201
+        else:
+            body, status = {"id": "ORDER-1", "status": "CREATED"}, 201
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class PayPalClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubPayPal)
+        self.server.calls, self.server.tokens, self.server.expires_in, self.server.revoked = [], 0, 32400, set()
+        self.server.request_ids, self.server.failures = [], 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = PayPalClient(f"http://127.0.0.1:{self.server.server_port}", 'id', 'secret')
+
+    def test_token_se_reutiliza_entre_llamadas(self):
+        self.client.create_order({"intent": "CAPTURE"})
+        capture = self.client.capture_order('ORDER-1')
+        self.assertEqual(capture['status'], 'COMPLETED')
+        self.assertEqual(self.server.calls.count('/v1/oauth2/token'), 1)
+
+    def test_token_concurrente_se_pide_una_vez(self):
+        threads = [threading.Thread(target=self.client.create_order, args=({},)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.tokens, 1)
+
+    def test_token_caducado_se_renueva(self):
+        self.server.expires_in = 30  # menos que el margen: caduca en seguida
+        self.client.create_order({})
+        self.client.create_order({})
+        self.assertEqual(self.server.tokens, 2)
+
+    def test_token_rechazado_se_renueva_y_reintenta(self):
+        self.client.create_order({})
+        self.server.revoked.add('Bearer token-1')
+        order = self.client.create_order({})
+        self.assertEqual(order['status'], 'CREATED')
+        self.assertEqual(self.server.tokens, 2)
+
+    def test_reintento_de_transporte_repite_la_clave(self):
+        self.server.failures = 1
+        capture = self.client.capture_order('ORDER-1', request_id='intento-1')
+        self.assertEqual(capture['status'], 'COMPLETED')
+        self.assertEqual(self.server.request_ids, ['intento-1', 'intento-1'])
+
+    def test_cada_captura_usa_su_clave(self):
+        # Un segundo intento de pagar la misma orden no debe recibir la respuesta guardada del primero
+        self.client.capture_order('ORDER-1', request_id='intento-1')
+        self.client.capture_order('ORDER-1', request_id='intento-2')
+        self.assertEqual(self.server.request_ids, ['intento-1', 'intento-2'])
+
+    async def test_cliente_async_repite_la_clave_al_reintentar(self):
+        self.server.failures = 1
+        client = AsyncPayPalClient(self.client.base_url, 'id', 'secret')
+        await client.capture_order('ORDER-1', request_id='intento-1')
+        self.assertEqual(self.server.request_ids, ['intento-1', 'intento-1'])
+
+    async def test_cliente_async_reutiliza_el_token(self):
+        client = AsyncPayPalClient(self.client.base_url, 'id', 'secret')
+        await client.create_order({})
+        capture = await client.capture_order('ORDER-1')
+        self.assertEqual(capture['status'], 'COMPLETED')
+        self.assertEqual(self.server.tokens, 1)
+
+
+class _FakePayPal:
+    # Cliente que solo guarda la clave de cada captura; el pago nunca se completa
+    def __init__(self):
+        self.request_ids = []
+
+    async def capture_order(self, order_id, request_id=None):
+        self.request_ids.append(request_id)
+        return {"id": order_id, "status": "DECLINED"}
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncBillingViewTests(SimpleTestCase):
+    """Las vistas asíncronas validan el cuerpo antes de llamar a PayPal o Supabase."""
+
+    async def test_cuerpo_que_no_es_un_objeto(self):
+        for url in ('/create-order/', '/capture-order/', '/cancel-subscription/'):
+            response = await self.async_client.post(url, [1, 2], content_type='application/json')
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json(), {"error": "El cuerpo de la petición debe ser un objeto JSON."})
+
+    async def test_json_invalido(self):
+        response = await self.async_client.post('/capture-order/', '{roto', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "El cuerpo de la petición no es un JSON válido."})
+
+    async def test_plan_no_valido(self):
+        response = await self.async_client.post('/create-order/', {'plan': 'oro'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Plan no válido"})
+
+    async def test_clave_de_captura_por_peticion(self):
+        client = _FakePayPal()
+        body = {'orderID': 'ORDER-1', 'userID': 'u1', 'plan': 'basico'}
+        with patch('backend.billing.async_views.get_async_paypal_client', return_value=client):
+            await self.async_client.post('/capture-order/', body, content_type='application/json')
+            await self.async_client.post('/capture-order/', body, content_type='application/json')
+            await self.async_client.post('/capture-order/', body, content_type='application/json', headers={'Idempotency-Key': 'clic-1'})
+        self.assertEqual(len(set(client.request_ids[:2])), 2)
+        self.assertEqual(client.request_ids[2], 'clic-1')
@@ -1,6 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from .views import CreatePayPalOrderView, CapturePayPalOrderView,CancelSubscriptionView
 
+if settings.SCOUTML_ASYNC:
+    from .async_views import (
+        AsyncCreatePayPalOrderView as CreatePayPalOrderView,
+        AsyncCapturePayPalOrderView as CapturePayPalOrderView,
+        AsyncCancelSubscriptionView as CancelSubscriptionView,
+    )
+
 urlpatterns = [
     path('create-order/', CreatePayPalOrderView.as_view(), name='create-paypal-order'),
     path('capture-order/', CapturePayPalOrderView.as_view(), name='capture-paypal-order'),
@@ -1,11 +1,11 @@
 from django.shortcuts import render
-import requests
-from django.conf import settings
+import uuid
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from supabase import create_client
-import os
+from backend.users.supabase_client import get_supabase
+from backend.predictions.quota import quota
+from .paypal import get_paypal_client
 from datetime import datetime
 
 # Precios de los Planes 
@@ -15,20 +15,31 @@ PLAN_PRICES = {
     'avanzado': '99.00',
 }
 
-# Función para obtener un token de acceso de PayPal
-def get_paypal_access_token():
-    url = "https://api.sandbox.paypal.com/v1/oauth2/token" # Usa api.paypal.com para producción
-    headers = {
-        "Accept": "application/json",
-        "Accept-Language": "en_US",
+# Orden de PayPal para la suscripción a un plan
+def order_data(plan):
+    return {
+        "intent": "CAPTURE",
+        "purchase_units": [{
+            "amount": {
+                "currency_code": "USD",
+                "value": PLAN_PRICES[plan]
+            },
+            "description": f"Suscripción al plan {plan.capitalize()}"
+        }]
     }
-    data = {
-        "grant_type": "client_credentials"
+
+# Cambio de plan en el perfil: se resetean los contadores para que pueda usar su nuevo plan
+def plan_update(plan):
+    return {
+        "plan": plan,
+        "prediction_count": 0,
+        "last_prediction_date": datetime.now().isoformat()
     }
-    auth = (settings.PAYPAL_CLIENT_ID, settings.PAYPAL_CLIENT_SECRET)
-    response = requests.post(url, headers=headers, data=data, auth=auth)
-    response.raise_for_status()
-    return response.json()["access_token"]
+
+# Clave de idempotencia (PayPal-Request-Id) de una petición: la que manda el cliente en
+# Idempotency-Key para repetir el mismo intento, o una nueva por petición
+def request_key(request):
+    return request.headers.get('Idempotency-Key') or str(uuid.uuid4())
 
 # Vista para crear una orden en PayPal
 class CreatePayPalOrderView(APIView):
@@ -38,25 +49,8 @@ class CreatePayPalOrderView(APIView):
             return Response({"error": "Plan no válido"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            access_token = get_paypal_access_token()
-            url = "https://api.sandbox.paypal.com/v2/checkout/orders" # Usa api.paypal.com para producción
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {access_token}",
-            }
-            data = {
-                "intent": "CAPTURE",
-                "purchase_units": [{
-                    "amount": {
-                        "currency_code": "USD",
-                        "value": PLAN_PRICES[plan]
-                    },
-                    "description": f"Suscripción al plan {plan.capitalize()}"
-                }]
-            }
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            return Response(response.json(), status=status.HTTP_201_CREATED)
+            order = get_paypal_client().create_order(order_data(plan), request_id=request_key(request))
+            return Response(order, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -71,30 +65,21 @@ class CapturePayPalOrderView(APIView):
             return Response({"error": "Faltan datos requeridos"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            access_token = get_paypal_access_token()
-            url = f"https://api.sandbox.paypal.com/v2/checkout/orders/{order_id}/capture" # Usa api.paypal.com para producción
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {access_token}",
-            }
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
+            capture = get_paypal_client().capture_order(order_id, request_id=request_key(request))
             
             # Si el pago fue exitoso 
-            if response.json().get('status') == 'COMPLETED':
-                supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+            if capture.get('status') == 'COMPLETED':
+                supabase = get_supabase()
                 
                 # Actualiza el plan del usuario en la base de datos
-                update_response = supabase.table("profiles").update({
-                    "plan": plan_purchased,
-                    # Reseteamos los contadores para que pueda usar su nuevo plan
-                    "prediction_count": 0,
-                    "last_prediction_date": datetime.now().isoformat()
-                }).eq("user_id", user_id).execute()
+                update_response = supabase.table("profiles").update(plan_update(plan_purchased)).eq("user_id", user_id).execute()
 
                 if not update_response.data:
                     raise Exception("No se pudo actualizar el perfil del usuario después del pago.")
 
+                # El plan cambió: el perfil cacheado para las cuotas ya no sirve
+                quota.invalidate(user_id)
+
                 return Response({"message": "Pago exitoso y plan actualizado"}, status=status.HTTP_200_OK)
             else:
                 return Response({"error": "El pago no pudo ser completado"}, status=status.HTTP_400_BAD_REQUEST)
@@ -112,18 +97,16 @@ class CancelSubscriptionView(APIView):
             return Response({"error": "Falta el userID"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+            supabase = get_supabase()
             
             # Actualiza el plan del usuario a 'gratis' y resetea los contadores
-            update_response = supabase.table("profiles").update({
-                "plan": "gratis",
-                "prediction_count": 0,
-                "last_prediction_date": datetime.now().isoformat()
-            }).eq("user_id", user_id).execute()
+            update_response = supabase.table("profiles").update(plan_update("gratis")).eq("user_id", user_id).execute()
 
             if not update_response.data:
                 raise Exception("No se pudo actualizar el perfil del usuario para cancelar la suscripción.")
 
+            quota.invalidate(user_id)
+
             return Response({"message": "Suscripción cancelada. Has vuelto al plan Gratis."}, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -0,0 +1,226 @@
+import asyncio
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import status
+
+from . import metrics
+from .file_reader import PlayerFileError
+from .predictor import single
+from .export import ExportError, export_format
+from .formats import dumps, columnar, wants_columnar, stream_format
+from .quota import quota, PLAN_LIMITS, ProfileNotFound, QuotaExceeded
+from .views import score_upload, stream_response, upload_body, upload_error, UploadStream
+
+#  CONFIGURACIÓN (variables de entorno)
+# SCOUTML_ASYNC_SCORING_WORKERS: hilos para puntuar fuera del event loop (por defecto, los núcleos disponibles)
+_executor = None
+
+
+def _scoring_executor():
+  # Acotado: muchas peticiones esperando a Supabase no se convierten en muchas puntuaciones simultáneas
+  global _executor
+  if _executor is None:
+    workers = int(os.getenv('SCOUTML_ASYNC_SCORING_WORKERS') or os.cpu_count() or 1)
+    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scoutml-score')
+  return _executor
+
+
+def _submit(func, *args):
+  # El pool no propaga los contextvars: se copia el contexto para que las etapas lleguen al desglose
+  context = contextvars.copy_context()
+  return _scoring_executor().submit(context.run, func, *args)
+
+
+async def run_scoring(func, *args):
+  """Ejecuta `func(*args)` (trabajo de CPU) en el pool de puntuación sin bloquear el event loop."""
+  return await asyncio.wrap_future(_submit(func, *args))
+
+
+def json_response(data, status_code):
+  return HttpResponse(dumps(data), status=status_code, content_type='application/json')
+
+
+class InvalidBody(Exception):
+  """El cuerpo de la petición no es un objeto JSON válido."""
+
+
+def request_data(request):
+  """Equivalente a request.data de DRF: cuerpo JSON o campos del formulario.
+
+  Lanza InvalidBody (un 400 en AsyncAPIView) si el JSON no se puede leer o no es un objeto.
+  """
+  if request.content_type == 'application/json':
+    try:
+      data = json.loads(request.body or b'{}')
+    except ValueError:
+      raise InvalidBody("El cuerpo de la petición no es un JSON válido.")
+    # Una lista o un número también son JSON válido, pero las vistas esperan campos
+    if not isinstance(data, dict):
+      raise InvalidBody("El cuerpo de la petición debe ser un objeto JSON.")
+    return data
+  return request.POST
+
+
+class AsyncAPIView(View):
+  """Vista asíncrona sin la capa de DRF (que no soporta vistas async); exenta de CSRF como APIView."""
+
+  @classonlymethod
+  def as_view(cls, **initkwargs):
+    view = super().as_view(**initkwargs)
+    view.csrf_exempt = True
+    return view
+
+  async def dispatch(self, request, *args, **kwargs):
+    try:
+      return await super().dispatch(request, *args, **kwargs)
+    except InvalidBody as e:
+      return json_response({"error": str(e)}, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncProspectPredictionView(AsyncAPIView):
+  """Misma API que ProspectPredictionView: la E/S con Supabase es asíncrona y la puntuación va al pool."""
+
+  async def post(self, request, *args, **kwargs):
+    data = request_data(request)
+    user_id = data.get('user_id')
+    if not user_id:
+      return json_response({"error": "Falta el user_id del usuario."}, status.HTTP_401_UNAUTHORIZED)
+
+    try:
+      with metrics.stage('profile'):
+        profile = await quota.aprofile(user_id)
+    except ProfileNotFound:
+      return json_response({"error": "Perfil de usuario no encontrado."}, status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+      return json_response({"error": f"Error al verificar el perfil: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    user_plan = profile.plan
+    limit = PLAN_LIMITS.get(user_plan, 0)
+
+    #  Lógica para carga de archivos (Plan Avanzado)
+    if 'file' in request.FILES:
+      if user_plan != 'avanzado':
+        # Antes de negar se confirma con Supabase: el cambio de plan pudo hacerse en otro worker
+        try:
+          profile = await quota.aconfirm_plan(profile, 'avanzado')
+        except Exception as e:
+          return json_response({"error": f"Error al verificar el perfil: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if profile.plan != 'avanzado':
+          return json_response({"error": "La carga de archivos solo está disponible en el plan Avanzado."}, status.HTTP_403_FORBIDDEN)
+        user_plan, limit = profile.plan, PLAN_LIMITS.get(profile.plan, 0)
+
+      try:
+        fmt = stream_format(data) or export_format(data)
+      except ExportError as e:
+        return json_response({"error": str(e)}, status.HTTP_400_BAD_REQUEST)
+
+      try:
+        with metrics.stage('quota_reserve'):
+          reservation = await quota.areserve(user_id, 1)
+      except QuotaExceeded:
+        return json_response({"error": f"Ya has alcanzado tu límite mensual de {limit} predicciones."}, status.HTTP_429_TOO_MANY_REQUESTS)
+      except Exception as e:
+        return json_response({"error": f"Error al verificar el perfil: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+      if fmt:
+        return await self.stream_upload(request, data, reservation, fmt)
+
+      try:
+        response_data, players_to_process = await run_scoring(score_upload, request.FILES['file'], data.get('player_type'), reservation)
+        if wants_columnar(data):
+          response_data["results"] = columnar(response_data["results"])
+        with metrics.stage('quota_commit'):
+          await quota.acommit(reservation, players_to_process)
+        return json_response(response_data, status.HTTP_200_OK)
+
+      except PlayerFileError as e:
+        return json_response({"error": str(e)}, status.HTTP_400_BAD_REQUEST)
+      except Exception as e:
+        return json_response({"error": f"Error al procesar el archivo: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+      finally:
+        await quota.arelease(reservation)
+
+    # Lógica para Predicción Individual
+    if await quota.aavailable(user_id) <= 0:
+      return json_response({"error": f"Has alcanzado tu límite mensual de {limit} predicciones."}, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    player_data = data.get('player_data')
+    player_type = data.get('player_type')
+
+    if not all([player_data, player_type]):
+      return json_response({"error": "Faltan 'player_data' o 'player_type'."}, status.HTTP_400_BAD_REQUEST)
+    if not isinstance(player_data, dict):
+      return json_response({"error": "'player_data' debe ser un objeto con las estadísticas del jugador."}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+      with metrics.stage('quota_reserve'):
+        reservation = await quota.areserve(user_id, 1)
+    except QuotaExceeded:
+      return json_response({"error": f"Has alcanzado tu límite mensual de {limit} predicciones."}, status.HTTP_429_TOO_MANY_REQUESTS)
+    except Exception as e:
+      return json_response({"error": f"Error al verificar el perfil: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    try:
+      result = await run_scoring(single, player_data, player_type)
+      if 'error' in result:
+        await quota.arelease(reservation)
+        return json_response(result, status.HTTP_400_BAD_REQUEST)
+
+      with metrics.stage('quota_commit'):
+        await quota.acommit(reservation)
+      return json_response(result, status.HTTP_200_OK)
+
+    except Exception as e:
+      await quota.arelease(reservation)
+      return json_response({"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+  async def stream_upload(self, request, data, reservation, fmt):
+    try:
+      stream = await run_scoring(UploadStream, request.FILES['file'], data.get('player_type'), reservation)
+      events = iter(stream)
+      first = await run_scoring(next, events)
+    except PlayerFileError as e:
+      await quota.arelease(reservation)
+      return json_response({"error": str(e)}, status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+      await quota.arelease(reservation)
+      return json_response({"error": f"Error al procesar el archivo: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    error = upload_error(fmt, first)
+    if error is not None:
+      events.close()
+      await quota.arelease(reservation)
+      return json_response(error, status.HTTP_400_BAD_REQUEST)
+
+    return stream_response(_asettled(upload_body(fmt, first, events), stream, events, reservation), fmt)
+
+
+# Versión asíncrona de views._settled: cada bloque se puntúa y se escribe en el pool sin bloquear el event loop
+async def _asettled(body, stream, events, reservation):
+  pending = None
+  try:
+    while True:
+      pending = _submit(next, body, None)
+      block = await asyncio.wrap_future(pending)
+      if block is None:
+        break
+      yield block
+  finally:
+    await quota.acommit(reservation, stream.processed)
+    # Si se canceló a mitad de un bloque, el generador sigue dentro de next() en el pool: cerrarlo ahora
+    # daría "generator already executing", así que se cierra en ese hilo cuando termine el bloque
+    if pending is not None and not pending.done():
+      pending.add_done_callback(lambda _: _close(body, events))
+    else:
+      _close(body, events)
+
+
+def _close(body, events):
+  body.close()
+  events.close()
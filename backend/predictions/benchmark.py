@@ -0,0 +1,333 @@
+"""Benchmark del pipeline de predicción con datos sintéticos (sin descargas de Supabase).
+
+Uso:
+  python manage.py benchmark [--quick] [--output resultados.json] [--compare anterior.json]
+  python -m backend.predictions.benchmark [...]
+
+Genera datasets de pitchers y bateadores, entrena un RandomForest sintético con el mismo
+formato de .pkl que producción y mide single(), batch(), player_file() y la memoria.
+El resultado es un JSON para comparar ejecuciones entre commits.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from openpyxl import Workbook
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+try:
+  import resource
+except ImportError:  # Windows: sin pico de RSS
+  resource = None
+
+# Parámetros por defecto y versión reducida (--quick) para comprobar que el benchmark funciona
+DEFAULTS = {
+  'seed': 0,
+  'reference_rows': 5000,
+  'trees': 100,
+  'single_iterations': 300,
+  'batch_sizes': [1, 10, 500, 10000],
+  'csv_rows': 10000,
+  'xlsx_rows': 2000,
+}
+QUICK = dict(DEFAULTS, reference_rows=500, trees=10, single_iterations=20, batch_sizes=[1, 10, 500], csv_rows=500, xlsx_rows=100)
+
+# Estadísticas base para generar archivos de jugadores como los que suben los usuarios
+BATTER_FILE_COLUMNS = ['G', 'AB', 'H', '2B', '3B', 'HR', 'BB', 'SO', 'HBP', 'SF', 'PO', 'A', 'E']
+
+
+def _artifact_name(url):
+  return url.rsplit('/', 1)[-1]
+
+
+def build_artifacts(directory, params):
+  """Escribe en `directory` los .pkl y .csv sintéticos con los nombres que espera predictor."""
+  from .predictor import PLAYER_TYPES
+
+  rng = np.random.default_rng(params['seed'])
+  n = params['reference_rows']
+  for player_type, (model_url, dataset_url, _, pesos) in PLAYER_TYPES.items():
+    features = list(pesos)
+    X = rng.gamma(2.0, 1.0, size=(n, len(features))).round(3)
+    dataset = pd.DataFrame(X, columns=features)
+    dataset.insert(0, 'yearID', rng.integers(1990, 2024, n))
+    dataset.insert(0, 'nameLast', [f'Apellido{i}' for i in range(n)])
+    dataset.insert(0, 'nameFirst', [f'Nombre{i}' for i in range(n)])
+    y = (X[:, 0] + rng.normal(0, 1, n) > 2).astype(int)
+    dataset.to_csv(directory / _artifact_name(dataset_url), index=False)
+
+    scaler = StandardScaler().fit(dataset[features])
+    model = RandomForestClassifier(n_estimators=params['trees'], max_depth=12, random_state=params['seed'], n_jobs=1)
+    model.fit(scaler.transform(dataset[features]), y)
+    joblib.dump({'model': model, 'scaler': scaler, 'features': features}, directory / _artifact_name(model_url))
+
+
+def synthetic_players(player_type, n, rng):
+  from .predictor import PLAYER_TYPES
+
+  features = list(PLAYER_TYPES[player_type][3])
+  X = rng.gamma(2.0, 1.0, size=(n, len(features))).round(3)
+  return [dict(zip(features, map(float, row))) for row in X]
+
+
+def build_player_files(directory, params, rng):
+  """Archivos de bateadores en CSV y XLSX con estadísticas base, como los que se suben en la vista."""
+  def frame(n):
+    stats = pd.DataFrame(rng.integers(0, 150, size=(n, len(BATTER_FILE_COLUMNS))), columns=BATTER_FILE_COLUMNS)
+    stats['AB'] += 200
+    stats.insert(0, 'Birth Date', '1999-04-12')
+    stats.insert(0, 'Last Name', [f'Apellido{i}' for i in range(n)])
+    stats.insert(0, 'Name', [f'Nombre{i}' for i in range(n)])
+    return stats
+
+  csv_path = directory / 'players.csv'
+  frame(params['csv_rows']).to_csv(csv_path, index=False)
+
+  xlsx_path = directory / 'players.xlsx'
+  workbook = Workbook(write_only=True)
+  sheet = workbook.create_sheet()
+  data = frame(params['xlsx_rows'])
+  sheet.append(list(data.columns))
+  for row in data.itertuples(index=False, name=None):
+    sheet.append(list(row))
+  workbook.save(xlsx_path)
+  return csv_path, xlsx_path
+
+
+def _percentiles(samples):
+  ms = np.asarray(samples) * 1000
+  return {
+    'mean_ms': float(ms.mean()),
+    'p50_ms': float(np.percentile(ms, 50)),
+    'p90_ms': float(np.percentile(ms, 90)),
+    'p99_ms': float(np.percentile(ms, 99)),
+    'max_ms': float(ms.max()),
+  }
+
+
+def bench_single(player_type, params, rng):
+  from . import predictor
+
+  players = synthetic_players(player_type, params['single_iterations'], rng)
+  tiempos = []
+  for player in players:
+    inicio = time.perf_counter()
+    predictor.single(player, player_type)
+    tiempos.append(time.perf_counter() - inicio)
+  return _percentiles(tiempos)
+
+
+def bench_single_cached(player_type, params, rng):
+  """Latencia de single() para entradas repetidas, servidas desde la caché de reportes."""
+  from . import predictor
+  from .cache import PredictionCache
+
+  sin_cache = predictor.prediction_cache
+  predictor.prediction_cache = PredictionCache(maxsize=1000, ttl=3600, db_path='')
+  try:
+    player = synthetic_players(player_type, 1, rng)[0]
+    predictor.single(player, player_type)
+    tiempos = []
+    for _ in range(params['single_iterations']):
+      inicio = time.perf_counter()
+      predictor.single(player, player_type)
+      tiempos.append(time.perf_counter() - inicio)
+  finally:
+    predictor.prediction_cache = sin_cache
+  return _percentiles(tiempos)
+
+
+def bench_batch(player_type, params, rng):
+  from . import predictor
+
+  resultados = {}
+  for size in params['batch_sizes']:
+    players = synthetic_players(player_type, size, rng)
+    # Suficientes repeticiones para que los lotes pequeños no se midan con una sola muestra
+    repeticiones = max(1, min(50, 2000 // size))
+    tiempos = []
+    for _ in range(repeticiones):
+      lote = [dict(p) for p in players]
+      inicio = time.perf_counter()
+      predictor.batch(lote, player_type, workers=1)
+      tiempos.append(time.perf_counter() - inicio)
+    mediana = float(np.median(tiempos))
+    resultados[str(size)] = {
+      'repeats': repeticiones,
+      'median_s': mediana,
+      'best_s': float(min(tiempos)),
+      'players_per_s': size / mediana if mediana else None,
+    }
+  return resultados
+
+
+def bench_player_file(path, file_type, rows, repeats=3):
+  from .file_reader import player_file
+
+  tiempos = []
+  for _ in range(repeats):
+    inicio = time.perf_counter()
+    players = player_file(str(path), file_type)
+    tiempos.append(time.perf_counter() - inicio)
+  if isinstance(players, dict):
+    raise RuntimeError(players['error'])
+  mediana = float(np.median(tiempos))
+  return {'rows': rows, 'median_s': mediana, 'rows_per_s': rows / mediana if mediana else None}
+
+
+def _python_peak_mb(func, *args):
+  """Pico de memoria de Python (tracemalloc) de una llamada; se mide aparte porque tracemalloc ralentiza."""
+  tracemalloc.start()
+  try:
+    func(*args)
+    return tracemalloc.get_traced_memory()[1] / 2 ** 20
+  finally:
+    tracemalloc.stop()
+
+
+def _peak_rss_mb():
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux lo da en KiB y macOS en bytes
+  return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _git_commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                          cwd=Path(__file__).resolve().parent).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def run(params=None):
+  """Ejecuta el benchmark completo y devuelve los resultados como dict."""
+  params = dict(DEFAULTS, **(params or {}))
+  workdir = Path(tempfile.mkdtemp(prefix='scoutml-bench-'))
+  try:
+    return _run(params, workdir)
+  finally:
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run(params, workdir):
+  # Artefactos locales y snapshots propios: nada se descarga ni se mezcla con la caché real
+  os.environ['SCOUTML_MODEL_DIR'] = str(workdir)
+  os.environ['SCOUTML_SNAPSHOT_DIR'] = str(workdir / 'snapshots')
+
+  from . import predictor
+  from .cache import PredictionCache
+
+  build_artifacts(workdir, params)
+  predictor.registry.clear()
+  # Sin caché de reportes: se mide el pipeline, no la memoización (que se mide aparte)
+  predictor.prediction_cache = PredictionCache(maxsize=0, db_path='')
+  rng = np.random.default_rng(params['seed'] + 1)
+
+  results = {
+    'meta': {
+      'timestamp': datetime.now(timezone.utc).isoformat(),
+      'commit': _git_commit(),
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'pandas': pd.__version__,
+      'sklearn': sklearn.__version__,
+      'cpu_count': os.cpu_count(),
+      'inference': predictor.INFERENCE,
+      'params': params,
+    },
+    'load_s': {},
+    'single': {},
+    'single_cached': {},
+    'batch': {},
+  }
+
+  for player_type in predictor.PLAYER_TYPES:
+    inicio = time.perf_counter()
+    predictor.registry.get(player_type)
+    results['load_s'][player_type] = time.perf_counter() - inicio
+    results['single'][player_type] = bench_single(player_type, params, rng)
+    results['single_cached'][player_type] = bench_single_cached(player_type, params, rng)
+    results['batch'][player_type] = bench_batch(player_type, params, rng)
+
+  csv_path, xlsx_path = build_player_files(workdir, params, rng)
+  results['player_file'] = {
+    'csv': bench_player_file(csv_path, 'csv', params['csv_rows']),
+    'xlsx': bench_player_file(xlsx_path, 'xlsx', params['xlsx_rows']),
+  }
+
+  from .file_reader import player_file
+  mayor = max(params['batch_sizes'])
+  players = synthetic_players('batter', mayor, rng)
+  results['memory'] = {
+    f'batch_{mayor}_python_peak_mb': _python_peak_mb(predictor.batch, players, 'batter', 1),
+    'csv_parse_python_peak_mb': _python_peak_mb(player_file, str(csv_path), 'csv'),
+    'peak_rss_mb': _peak_rss_mb(),
+  }
+  return results
+
+
+def _metrics(results, prefix=''):
+  """Aplana los resultados en {'ruta.de.la.métrica': valor} para compararlos."""
+  plano = {}
+  for key, value in results.items():
+    if key == 'meta':
+      continue
+    ruta = f'{prefix}{key}'
+    if isinstance(value, dict):
+      plano.update(_metrics(value, f'{ruta}.'))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+      plano[ruta] = value
+  return plano
+
+
+def compare(current, baseline):
+  """Cociente actual/anterior de cada métrica (en tiempos y memoria, < 1 es mejor; en 'per_s', > 1)."""
+  actual, anterior = _metrics(current), _metrics(baseline)
+  return {
+    ruta: actual[ruta] / anterior[ruta]
+    for ruta in sorted(actual)
+    if ruta in anterior and anterior[ruta] and actual[ruta] is not None
+  }
+
+
+def add_arguments(parser):
+  parser.add_argument('--quick', action='store_true', help='Versión reducida para comprobar que funciona.')
+  parser.add_argument('--output', help='Archivo JSON donde guardar los resultados (por defecto, la salida estándar).')
+  parser.add_argument('--compare', help='JSON de una ejecución anterior; añade el cociente de cada métrica.')
+
+
+def main(options, stdout=sys.stdout):
+  # Los mensajes de carga del predictor van a stderr para que stdout sea JSON válido
+  with contextlib.redirect_stdout(sys.stderr):
+    results = run(QUICK if options['quick'] else DEFAULTS)
+  if options.get('compare'):
+    results['compare'] = compare(results, json.loads(Path(options['compare']).read_text()))
+  salida = json.dumps(results, indent=2)
+  if options.get('output'):
+    Path(options['output']).write_text(salida)
+  else:
+    stdout.write(salida + '\n')
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  add_arguments(parser)
+  main(vars(parser.parse_args()))
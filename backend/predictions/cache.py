@@ -0,0 +1,130 @@
+import hashlib
+import math
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+#  CONFIGURACIÓN (variables de entorno)
+# SCOUTML_PREDICTION_CACHE_SIZE: reportes guardados en memoria por proceso (0 desactiva la caché)
+# SCOUTML_PREDICTION_CACHE_TTL: segundos que un reporte sigue siendo válido
+# SCOUTML_PREDICTION_CACHE_DB: ruta de una base SQLite compartida entre procesos (opcional)
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 3600
+
+
+def canonical(value):
+  """Forma canónica de un valor de entrada: 0.3 y np.float64(0.3) dan la misma clave, '0.3' no."""
+  if isinstance(value, (bool, np.bool_)):
+    return ('b', bool(value))
+  if isinstance(value, (int, np.integer)):
+    return ('i', int(value))
+  if isinstance(value, (float, np.floating)):
+    value = float(value)
+    return ('f', 'nan' if math.isnan(value) else value)
+  if isinstance(value, str):
+    return ('s', value)
+  return ('r', repr(value))
+
+
+class PredictionCache:
+  """Caché LRU con caducidad de reportes de predicción, con una capa opcional en SQLite.
+
+  La clave incluye la versión del modelo, así que al cambiar el pipeline o el dataset de
+  referencia los reportes anteriores dejan de coincidir y se descartan solos.
+  """
+
+  def __init__(self, maxsize=None, ttl=None, db_path=None):
+    self.maxsize = int(maxsize if maxsize is not None else os.getenv('SCOUTML_PREDICTION_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+    self.ttl = float(ttl if ttl is not None else os.getenv('SCOUTML_PREDICTION_CACHE_TTL', DEFAULT_CACHE_TTL))
+    self.db_path = db_path if db_path is not None else os.getenv('SCOUTML_PREDICTION_CACHE_DB')
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = self.misses = self.disk_hits = 0
+    if self.db_path:
+      with self._connect() as conn:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, expires REAL NOT NULL, report BLOB NOT NULL)')
+
+  @property
+  def enabled(self):
+    return self.maxsize > 0
+
+  def _connect(self):
+    return sqlite3.connect(self.db_path, timeout=5)
+
+  @staticmethod
+  def _disk_key(key):
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+  def get(self, key):
+    """Reporte guardado para `key`, o None. El llamador debe copiarlo antes de modificarlo."""
+    now = time.monotonic()
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        if entry[0] > now:
+          self._entries.move_to_end(key)
+          self.hits += 1
+          return entry[1]
+        del self._entries[key]
+
+    if self.db_path:
+      with self._connect() as conn:
+        row = conn.execute('SELECT report FROM reports WHERE key = ? AND expires > ?', (self._disk_key(key), time.time())).fetchone()
+      if row is not None:
+        report = pickle.loads(row[0])
+        self._remember(key, report)
+        with self._lock:
+          self.hits += 1
+          self.disk_hits += 1
+        return report
+
+    with self._lock:
+      self.misses += 1
+    return None
+
+  def _remember(self, key, report):
+    with self._lock:
+      self._entries[key] = (time.monotonic() + self.ttl, report)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+
+  def set_many(self, items):
+    """Guarda varios pares (clave, reporte) de una vez."""
+    if not items:
+      return
+    for key, report in items:
+      self._remember(key, report)
+    if self.db_path:
+      expires = time.time() + self.ttl
+      with self._connect() as conn:
+        conn.executemany(
+          'INSERT OR REPLACE INTO reports (key, expires, report) VALUES (?, ?, ?)',
+          [(self._disk_key(key), expires, pickle.dumps(report, protocol=pickle.HIGHEST_PROTOCOL)) for key, report in items],
+        )
+        conn.execute('DELETE FROM reports WHERE expires <= ?', (time.time(),))
+
+  def invalidate(self, player_type=None):
+    """Borra los reportes de un tipo de jugador (o todos) de la memoria de este proceso."""
+    with self._lock:
+      if player_type is None:
+        self._entries.clear()
+      else:
+        for key in [key for key in self._entries if key[0] == player_type]:
+          del self._entries[key]
+
+  def stats(self):
+    with self._lock:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "disk_hits": self.disk_hits,
+        "size": len(self._entries),
+        "maxsize": self.maxsize,
+      }
@@ -0,0 +1,207 @@
+import codecs
+import csv
+import io
+import math
+import tempfile
+
+import numpy as np
+from openpyxl import Workbook
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:  # está en requirements.txt; en una instalación sin pyarrow no se ofrece Parquet
+  pa = None
+
+#  EXPORTACIÓN
+# response_format=csv|xlsx|parquet en la carga de archivos (y en los resultados de un trabajo):
+# los reportes se escriben como filas de una hoja de cálculo a medida que se puntúa cada bloque,
+# sin pasar por JSON. XLSX usa el modo write_only de openpyxl (memoria constante) y se envía al
+# cerrar el libro; CSV y Parquet (un row group por bloque) se envían bloque a bloque.
+EXPORT_CONTENT_TYPES = {
+  'csv': 'text/csv; charset=utf-8',
+  'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+  'parquet': 'application/vnd.apache.parquet',
+}
+
+_DATOS = ('Player', 'Birth_Date', 'Weight', 'Height')
+_RESULTADO = ('is_prospect', 'prospect_percentage', 'ranking', 'jugador_comparable', 'resumen', 'model_version')
+_FACTORES = ('factores_positivos', 'factores_a_mejorar')
+# Bloques en que se envía el XLSX ya escrito
+_XLSX_BLOCK = 64 * 1024
+
+
+class ExportError(Exception):
+  """El formato de exportación pedido no está disponible."""
+
+
+def export_format(params):
+  """Formato de exportación pedido, o None. Parquet sin pyarrow es un ExportError."""
+  fmt = params.get('response_format')
+  if fmt not in EXPORT_CONTENT_TYPES:
+    return None
+  if fmt == 'parquet' and pa is None:
+    raise ExportError("La exportación a Parquet requiere pyarrow.")
+  return fmt
+
+
+def filename(fmt):
+  return f'predicciones.{fmt}'
+
+
+def _factores(factores):
+  return ', '.join(f"{f['metrica']} ({f['percentil']})" for f in factores)
+
+
+def _numero(valor):
+  # Peso, estatura y stats pueden venir como texto o NaN desde el archivo
+  try:
+    valor = float(valor)
+  except (TypeError, ValueError):
+    return None
+  return None if math.isnan(valor) else valor
+
+
+def _header(features):
+  return [*_DATOS, *_RESULTADO, *features, *_FACTORES]
+
+
+def _row(report, features):
+  stats = report.get('calculated_stats', {})
+  return [
+    *(report.get(name) for name in _DATOS),
+    *(report.get(name) for name in _RESULTADO),
+    *(stats.get(feature) for feature in features),
+    *(_factores(report.get(name, [])) for name in _FACTORES),
+  ]
+
+
+def _features(reports):
+  return list(reports[0].get('calculated_stats', {})) if reports else []
+
+
+def _valor(valor):
+  # Escalares de NumPy y NaN tal como los entiende csv/openpyxl
+  if isinstance(valor, np.generic):
+    valor = valor.item()
+  if isinstance(valor, float) and math.isnan(valor):
+    return None
+  return valor
+
+
+def write_csv(chunks):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  features = None
+  # BOM: Excel abre el CSV como UTF-8 (nombres con acentos)
+  yield codecs.BOM_UTF8
+  for reports in chunks:
+    if features is None:
+      features = _features(reports)
+      writer.writerow(_header(features))
+    writer.writerows([_valor(v) for v in _row(report, features)] for report in reports)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+  # Sin jugadores: al menos la cabecera, para que siga siendo un CSV con columnas
+  if features is None:
+    writer.writerow(_header([]))
+    yield buffer.getvalue().encode('utf-8')
+
+
+def write_xlsx(chunks):
+  workbook = Workbook(write_only=True)
+  sheet = workbook.create_sheet('Predicciones')
+  features = None
+  for reports in chunks:
+    if features is None:
+      features = _features(reports)
+      sheet.append(_header(features))
+    for report in reports:
+      sheet.append([_valor(v) for v in _row(report, features)])
+  if features is None:
+    sheet.append(_header([]))
+
+  with tempfile.TemporaryFile() as output:
+    workbook.save(output)
+    output.seek(0)
+    while block := output.read(_XLSX_BLOCK):
+      yield block
+
+
+class _Sink:
+  """Destino de ParquetWriter que entrega lo escrito y lleva la cuenta de la posición."""
+
+  closed = False
+
+  def __init__(self):
+    self.blocks = []
+    self.position = 0
+
+  def write(self, data):
+    data = bytes(data)
+    self.blocks.append(data)
+    self.position += len(data)
+    return len(data)
+
+  def tell(self):
+    return self.position
+
+  def flush(self):
+    pass
+
+  def close(self):
+    self.closed = True
+
+  def drain(self):
+    data = b''.join(self.blocks)
+    self.blocks.clear()
+    return data
+
+
+def _schema(features):
+  campos = [('Player', pa.string()), ('Birth_Date', pa.string()), ('Weight', pa.float64()), ('Height', pa.float64()),
+            ('is_prospect', pa.bool_()), ('prospect_percentage', pa.float64()), ('ranking', pa.int64()),
+            ('jugador_comparable', pa.string()), ('resumen', pa.string()), ('model_version', pa.string())]
+  campos += [(feature, pa.float64()) for feature in features]
+  campos += [(name, pa.string()) for name in _FACTORES]
+  return pa.schema(campos)
+
+
+def _columns(reports, features):
+  columns = {name: [report.get(name) for report in reports] for name in ('Player', 'jugador_comparable', 'resumen', 'model_version')}
+  columns['Birth_Date'] = [None if report.get('Birth_Date') is None else str(report['Birth_Date']) for report in reports]
+  for name in ('Weight', 'Height', 'prospect_percentage'):
+    columns[name] = [_numero(report.get(name)) for report in reports]
+  columns['is_prospect'] = [bool(report['is_prospect']) for report in reports]
+  columns['ranking'] = [int(report['ranking']) for report in reports]
+  for feature in features:
+    columns[feature] = [_numero(report['calculated_stats'].get(feature)) for report in reports]
+  for name in _FACTORES:
+    columns[name] = [_factores(report.get(name, [])) for report in reports]
+  return columns
+
+
+def write_parquet(chunks):
+  sink = _Sink()
+  writer = None
+  for reports in chunks:
+    if writer is None:
+      features = _features(reports)
+      schema = _schema(features)
+      writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    # Un row group por bloque: lo escrito hasta aquí ya se puede enviar
+    writer.write_table(pa.Table.from_pydict(_columns(reports, features), schema=schema))
+    yield sink.drain()
+  if writer is None:
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), _schema([]))
+  writer.close()
+  yield sink.drain()
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx, 'parquet': write_parquet}
+
+
+def write(fmt, chunks):
+  """Bytes del archivo `fmt` a partir de `chunks` (listas de reportes), a medida que se escriben."""
+  return WRITERS[fmt](chunks)
@@ -1,222 +1,406 @@
+import difflib
+import io
+import os
+import re
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
 import pandas as pd
+from openpyxl import load_workbook
 
-def player_file(file_path: str, file_type: str = 'csv') -> list:
-  column_mapping = {
-    # Datos del jugador
-    'nombre': ['nombre', 'name', 'player name', 'player', 'jugador'],
-    'apellido': ['apellido', 'last name', 'lastname'],
-    'fecha_nacimiento': ['birth date', 'fecha de nacimiento', 'fecha nacimiento', 'birth_date', 'fecha nac', 'nacimiento'],
-    'peso': ['weight', 'peso', 'kg'],
-    'estatura': ['height', 'estatura', 'cm'],
-    
-    # Stats Base
-    'G': ['g', 'jj', 'j', 'games', 'juegos', 'juegos jugados'],
-    'AB': ['ab', 'vb', 'at bats', 'turnos al bate'],
-    'H': ['h', 'hp', 'hits', 'hits totales'],
-    '2B': ['2b', 'h2', 'doubles', 'dobles'],
-    '3B': ['3b', 'h3', 'triples'],
-    'HR': ['hr', 'home runs', 'jonrones'],
-    'BB': ['bb', 'walks', 'bases por bolas'],
-    'SO': ['so', 'k', 'strikeouts', 'ponches'],
-    'HBP': ['hbp', 'gp', 'hit by pitch', 'golpeado'],
-    'SF': ['sf', 'sacrifice flies', 'fly de sacrificio'],
-    'ER': ['er', 'cl', 'earned runs', 'carreras limpias'],
-    'IP': ['ip', 'il', 'innings pitched', 'entradas lanzadas'],
-    'PO': ['po', 'putouts'],
-    'A': ['a', 'as', 'assists', 'asistencias'],
-    'E': ['e', 'err', 'errors', 'errores'],
-
-    # Stats Derivadas (para buscarlas si ya existen)
-    'AVG': ['avg', 'ba', 'pdb', 'average', 'promedio', 'promedio de bateo'],
-    'OBP': ['obp', 'pde', 'on-base percentage'],
-    'SLG': ['slg', 'slugging'],
-    'OPS': ['ops'],
-    'K%': ['k%', 'k_percentage', 'so%', 'k_%'],
-    'BB/K': ['bb/k', 'bb_k', 'bb/so', 'bb_so'],
-    'FPCT': ['fpct', 'pdf', 'fielding_percentage', 'porcentaje de fildeo', '% de fildeo'],
-    'RF': ['rf', 'range_factor'],
-    'ERA': ['era', 'efec', 'efect', 'efectividad'],
-    'WHIP': ['whip'],
-    'K/9': ['k/9', 'k_9', 'so/9', 'so_9'],
-    'BB/9': ['bb/9', 'bb_9'],
-    'K/BB': ['k/bb', 'k_bb', 'so/bb', 'so_bb'],
-  }
-    
-  def find_column(df_columns, possible_names):
-    for name in possible_names:
-      normalized_name = name.lower().strip().replace(' ', '_')
-      if normalized_name in df_columns:
-        return normalized_name
-    return None
 
+# División segura: numerador / denominador donde el denominador es > 0, y 0 en otro caso (incluye NaN)
+def _dividir(numerador, denominador):
+  with np.errstate(divide='ignore', invalid='ignore'):
+    resultado = numerador / denominador
+  return resultado.where(denominador > 0, 0)
+
+
+# Convierte una fecha de nacimiento al formato AAAA-MM-DD; si no se puede, la deja como texto
+def _fecha(valor):
   try:
+    return pd.to_datetime(valor).strftime('%Y-%m-%d')
+  except (ValueError, TypeError):
+    return str(valor)
+
+
+column_mapping = {
+  # Datos del jugador
+  'nombre': ['nombre', 'name', 'player name', 'player', 'jugador'],
+  'apellido': ['apellido', 'last name', 'lastname'],
+  'fecha_nacimiento': ['birth date', 'fecha de nacimiento', 'fecha nacimiento', 'birth_date', 'fecha nac', 'nacimiento'],
+  'peso': ['weight', 'peso', 'kg'],
+  'estatura': ['height', 'estatura', 'cm'],
+  
+  # Stats Base
+  'G': ['g', 'jj', 'j', 'games', 'juegos', 'juegos jugados'],
+  'AB': ['ab', 'vb', 'at bats', 'turnos al bate'],
+  'H': ['h', 'hp', 'hits', 'hits totales'],
+  '2B': ['2b', 'h2', 'doubles', 'dobles'],
+  '3B': ['3b', 'h3', 'triples'],
+  'HR': ['hr', 'home runs', 'jonrones'],
+  'BB': ['bb', 'walks', 'bases por bolas'],
+  'SO': ['so', 'k', 'strikeouts', 'ponches'],
+  'HBP': ['hbp', 'gp', 'hit by pitch', 'golpeado'],
+  'SF': ['sf', 'sacrifice flies', 'fly de sacrificio'],
+  'ER': ['er', 'cl', 'earned runs', 'carreras limpias'],
+  'IP': ['ip', 'il', 'innings pitched', 'entradas lanzadas'],
+  'PO': ['po', 'putouts'],
+  'A': ['a', 'as', 'assists', 'asistencias'],
+  'E': ['e', 'err', 'errors', 'errores'],
+
+  # Stats Derivadas (para buscarlas si ya existen)
+  'AVG': ['avg', 'ba', 'pdb', 'average', 'promedio', 'promedio de bateo'],
+  'OBP': ['obp', 'pde', 'on-base percentage'],
+  'SLG': ['slg', 'slugging'],
+  'OPS': ['ops'],
+  'K%': ['k%', 'k_percentage', 'so%', 'k_%'],
+  'BB/K': ['bb/k', 'bb_k', 'bb/so', 'bb_so'],
+  'FPCT': ['fpct', 'pdf', 'fielding_percentage', 'porcentaje de fildeo', '% de fildeo'],
+  'RF': ['rf', 'range_factor'],
+  'ERA': ['era', 'efec', 'efect', 'efectividad'],
+  'WHIP': ['whip'],
+  'K/9': ['k/9', 'k_9', 'so/9', 'so_9'],
+  'BB/9': ['bb/9', 'bb_9'],
+  'K/BB': ['k/bb', 'k_bb', 'so/bb', 'so_bb'],
+}
+
+
+# Misma normalización que se aplica a las cabeceras del archivo
+def _normalizar(nombre):
+  return str(nombre).lower().strip().replace(' ', '_')
+
+
+# Índice alias normalizado -> (campo, prioridad), compilado una vez al importar. La prioridad es la
+# posición del alias en su lista; si dos campos comparten un alias, gana el que aparece antes en column_mapping
+def _compile_aliases(mapping):
+  index = {}
+  for key, aliases in mapping.items():
+    for prioridad, alias in enumerate(aliases):
+      index.setdefault(_normalizar(alias), (key, prioridad))
+  return index
+
+
+ALIAS_INDEX = _compile_aliases(column_mapping)
+
+# Coincidencia aproximada solo entre alias y cabeceras largas: 'a', 'e', 'g', 'k' o 'cm' no se aproximan
+FUZZY_MIN_LENGTH = 4
+FUZZY_CUTOFF = 0.85
+_FUZZY_ALIASES = [alias for alias in ALIAS_INDEX if len(alias) >= FUZZY_MIN_LENGTH]
+_SEPARADORES = re.compile(r'[_\-/.]+')
+
+
+def _palabras(nombre):
+  return [palabra for palabra in _SEPARADORES.split(nombre) if palabra]
+
+
+def _parecido(a, b):
+  return difflib.SequenceMatcher(None, a, b).ratio() >= FUZZY_CUTOFF
+
+
+# El parecido de la cabecera completa no basta: 'juegos_ganados' se parece a 'juegos_jugados' aunque
+# sea otra estadística. Con las mismas palabras, cada una debe parecerse a la suya (una errata, no otra
+# palabra); si solo cambian los separadores ('homeruns' / 'home_runs') se comparan sin ellos
+def _mismas_palabras(column, alias):
+  palabras, del_alias = _palabras(column), _palabras(alias)
+  if len(palabras) != len(del_alias):
+    return _parecido(''.join(palabras), ''.join(del_alias))
+  return all(a == b or _parecido(a, b) for a, b in zip(palabras, del_alias))
+
+
+@lru_cache(maxsize=256)
+def resolve_columns(columns):
+  """{campo: cabecera} para la tupla de cabeceras ya normalizadas; None en los campos que no están.
+
+  Primero por coincidencia exacta en ALIAS_INDEX (entre varias cabeceras del mismo campo gana
+  el alias de más prioridad) y, para los campos que faltan, por parecido con difflib. Se guarda
+  por firma de cabeceras: los archivos con la misma plantilla no se vuelven a resolver.
+  """
+  mejores = {}
+  for column in columns:
+    match = ALIAS_INDEX.get(column)
+    if match is not None:
+      key, prioridad = match
+      if key not in mejores or prioridad < mejores[key][0]:
+        mejores[key] = (prioridad, column)
+
+  mapped = {key: mejores[key][1] if key in mejores else None for key in column_mapping}
+  usadas = {column for _, column in mejores.values()}
+  for column in columns:
+    if column in usadas or len(column) < FUZZY_MIN_LENGTH:
+      continue
+    candidatos = difflib.get_close_matches(column, _FUZZY_ALIASES, n=3, cutoff=FUZZY_CUTOFF)
+    parecido = next((alias for alias in candidatos if _mismas_palabras(column, alias)), None)
+    if parecido:
+      key = ALIAS_INDEX[parecido][0]
+      if mapped[key] is None:
+        mapped[key] = column
+        usadas.add(column)
+
+  # Compartido entre lecturas: de solo lectura
+  return MappingProxyType(mapped)
+
+
+# Filas por bloque al leer archivos grandes
+CHUNK_SIZE = 1000
+
+
+class PlayerFileError(Exception):
+  """El archivo no se pudo leer (no existe, formato no soportado o contenido inválido)."""
+
+
+# Primeros bytes que se miran para reconocer el tipo de archivo
+SNIFF_BYTES = 2048
+# Firmas de formatos binarios que no son hojas de cálculo soportadas (PDF, .xls antiguo, gzip)
+_UNSUPPORTED_MAGIC = (b'%PDF', b'\xd0\xcf\x11\xe0', b'\x1f\x8b')
+
+
+def sniff_type(head: bytes):
+  """'xlsx' si el contenido es un ZIP (OOXML), 'csv' si parece texto y None en otro caso."""
+  if head.startswith(b'PK\x03\x04'):
+    return 'xlsx'
+  if head.startswith(_UNSUPPORTED_MAGIC) or b'\x00' in head:
+    return None
+  return 'csv'
+
+
+def _open(source):
+  # (archivo binario al inicio, si hay que cerrarlo) para una ruta, bytes o un objeto tipo archivo
+  if isinstance(source, (bytes, bytearray, memoryview)):
+    return io.BytesIO(source), True
+  if isinstance(source, (str, os.PathLike)):
+    return open(source, 'rb'), True
+  # Los File de Django (UploadedFile) envuelven el archivo real, que es el que pandas sabe leer
+  source = getattr(source, 'file', source)
+  if not source.seekable():
+    return io.BytesIO(source.read()), True
+  source.seek(0)
+  return source, False
+
+
+class PlayerFileReader:
+  """Lee un archivo de jugadores por bloques de `chunksize` filas sin cargarlo entero en memoria.
+
+  `source` es una ruta, bytes o un objeto tipo archivo (p. ej. el UploadedFile de la petición);
+  sin `file_type`, el tipo se reconoce por el contenido. Cada bloque es un DataFrame con las
+  estadísticas ya calculadas. Con `limit` se deja de leer en cuanto hay `limit` jugadores;
+  `truncated` indica si el archivo tenía más filas.
+  """
+
+  def __init__(self, source, file_type: str = None, chunksize: int = CHUNK_SIZE, limit: int = None):
+    self.source = source
+    self.file_type = file_type
+    self.chunksize = chunksize
+    self.limit = limit
+    self.rows_read = 0
+    self.truncated = False
+
+  def __iter__(self):
+    # Se pide una fila más que el límite solo para saber si el archivo continúa
+    nrows = self.limit + 1 if self.limit is not None else None
+    mapped_columns = None
+    handle, close, chunks = None, False, None
+    try:
+      handle, close = _open(self.source)
+      chunks = self._raw_chunks(handle, nrows)
+      for df in chunks:
+        if self.limit is not None and self.rows_read + len(df) > self.limit:
+          df = df.iloc[:self.limit - self.rows_read]
+          self.truncated = True
+        if len(df) == 0:
+          continue
+
+        df.columns = df.columns.astype(str)
+        df.columns = df.columns.str.lower().str.strip().str.replace(' ', '_')
+        # Las cabeceras son las mismas en todos los bloques: se resuelven una sola vez
+        if mapped_columns is None:
+          mapped_columns = resolve_columns(tuple(df.columns))
+
+        self.rows_read += len(df)
+        yield _derive_players(df, mapped_columns)
+    except PlayerFileError:
+      raise
+    except FileNotFoundError:
+      raise PlayerFileError("Archivo no encontrado en la ruta especificada.")
+    except Exception as e:
+      raise PlayerFileError(f"Error al leer el archivo: {e}")
+    finally:
+      # Si se deja de leer antes del final, el lector de pandas se cierra antes que el archivo. Si el
+      # archivo ya estaba cerrado (la petición terminó antes que el stream), pandas no puede vaciar su búfer
+      if chunks is not None:
+        try:
+          chunks.close()
+        except ValueError:
+          pass
+      if close:
+        handle.close()
+
+  def _raw_chunks(self, handle, nrows):
+    file_type = self.file_type
+    if file_type is None:
+      file_type = sniff_type(handle.read(SNIFF_BYTES))
+      handle.seek(0)
     if file_type == 'csv':
-      try:
-        df = pd.read_csv(file_path, on_bad_lines='skip')
-      except UnicodeDecodeError:
-        df = pd.read_csv(file_path, encoding='latin1', on_bad_lines='skip')
+      return self._csv_chunks(handle, nrows)
     elif file_type == 'xlsx':
-        df = pd.read_excel(file_path)
-    else:
-        raise ValueError("Tipo de archivo no soportado. Usa 'csv' o 'xlsx'.")
-  except FileNotFoundError:
-    return {"error": "Archivo no encontrado en la ruta especificada."}
-  except Exception as e:
-    return {"error": f"Error al leer el archivo: {e}"}
-
-  df.columns = df.columns.astype(str)
-  df.columns = df.columns.str.lower().str.strip().str.replace(' ', '_')
-  
-  df_columns_lower = list(df.columns)
-  
-  mapped_columns = {key: find_column(df_columns_lower, value) for key, value in column_mapping.items()}
+      return self._xlsx_chunks(handle, nrows)
+    raise ValueError("Tipo de archivo no soportado. Usa 'csv' o 'xlsx'.")
 
-  players_data = []
-  
-  for _, row in df.iterrows():
-    player = {}
-      
-    first_name = row.get(mapped_columns.get('nombre')) if mapped_columns.get('nombre') else ''
-    last_name = row.get(mapped_columns.get('apellido')) if mapped_columns.get('apellido') else ''
-    player['name'] = f"{first_name} {last_name}".strip().title()
-
-    birth_date_raw = row.get(mapped_columns.get('fecha_nacimiento'))
-    if pd.notna(birth_date_raw):
+  def _csv_chunks(self, handle, nrows):
+    entregadas = 0
+    for encoding in ('utf-8', 'latin1'):
+      handle.seek(0)
       try:
-        player['birth_date'] = pd.to_datetime(birth_date_raw).strftime('%Y-%m-%d')
-      except (ValueError, TypeError):
-        player['birth_date'] = str(birth_date_raw)
-    else:
-      player['birth_date'] = ''
-
-    player['weight'] = row.get(mapped_columns.get('peso'))
-    player['height'] = row.get(mapped_columns.get('estatura'))
-    
-    has_batting_stats = mapped_columns.get('AB') is not None
-    has_pitching_stats = mapped_columns.get('IP') is not None
-    
-    if has_batting_stats and not has_pitching_stats:
-      player['position'] = 'batter'
-      
-      G = row.get(mapped_columns.get('G'), 1)
-      AB = row.get(mapped_columns.get('AB'), 0)
-      H = row.get(mapped_columns.get('H'), 0)
-      doubles = row.get(mapped_columns.get('2B'), 0)
-      triples = row.get(mapped_columns.get('3B'), 0)
-      HR = row.get(mapped_columns.get('HR'), 0)
-      BB = row.get(mapped_columns.get('BB'), 0)
-      SO = row.get(mapped_columns.get('SO'), 0)
-      HBP = row.get(mapped_columns.get('HBP'), 0)
-      SF = row.get(mapped_columns.get('SF'), 0)
-      PO = row.get(mapped_columns.get('PO'), 0)
-      A = row.get(mapped_columns.get('A'), 0)
-      E = row.get(mapped_columns.get('E'), 0)
-
-      player.update({
-        'G': G, 'AB': AB, 'H': H, '2B': doubles, '3B': triples, 'HR': HR,
-        'BB': BB, 'SO': SO, 'HBP': HBP, 'SF': SF, 'PO': PO, 'A': A, 'E': E
-      })
-
-      # Lógica condicional para estadísticas derivadas de bateo
-      if mapped_columns.get('AVG') and pd.notna(row.get(mapped_columns.get('AVG'))):
-        player['AVG'] = row.get(mapped_columns.get('AVG'))
-      else:
-        player['AVG'] = H / AB if AB > 0 else 0
-
-      if mapped_columns.get('OBP') and pd.notna(row.get(mapped_columns.get('OBP'))):
-        player['OBP'] = row.get(mapped_columns.get('OBP'))
-      else:
-        player['OBP'] = (H + BB + HBP) / (AB + BB + HBP + SF) if (AB + BB + HBP + SF) > 0 else 0
-      
-      if mapped_columns.get('SLG') and pd.notna(row.get(mapped_columns.get('SLG'))):
-        player['SLG'] = row.get(mapped_columns.get('SLG'))
-      else:
-        singles = H - doubles - triples - HR
-        total_bases = singles + (doubles * 2) + (triples * 3) + (HR * 4)
-        player['SLG'] = total_bases / AB if AB > 0 else 0
-        
-      if mapped_columns.get('OPS') and pd.notna(row.get(mapped_columns.get('OPS'))):
-        player['OPS'] = row.get(mapped_columns.get('OPS'))
-      else:
-        player['OPS'] = player['OBP'] + player['SLG']
-        
-      if mapped_columns.get('K%') and pd.notna(row.get(mapped_columns.get('K%'))):
-        player['K%'] = row.get(mapped_columns.get('K%'))
-      else:
-        player['K%'] = (SO / AB) * 100 if AB > 0 else 0
-      
-      if mapped_columns.get('BB/K') and pd.notna(row.get(mapped_columns.get('BB/K'))):
-        player['BB/K'] = row.get(mapped_columns.get('BB/K'))
-      else:
-        player['BB/K'] = BB / SO if SO > 0 else 0
-      
-      if mapped_columns.get('FPCT') and pd.notna(row.get(mapped_columns.get('FPCT'))):
-        player['FPCT'] = row.get(mapped_columns.get('FPCT'))
-      else:
-        player['FPCT'] = (PO + A) / (PO + A + E) if (PO + A + E) > 0 else 0
-        
-      if mapped_columns.get('RF') and pd.notna(row.get(mapped_columns.get('RF'))):
-        player['RF'] = row.get(mapped_columns.get('RF'))
-      else:      
-        player['RF'] = (PO + A) / G if G > 0 else 0
-
-    elif has_pitching_stats and not has_batting_stats:
-      player['position'] = 'pitcher'
-      
-      ER = row.get(mapped_columns.get('ER'), 0)
-      IP = row.get(mapped_columns.get('IP'), 0)
-      H = row.get(mapped_columns.get('H'), 0)
-      BB = row.get(mapped_columns.get('BB'), 0)
-      SO = row.get(mapped_columns.get('SO'), 0)
-      PO = row.get(mapped_columns.get('PO'), 0)
-      A = row.get(mapped_columns.get('A'), 0)
-      E = row.get(mapped_columns.get('E'), 0)
-      G = row.get(mapped_columns.get('G'), 1)
-
-      player.update({
-        'ER': ER, 'IP': IP, 'H': H, 'BB': BB, 'SO': SO,
-        'PO': PO, 'A': A, 'E': E, 'G': G
-      })
-
-      # Lógica condicional para estadísticas derivadas de pitcheo
-      if mapped_columns.get('ERA') and pd.notna(row.get(mapped_columns.get('ERA'))):
-        player['ERA'] = row.get(mapped_columns.get('ERA'))
-      else:
-        player['ERA'] = (ER * 9) / IP if IP > 0 else 0
-
-      if mapped_columns.get('WHIP') and pd.notna(row.get(mapped_columns.get('WHIP'))):
-        player['WHIP'] = row.get(mapped_columns.get('WHIP'))
-      else:
-        player['WHIP'] = (BB + H) / IP if IP > 0 else 0
-
-      if mapped_columns.get('K/9') and pd.notna(row.get(mapped_columns.get('K/9'))):
-        player['K/9'] = row.get(mapped_columns.get('K/9'))
-      else:        
-        player['K/9'] = (SO * 9) / IP if IP > 0 else 0
-        
-      if mapped_columns.get('BB/9') and pd.notna(row.get(mapped_columns.get('BB/9'))):
-        player['BB/9'] = row.get(mapped_columns.get('BB/9'))
-      else:        
-        player['BB/9'] = (BB * 9) / IP if IP > 0 else 0
-        
-      if mapped_columns.get('K/BB') and pd.notna(row.get(mapped_columns.get('K/BB'))):
-        player['K/BB'] = row.get(mapped_columns.get('K/BB'))
-      else:
-        player['K/BB'] = SO / BB if BB > 0 else 0
-      
-      if mapped_columns.get('FPCT') and pd.notna(row.get(mapped_columns.get('FPCT'))):
-        player['FPCT'] = row.get(mapped_columns.get('FPCT'))
-      else:
-        player['FPCT'] = (PO + A) / (PO + A + E) if (PO + A + E) > 0 else 0
-        
-      if mapped_columns.get('RF') and pd.notna(row.get(mapped_columns.get('RF'))):
-        player['RF'] = row.get(mapped_columns.get('RF'))
-      else:      
-        player['RF'] = (PO + A) / G if G > 0 else 0
-      
-    else:
-      player['position'] = 'unknown'
-
-    players_data.append(player)
-      
-  return players_data
\ No newline at end of file
+        with pd.read_csv(handle, encoding=encoding, on_bad_lines='skip', chunksize=self.chunksize, nrows=nrows) as reader:
+          leidas = 0
+          for chunk in reader:
+            # Si se reintenta con latin1, se saltan las filas que ya se entregaron
+            saltar = max(0, entregadas - leidas)
+            leidas += len(chunk)
+            if saltar:
+              chunk = chunk.iloc[saltar:]
+            if len(chunk):
+              entregadas += len(chunk)
+              yield chunk
+        return
+      except UnicodeDecodeError:
+        if encoding == 'latin1':
+          raise
+
+  def _xlsx_chunks(self, handle, nrows):
+    # Modo solo lectura de openpyxl: las filas se recorren sin construir la hoja completa
+    workbook = load_workbook(handle, read_only=True, data_only=True)
+    try:
+      rows = workbook.active.iter_rows(values_only=True)
+      header = next(rows, None)
+      if header is None:
+        return
+      columns = [f"Unnamed: {i}" if name is None else name for i, name in enumerate(header)]
+      bloque, total = [], 0
+      for row in rows:
+        if all(value is None for value in row):
+          continue
+        bloque.append(row)
+        total += 1
+        if len(bloque) == self.chunksize or total == nrows:
+          yield _xlsx_frame(bloque, columns)
+          bloque = []
+        if total == nrows:
+          return
+      if bloque:
+        yield _xlsx_frame(bloque, columns)
+    finally:
+      workbook.close()
+
+
+def _xlsx_frame(rows, columns):
+  # Igual que pd.read_excel: las celdas vacías quedan como NaN en lugar de None
+  df = pd.DataFrame.from_records(rows, columns=columns)
+  return df.where(df.notna(), np.nan).infer_objects()
+
+
+def player_file(source, file_type: str = None, as_frame: bool = False):
+  try:
+    chunks = list(PlayerFileReader(source, file_type))
+  except PlayerFileError as e:
+    return {"error": str(e)}
+
+  players = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+  return players if as_frame else players.to_dict('records')
+
+
+# Calcula todas las estadísticas columna a columna sobre el DataFrame completo
+def _derive_players(df, mapped_columns):
+  def columna(key, default=None):
+    # Equivale a row.get(mapped_columns.get(key), default) para todas las filas a la vez
+    if mapped_columns.get(key):
+      return df[mapped_columns[key]]
+    return pd.Series([default] * len(df), index=df.index, dtype=object if default is None else None)
+
+  def derivada(key, calculada):
+    # Usa la columna del archivo si existe y no es nula; si no, el valor calculado
+    if mapped_columns.get(key):
+      provista = df[mapped_columns[key]]
+      return provista.where(provista.notna(), calculada)
+    return calculada
+
+  players = pd.DataFrame(index=df.index)
+
+  first_name = columna('nombre', '')
+  last_name = columna('apellido', '')
+  players['name'] = (first_name.astype(str) + ' ' + last_name.astype(str)).str.strip().str.title()
+
+  # Las fechas se convierten una vez por valor distinto, no por fila
+  codes, fechas_unicas = pd.factorize(columna('fecha_nacimiento'))
+  fechas = np.array([_fecha(valor) for valor in fechas_unicas] + [''], dtype=object)
+  players['birth_date'] = fechas[codes]
+
+  players['weight'] = columna('peso')
+  players['height'] = columna('estatura')
+
+  has_batting_stats = mapped_columns.get('AB') is not None
+  has_pitching_stats = mapped_columns.get('IP') is not None
+
+  if has_batting_stats and not has_pitching_stats:
+    players['position'] = 'batter'
+
+    G = columna('G', 1)
+    AB = columna('AB', 0)
+    H = columna('H', 0)
+    doubles = columna('2B', 0)
+    triples = columna('3B', 0)
+    HR = columna('HR', 0)
+    BB = columna('BB', 0)
+    SO = columna('SO', 0)
+    HBP = columna('HBP', 0)
+    SF = columna('SF', 0)
+    PO = columna('PO', 0)
+    A = columna('A', 0)
+    E = columna('E', 0)
+
+    players['G'], players['AB'], players['H'], players['2B'], players['3B'], players['HR'] = G, AB, H, doubles, triples, HR
+    players['BB'], players['SO'], players['HBP'], players['SF'] = BB, SO, HBP, SF
+    players['PO'], players['A'], players['E'] = PO, A, E
+
+    # Lógica condicional para estadísticas derivadas de bateo
+    players['AVG'] = derivada('AVG', _dividir(H, AB))
+    players['OBP'] = derivada('OBP', _dividir(H + BB + HBP, AB + BB + HBP + SF))
+    singles = H - doubles - triples - HR
+    total_bases = singles + (doubles * 2) + (triples * 3) + (HR * 4)
+    players['SLG'] = derivada('SLG', _dividir(total_bases, AB))
+    players['OPS'] = derivada('OPS', players['OBP'] + players['SLG'])
+    players['K%'] = derivada('K%', _dividir(SO, AB) * 100)
+    players['BB/K'] = derivada('BB/K', _dividir(BB, SO))
+    players['FPCT'] = derivada('FPCT', _dividir(PO + A, PO + A + E))
+    players['RF'] = derivada('RF', _dividir(PO + A, G))
+
+  elif has_pitching_stats and not has_batting_stats:
+    players['position'] = 'pitcher'
+
+    ER = columna('ER', 0)
+    IP = columna('IP', 0)
+    H = columna('H', 0)
+    BB = columna('BB', 0)
+    SO = columna('SO', 0)
+    PO = columna('PO', 0)
+    A = columna('A', 0)
+    E = columna('E', 0)
+    G = columna('G', 1)
+
+    players['ER'], players['IP'], players['H'], players['BB'], players['SO'] = ER, IP, H, BB, SO
+    players['PO'], players['A'], players['E'], players['G'] = PO, A, E, G
+
+    # Lógica condicional para estadísticas derivadas de pitcheo
+    players['ERA'] = derivada('ERA', _dividir(ER * 9, IP))
+    players['WHIP'] = derivada('WHIP', _dividir(BB + H, IP))
+    players['K/9'] = derivada('K/9', _dividir(SO * 9, IP))
+    players['BB/9'] = derivada('BB/9', _dividir(BB * 9, IP))
+    players['K/BB'] = derivada('K/BB', _dividir(SO, BB))
+    players['FPCT'] = derivada('FPCT', _dividir(PO + A, PO + A + E))
+    players['RF'] = derivada('RF', _dividir(PO + A, G))
+
+  else:
+    players['position'] = 'unknown'
+
+  return players.reset_index(drop=True)
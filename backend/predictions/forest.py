@@ -0,0 +1,123 @@
+import numpy as np
+
+# Diferencia máxima admitida entre las probabilidades del bosque compilado y las de sklearn
+VERIFY_TOLERANCE = 1e-9
+
+
+def _fold(threshold, offset, scale):
+  """Umbral en bruto u tal que  x <= u  <=>  float32((x - media) / escala) <= t.
+
+  sklearn compara las features escaladas en float32, así que t * escala + media no basta: el
+  redondeo a float32 mueve la frontera hasta medio ulp de float32. Se parte del punto medio entre
+  el mayor float32 <= t y el siguiente, y se ajusta ulp a ulp de float64 hasta dar con la frontera exacta.
+  """
+  def pasa(x):
+    return ((x - offset) / scale).astype(np.float32) <= threshold
+
+  with np.errstate(invalid='ignore', over='ignore'):
+    t32 = threshold.astype(np.float32)
+    t32 = np.where(t32 > threshold, np.nextafter(t32, np.float32(-np.inf)), t32)
+    siguiente = np.nextafter(t32, np.float32(np.inf))
+    frontera = (t32.astype(np.float64) + siguiente.astype(np.float64)) / 2
+    umbral = frontera * scale + offset
+    for _ in range(64):
+      arriba = np.nextafter(umbral, np.inf)
+      subir = pasa(arriba)
+      bajar = ~pasa(umbral)
+      if not (subir.any() or bajar.any()):
+        return umbral
+      umbral = np.where(subir, arriba, np.where(bajar, np.nextafter(umbral, -np.inf), umbral))
+  raise ValueError("No se pudo plegar el escalado en los umbrales del bosque.")
+
+
+class CompiledForest:
+  """RandomForestClassifier de sklearn compilado a arrays planos de NumPy.
+
+  Los nodos de todos los árboles van en los mismos arrays contiguos (feature, umbral, hijos y
+  probabilidad de la hoja) y las filas recorren todos los árboles a la vez, un nivel por
+  iteración. Con `offset` y `scale` (media y escala de un StandardScaler) el escalado se pliega
+  en los umbrales (ver _fold), así que se puntúan las filas en bruto sin escalarlas.
+  Las hojas apuntan a sí mismas, de modo que las filas que llegan antes se quedan en su hoja.
+  """
+
+  def __init__(self, model, offset=None, scale=None):
+    estimators = getattr(model, 'estimators_', None)
+    if not estimators or not all(hasattr(tree, 'tree_') for tree in estimators):
+      raise TypeError(f"{type(model).__name__} no es un bosque de árboles de decisión de sklearn.")
+    if len(model.classes_) != 2:
+      raise TypeError("Solo se compilan clasificadores binarios.")
+
+    features, thresholds, left, right, missing_left, values, roots = [], [], [], [], [], [], []
+    base = 0
+    for estimator in estimators:
+      tree = estimator.tree_
+      nodes = np.arange(tree.node_count)
+      leaf = tree.children_left == -1
+      feature = np.where(leaf, 0, tree.feature)
+      threshold = np.where(leaf, np.inf, tree.threshold)
+      if offset is not None:
+        split = ~leaf
+        threshold[split] = _fold(threshold[split], offset[feature[split]], scale[feature[split]])
+
+      roots.append(base)
+      features.append(feature)
+      thresholds.append(threshold)
+      left.append(np.where(leaf, nodes, tree.children_left) + base)
+      right.append(np.where(leaf, nodes, tree.children_right) + base)
+      # Sin valores ausentes en el entrenamiento sklearn manda los NaN a la derecha (NaN <= t es falso)
+      missing_left.append(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8)).astype(bool))
+      # Proporción de la clase positiva en cada nodo, normalizada como en DecisionTreeClassifier.predict_proba
+      value = tree.value[:, 0, :]
+      total = value.sum(axis=1)
+      values.append(value[:, 1] / np.where(total == 0, 1, total))
+      base += tree.node_count
+
+    self.n_trees = len(estimators)
+    self.n_features = model.n_features_in_
+    self.depth = max(estimator.tree_.max_depth for estimator in estimators)
+    self.feature = np.concatenate(features).astype(np.intp)
+    self.threshold = np.concatenate(thresholds).astype(np.float64)
+    # Hijos intercalados: children[2 * nodo] es el izquierdo y children[2 * nodo + 1] el derecho
+    self.children = np.column_stack([np.concatenate(left), np.concatenate(right)]).astype(np.intp).ravel()
+    self.missing_left = np.concatenate(missing_left)
+    self.value = np.concatenate(values).astype(np.float64)
+    self.roots = np.array(roots, dtype=np.intp)
+    # Sin escalado plegado las filas llegan ya escaladas y, como en sklearn, se comparan en float32
+    self.float32 = offset is None
+    for array in (self.feature, self.threshold, self.children, self.missing_left, self.value, self.roots):
+      array.flags.writeable = False
+
+  def apply(self, matrix):
+    """Nodo hoja de cada fila en cada árbol: array (árboles x filas) de índices globales."""
+    matrix = np.asarray(matrix, dtype=np.float32 if self.float32 else np.float64)
+    plana = np.ascontiguousarray(matrix).ravel()
+    # Posición de cada fila en la matriz aplanada, para leer su feature con un solo take
+    inicio_fila = np.arange(len(matrix)) * matrix.shape[1]
+    nodes = np.repeat(self.roots[:, None], len(matrix), axis=1)
+    con_nan = np.isnan(plana).any()
+    for _ in range(self.depth):
+      valores = plana.take(inicio_fila + self.feature.take(nodes))
+      # NaN > t es falso: sin más, los NaN irían a la izquierda
+      derecha = valores > self.threshold.take(nodes)
+      if con_nan:
+        derecha = np.where(np.isnan(valores), ~self.missing_left.take(nodes), derecha)
+      nodes = self.children.take(2 * nodes + derecha)
+    return nodes
+
+  def predict_proba(self, matrix):
+    """Probabilidad de la clase positiva de cada fila (la columna 1 de predict_proba de sklearn)."""
+    if len(matrix) == 0:
+      return np.empty(0, dtype=np.float64)
+    # Suma árbol a árbol en el mismo orden que el bosque de sklearn, luego la media
+    return self.value[self.apply(matrix)].sum(axis=0) / self.n_trees
+
+  def verify(self, model, matrix, scaled=None, tolerance=VERIFY_TOLERANCE):
+    """Diferencia máxima con sklearn sobre `matrix` (en bruto; `scaled` es lo que recibe el modelo).
+
+    Lanza ValueError si supera `tolerance`.
+    """
+    esperadas = model.predict_proba(matrix if scaled is None else scaled)[:, 1]
+    diferencia = float(np.max(np.abs(self.predict_proba(matrix) - esperadas), initial=0.0))
+    if diferencia > tolerance:
+      raise ValueError(f"El bosque compilado difiere de sklearn en {diferencia:.3g} (tolerancia {tolerance:g}).")
+    return diferencia
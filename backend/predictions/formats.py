@@ -0,0 +1,95 @@
+import datetime
+import json
+import math
+
+import numpy as np
+
+try:
+  import orjson
+except ImportError:  # orjson es opcional: sin él se serializa con json (más lento)
+  orjson = None
+
+# Serialización de los reportes: escalares y arrays de NumPy se escriben directamente,
+# NaN sale como null y las fechas como 'AAAA-MM-DD' (como hacía la limpieza manual de batch)
+if orjson is not None:
+  _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+  # pd.Timestamp es subclase de datetime
+  if isinstance(value, (datetime.date, datetime.datetime)):
+    return value.strftime('%Y-%m-%d')
+  if isinstance(value, np.generic):
+    return _sin_nan(value.item())
+  if isinstance(value, np.ndarray):
+    return _sin_nan(value.tolist())
+  raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _sin_nan(value):
+  # Solo para el respaldo con json, que escribiría NaN (JSON no válido)
+  if isinstance(value, float):
+    return None if math.isnan(value) or math.isinf(value) else value
+  if isinstance(value, dict):
+    return {key: _sin_nan(item) for key, item in value.items()}
+  if isinstance(value, (list, tuple)):
+    return [_sin_nan(item) for item in value]
+  return value
+
+
+def dumps(data):
+  """JSON (bytes, UTF-8) de una respuesta de predicción."""
+  if orjson is not None:
+    return orjson.dumps(data, default=_default, option=_OPTIONS)
+  return json.dumps(_sin_nan(data), default=_default, ensure_ascii=False, allow_nan=False).encode('utf-8')
+
+
+#  FORMATO COLUMNAR
+# response_format=columnar: un array por campo en lugar de un objeto por jugador, y los nombres
+# de las features una sola vez. Los factores son pares [índice de la feature, percentil]; su valor
+# está en calculated_stats.
+COLUMNAR = 'columnar'
+_COLUMNAS = ('Player', 'Birth_Date', 'Weight', 'Height', 'is_prospect', 'prospect_percentage', 'ranking', 'jugador_comparable', 'resumen', 'model_version')
+
+
+def columnar(reports):
+  """Convierte una lista de reportes al formato columnar."""
+  # Los reportes con error ({"error": ...}) no tienen stats ni factores: sus filas van vacías
+  validos = [report for report in reports if 'error' not in report]
+  muestra = validos[0] if validos else (reports[0] if reports else {})
+  features = list(muestra.get('calculated_stats', {}))
+  indice = {feature: j for j, feature in enumerate(features)}
+
+  columns = {name: [report.get(name) for report in reports] for name in _COLUMNAS if not reports or name in muestra}
+  if len(validos) < len(reports):
+    columns['error'] = [report.get('error') for report in reports]
+  columns['calculated_stats'] = [[report.get('calculated_stats', {}).get(feature) for feature in features] for report in reports]
+  for name in ('factores_positivos', 'factores_a_mejorar'):
+    columns[name] = [[[indice[f['metrica']], f['percentil']] for f in report.get(name, [])] for report in reports]
+  return {"format": COLUMNAR, "count": len(reports), "features": features, "columns": columns}
+
+
+def wants_columnar(params):
+  return params.get('response_format') == COLUMNAR
+
+
+#  STREAMING
+# response_format=ndjson|sse en la carga de archivos: los reportes de cada bloque se envían en cuanto
+# se puntúan (un reporte por línea o por evento) y al final llega {"summary": {...}} / event: summary
+NDJSON, SSE = 'ndjson', 'sse'
+STREAM_CONTENT_TYPES = {NDJSON: 'application/x-ndjson', SSE: 'text/event-stream'}
+
+
+def stream_format(params):
+  fmt = params.get('response_format')
+  return fmt if fmt in STREAM_CONTENT_TYPES else None
+
+
+def encode_event(fmt, event, data):
+  """Bytes de un evento del stream: 'result' (lista de reportes), 'summary' o 'error'."""
+  if event != 'result':
+    data = [{"summary": data} if event == 'summary' and fmt == NDJSON else data]
+  if fmt == NDJSON:
+    return b''.join(dumps(record) + b'\n' for record in data)
+  prefijo = b'event: ' + event.encode() + b'\ndata: '
+  return b''.join(prefijo + dumps(record) + b'\n\n' for record in data)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+class PercentileIndex:
+  """Columnas del dataset de referencia pre-ordenadas para calcular percentiles con búsqueda binaria."""
+
+  def __init__(self, columnas, total, features, metricas_invertidas):
+    # `columnas`: un array ordenado y sin NaN por feature (pueden ser vistas de un snapshot en memoria)
+    self.features = list(features)
+    self.invertidas = [m in metricas_invertidas for m in self.features]
+    # El denominador incluye las filas con NaN, igual que (dataset[m] < valor).mean()
+    self.total = total
+    self.columnas = list(columnas)
+
+  @classmethod
+  def from_matrix(cls, matriz, features, metricas_invertidas):
+    """Construye el índice ordenando cada columna de una matriz (filas x features)."""
+    columnas = [np.sort(c[~np.isnan(c)]) for c in np.asarray(matriz, dtype=np.float64).T]
+    return cls(columnas, len(matriz), features, metricas_invertidas)
+
+  def _fraccion(self, j, valores):
+    columna = self.columnas[j]
+    if self.invertidas[j]:
+      # Proporción de valores estrictamente mayores
+      cuenta = len(columna) - np.searchsorted(columna, valores, side='right')
+    else:
+      # Proporción de valores estrictamente menores
+      cuenta = np.searchsorted(columna, valores, side='left')
+    # Un valor NaN no es mayor ni menor que nada
+    cuenta = np.where(np.isnan(valores), 0, cuenta)
+    return cuenta / self.total
+
+  def percentile(self, metrica, valor):
+    """Percentil entero (0-100) de un único valor para una métrica."""
+    j = self.features.index(metrica)
+    return int(self._fraccion(j, np.float64(valor)) * 100)
+
+  def percentiles(self, valores):
+    """Matriz de percentiles enteros para una matriz (jugadores x features) en el orden de `features`."""
+    valores = np.asarray(valores, dtype=np.float64).reshape(-1, len(self.features))
+    resultado = np.empty(valores.shape, dtype=np.int64)
+    for j in range(len(self.features)):
+      resultado[:, j] = (self._fraccion(j, valores[:, j]) * 100).astype(np.int64)
+    return resultado
+
+
+class ComparableIndex:
+  """KD-tree sobre la matriz de features del dataset de referencia para buscar jugadores comparables."""
+
+  def __init__(self, matriz, etiquetas, features, scaler=None):
+    # `matriz`: features del dataset (filas x features); `etiquetas`: 'Nombre Apellido (Año)' por fila
+    self.etiquetas = etiquetas
+    self.features = list(features)
+    # Con un scaler, las distancias se miden en el espacio escalado del modelo
+    self.scaler = scaler
+    if scaler is not None:
+      matriz = pd.DataFrame(np.asarray(matriz), columns=self.features)
+    matriz = self._espacio(matriz)
+    # Las filas con NaN no tienen una distancia definida y se excluyen del árbol
+    validas = ~np.isnan(matriz).any(axis=1)
+    self.posiciones = np.flatnonzero(validas)
+    # Sin NaN el árbol usa la matriz tal cual (sin copiarla si ya es float64 contigua)
+    self.tree = cKDTree(matriz if validas.all() else matriz[validas])
+
+  def _espacio(self, valores):
+    if self.scaler is not None:
+      valores = self.scaler.transform(valores)
+    return np.asarray(valores, dtype=np.float64)
+
+  def query(self, valores, k=1):
+    """Distancias y posiciones (filas de `dataset`) de los k vecinos más cercanos de cada jugador."""
+    if self.scaler is not None:
+      valores = pd.DataFrame(np.asarray(valores, dtype=np.float64).reshape(-1, len(self.features)), columns=self.features)
+    puntos = self._espacio(valores).reshape(-1, len(self.features))
+    # Una métrica sin valor se trata como 0, igual que una métrica ausente
+    puntos = np.nan_to_num(puntos, nan=0.0)
+    k = min(k, len(self.posiciones))
+    distancias, vecinos = self.tree.query(puntos, k=k)
+    distancias = distancias.reshape(len(puntos), k)
+    vecinos = vecinos.reshape(len(puntos), k)
+    return distancias, self.posiciones[vecinos]
+
+  def label(self, posicion):
+    """Texto 'Nombre Apellido (Año)' del jugador en una posición del dataset."""
+    return str(self.etiquetas[posicion])
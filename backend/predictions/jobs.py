@@ -0,0 +1,271 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+
+from .file_reader import PlayerFileReader, PlayerFileError
+from .predictor import batch
+from .formats import dumps
+from .quota import Reservation, quota
+
+#  CONFIGURACIÓN (variables de entorno)
+# SCOUTML_JOBS_DIR: carpeta con la base SQLite de trabajos y los archivos pendientes
+# SCOUTML_JOB_EXECUTOR: 'process' (por defecto), 'thread' o 'inline' (síncrono, para pruebas)
+# SCOUTML_JOB_WORKERS: número de workers del pool de trabajos
+# SCOUTML_JOB_TTL: segundos que se conservan los trabajos terminados
+# SCOUTML_JOB_TIMEOUT: segundos sin progreso tras los que un trabajo sin terminar se da por perdido
+DEFAULT_JOBS_DIR = Path(tempfile.gettempdir()) / 'scoutml_jobs'
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_TTL = 24 * 3600
+DEFAULT_JOB_TIMEOUT = 3600
+
+PENDING, RUNNING, COMPLETED, FAILED = 'pending', 'running', 'completed', 'failed'
+
+
+def jobs_dir():
+  path = Path(os.getenv('SCOUTML_JOBS_DIR') or DEFAULT_JOBS_DIR)
+  (path / 'uploads').mkdir(parents=True, exist_ok=True)
+  return path
+
+
+class JobStore:
+  """Estado, progreso y resultados de los trabajos en una base SQLite compartida por todos los procesos.
+
+  Cada trabajo guarda también su reserva de cuota (`reserved`) y si ya se liquidó (`settled`), para que
+  cualquier proceso pueda liquidarla aunque el que lo encoló ya no exista.
+  """
+
+  def __init__(self, path=None):
+    self.path = Path(path) if path else jobs_dir() / 'jobs.sqlite3'
+    with self._connect() as conn:
+      conn.execute('PRAGMA journal_mode=WAL')
+      conn.execute(
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        ' id TEXT PRIMARY KEY, user_id TEXT NOT NULL, player_type TEXT, status TEXT NOT NULL,'
+        ' processed INTEGER NOT NULL DEFAULT 0, limit_players INTEGER, warning TEXT, error TEXT,'
+        ' results TEXT, reserved INTEGER NOT NULL DEFAULT 0, settled INTEGER NOT NULL DEFAULT 0,'
+        ' created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+      )
+      # Bases creadas antes de guardar la reserva en el trabajo
+      columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+      for column in ('reserved', 'settled'):
+        if column not in columns:
+          conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+
+  def _connect(self):
+    # Una conexión por operación: es seguro entre hilos y procesos
+    return sqlite3.connect(self.path, timeout=30)
+
+  def create(self, user_id, player_type, limit_players, reserved=0):
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with self._connect() as conn:
+      conn.execute(
+        'INSERT INTO jobs (id, user_id, player_type, status, limit_players, reserved, created_at, updated_at)'
+        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (job_id, str(user_id), player_type, PENDING, limit_players, reserved, now, now),
+      )
+    return job_id
+
+  def update(self, job_id, **fields):
+    if 'results' in fields:
+      fields['results'] = dumps(fields['results']).decode('utf-8')
+    fields['updated_at'] = time.time()
+    columns = ', '.join(f'{name} = ?' for name in fields)
+    with self._connect() as conn:
+      conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+  def get(self, job_id, with_results=False):
+    columns = 'id, user_id, player_type, status, processed, limit_players, warning, error, reserved, settled, created_at, updated_at'
+    if with_results:
+      columns += ', results'
+    with self._connect() as conn:
+      conn.row_factory = sqlite3.Row
+      row = conn.execute(f'SELECT {columns} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+      return None
+    job = dict(row)
+    if with_results:
+      job['results'] = json.loads(job['results']) if job['results'] else None
+    return job
+
+  def purge(self, max_age):
+    """Borra los trabajos terminados hace más de `max_age` segundos, salvo los que tienen la reserva sin liquidar."""
+    with self._connect() as conn:
+      conn.execute(
+        'DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ? AND (settled = 1 OR reserved = 0)',
+        (COMPLETED, FAILED, time.time() - max_age),
+      )
+
+  def claim(self, job_id):
+    """Marca la reserva del trabajo como liquidada. Devuelve el trabajo si esta llamada la marcó, o None."""
+    with self._connect() as conn:
+      # Condicional: si varios procesos lo intentan a la vez, solo uno liquida la reserva
+      claimed = conn.execute('UPDATE jobs SET settled = 1 WHERE id = ? AND settled = 0 AND reserved > 0', (job_id,)).rowcount
+    return self.get(job_id) if claimed else None
+
+  def unsettled(self, timeout):
+    """Trabajos con la reserva sin liquidar: terminados, o sin progreso desde hace más de `timeout` segundos."""
+    with self._connect() as conn:
+      conn.row_factory = sqlite3.Row
+      rows = conn.execute(
+        'SELECT id, status, processed FROM jobs WHERE reserved > 0 AND settled = 0 AND (status IN (?, ?) OR updated_at < ?)',
+        (COMPLETED, FAILED, time.time() - timeout),
+      ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def settle_job(store, job_id, used):
+  """Confirma `used` predicciones de la reserva del trabajo y devuelve el resto, una sola vez."""
+  job = store.claim(job_id)
+  if job is None:
+    return False
+  # Para devolver créditos solo hacen falta el usuario y lo reservado
+  reservation = Reservation(user_id=job['user_id'], plan=None, limit=None, granted=job['reserved'])
+  try:
+    quota.commit(reservation, used)
+  except Exception as e:
+    # Se deja sin liquidar para que reap_jobs lo vuelva a intentar
+    store.update(job_id, settled=0)
+    print(f"No se pudo liquidar la reserva del trabajo {job_id}: {e}")
+    return False
+  return True
+
+
+def reap_jobs(store, timeout):
+  """Liquida las reservas que quedaron pendientes.
+
+  Son las de trabajos cuyo proceso murió sin llegar al final (se marcan como fallidos y no se cobran)
+  y las de trabajos terminados cuya liquidación falló.
+  """
+  for job in store.unsettled(timeout):
+    if job['status'] in (PENDING, RUNNING):
+      store.update(job['id'], status=FAILED, error="El trabajo se interrumpió antes de terminar.")
+    used = job['processed'] if job['status'] == COMPLETED else 0
+    settle_job(store, job['id'], used)
+
+
+def run_job(job_id, file_path, player_type, limit_players, store_path=None):
+  """Lee y puntúa el archivo de un trabajo por bloques y liquida su reserva. Se ejecuta en el pool de trabajos."""
+  store = JobStore(store_path)
+  store.update(job_id, status=RUNNING)
+  processed = 0
+  try:
+    job = store.get(job_id)
+    reservation = Reservation(user_id=job['user_id'], plan=None, limit=limit_players, granted=job['reserved'])
+    reader = PlayerFileReader(file_path, limit=limit_players)
+    results, truncated = [], False
+    for players_chunk in reader:
+      # La reserva crece con cada bloque leído (y se guarda en el trabajo); se deja de leer al agotar la cuota
+      covered = quota.cover(reservation, len(results) + len(players_chunk)) - len(results)
+      store.update(job_id, reserved=reservation.granted)
+      if covered < len(players_chunk):
+        players_chunk, truncated = players_chunk.iloc[:covered], True
+      if len(players_chunk):
+        results.extend(batch(players_chunk, player_type))
+        store.update(job_id, processed=len(results))
+      if truncated:
+        break
+
+    warning = None
+    if truncated or reader.truncated:
+      warning = f"Límite alcanzado. Se procesaron {len(results)} jugadores del archivo. Los restantes fueron omitidos."
+    store.update(job_id, status=COMPLETED, processed=len(results), warning=warning, results=results)
+    processed = len(results)
+  except PlayerFileError as e:
+    store.update(job_id, status=FAILED, error=str(e))
+  except Exception as e:
+    store.update(job_id, status=FAILED, error=f"Error al procesar el archivo: {str(e)}")
+  finally:
+    if os.path.exists(file_path):
+      os.remove(file_path)
+  # En el propio trabajo: no depende de que siga vivo el proceso web que lo encoló
+  settle_job(store, job_id, processed)
+  return processed
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+  global _executor
+  with _executor_lock:
+    if _executor is None:
+      workers = int(os.getenv('SCOUTML_JOB_WORKERS', DEFAULT_JOB_WORKERS))
+      if os.getenv('SCOUTML_JOB_EXECUTOR', 'process') == 'thread':
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scoutml-job')
+      else:
+        # 'spawn': los procesos hijos no heredan hilos ni locks del worker web
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+    return _executor
+
+
+def _reset_executor():
+  global _executor
+  with _executor_lock:
+    _executor = None
+
+
+def submit_job(upload, reservation, player_type):
+  """Guarda el archivo subido, crea el trabajo con la reserva de cuota `reservation` y lo encola.
+
+  Devuelve el id del trabajo. La reserva la liquida run_job al terminar; si su proceso muere antes,
+  el callback de este proceso, y si también este muere, reap_jobs en un envío posterior. Si el
+  trabajo no se llega a encolar, la reserva sigue siendo de quien llama.
+  """
+  store = JobStore()
+  store.purge(float(os.getenv('SCOUTML_JOB_TTL', DEFAULT_JOB_TTL)))
+  reap_jobs(store, float(os.getenv('SCOUTML_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)))
+  # Nunca se leen más filas que el límite del plan; lo que se reserva lo amplía run_job bloque a bloque
+  job_id = store.create(reservation.user_id, player_type, reservation.limit, reserved=reservation.granted)
+
+  # El trabajo sobrevive a la petición: necesita su propia copia del archivo (el tipo se reconoce por el contenido)
+  file_path = jobs_dir() / 'uploads' / job_id
+  args = (job_id, str(file_path), player_type, reservation.limit, str(store.path))
+  try:
+    with open(file_path, 'wb') as destination:
+      for block in upload.chunks():
+        destination.write(block)
+    if os.getenv('SCOUTML_JOB_EXECUTOR') == 'inline':
+      future = Future()
+      future.set_result(run_job(*args))
+    else:
+      future = _get_executor().submit(run_job, *args)
+  except Exception as e:
+    # Sin encolar: la reserva se marca como liquidada aquí porque la devuelve quien llama
+    store.claim(job_id)
+    store.update(job_id, status=FAILED, error=f"Error al crear el trabajo: {str(e)}")
+    if os.path.exists(file_path):
+      os.remove(file_path)
+    raise
+
+  def _done(future):
+    try:
+      future.result()
+    except Exception as e:
+      # El proceso del trabajo murió sin poder registrar el error ni liquidar la reserva; un pool roto se recrea en el siguiente envío
+      if isinstance(e, BrokenProcessPool):
+        _reset_executor()
+      store.update(job_id, status=FAILED, error=f"Error al procesar el archivo: {str(e)}")
+      settle_job(store, job_id, 0)
+    # Otro proceso pudo cambiar el contador: el perfil en caché de este ya no vale
+    quota.invalidate(reservation.user_id)
+
+  future.add_done_callback(_done)
+  return job_id
+
+
+def get_job(job_id, user_id, with_results=False):
+  """Trabajo `job_id` si pertenece a `user_id`; None en otro caso."""
+  job = JobStore().get(job_id, with_results=with_results)
+  if job is None or job['user_id'] != str(user_id):
+    return None
+  return job
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from backend.predictions import benchmark
+
+
+class Command(BaseCommand):
+  help = "Mide latencia, rendimiento y memoria del pipeline de predicción con datos sintéticos (salida JSON)."
+
+  def add_arguments(self, parser):
+    benchmark.add_arguments(parser)
+
+  def handle(self, *args, **options):
+    benchmark.main(options, stdout=self.stdout)
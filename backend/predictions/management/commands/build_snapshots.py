@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from backend.predictions.predictor import registry
+from backend.predictions.registry import load_pipeline, resolve
+from backend.predictions.snapshot import snapshot_for
+
+
+class Command(BaseCommand):
+  help = "Convierte los datasets de referencia al snapshot binario que los workers mapean en memoria."
+
+  def handle(self, *args, **options):
+    # Las versiones del manifiesto (SCOUTML_MODEL_MANIFEST), o las URLs por defecto si no hay
+    for player_type, spec in registry.specs.items():
+      features = load_pipeline(spec['model'])['features']
+      snapshot = snapshot_for(resolve(spec['dataset']), features)
+      version = spec.get('version') or '-'
+      self.stdout.write(self.style.SUCCESS(f"{player_type} ({version}): {snapshot.rows} filas en {snapshot.path}"))
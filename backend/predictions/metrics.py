@@ -0,0 +1,211 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse, HttpResponseNotFound
+
+#  CONFIGURACIÓN (variables de entorno)
+# SCOUTML_METRICS=1: agrega los tiempos por etapa en histogramas y publica /api/predictions/metrics/
+# SCOUTML_SERVER_TIMING=1: añade a cada respuesta la cabecera Server-Timing con el desglose de la petición
+# Sin ninguna de las dos, stage() devuelve un contexto vacío y no se mide nada.
+ENABLED = os.getenv('SCOUTML_METRICS', '0') == '1'
+SERVER_TIMING = os.getenv('SCOUTML_SERVER_TIMING', '0') == '1'
+
+# Límites superiores (segundos) de los buckets, como los de prometheus_client
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Tiempos de la petición en curso: {etapa: segundos}; None si no se pidió el desglose
+_request_timings = contextvars.ContextVar('scoutml_request_timings', default=None)
+_NOOP = nullcontext()
+
+
+class Histogram:
+  """Histograma acumulado de duraciones con buckets fijos."""
+
+  def __init__(self):
+    self.counts = [0] * (len(BUCKETS) + 1)
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, seconds):
+    self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+    self.sum += seconds
+    self.count += 1
+
+
+class Registry:
+  """Histogramas por etapa y contadores del proceso (cada worker tiene los suyos)."""
+
+  def __init__(self):
+    self.stages = {}
+    self.counters = {}
+    self._lock = threading.Lock()
+
+  def observe(self, name, seconds):
+    with self._lock:
+      histogram = self.stages.get(name)
+      if histogram is None:
+        histogram = self.stages[name] = Histogram()
+      histogram.observe(seconds)
+
+  def increment(self, name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with self._lock:
+      self.counters[key] = self.counters.get(key, 0) + amount
+
+  def clear(self):
+    with self._lock:
+      self.stages.clear()
+      self.counters.clear()
+
+  def render(self, extra=None):
+    """Texto en el formato de exposición de Prometheus (version 0.0.4)."""
+    lines = [
+      '# HELP scoutml_stage_seconds Duración de cada etapa de la predicción.',
+      '# TYPE scoutml_stage_seconds histogram',
+    ]
+    with self._lock:
+      for stage, histogram in sorted(self.stages.items()):
+        acumulado = 0
+        for limite, cuenta in zip(BUCKETS + ('+Inf',), histogram.counts):
+          acumulado += cuenta
+          lines.append(f'scoutml_stage_seconds_bucket{{stage="{stage}",le="{limite}"}} {acumulado}')
+        lines.append(f'scoutml_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+        lines.append(f'scoutml_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+      nombres = sorted({name for name, _ in self.counters})
+      for name in nombres:
+        lines.append(f'# TYPE scoutml_{name} counter')
+        for (counter, labels), value in sorted(self.counters.items()):
+          if counter == name:
+            lines.append(f'scoutml_{name}{_labels(labels)} {value}')
+
+    # Métricas que llevan la cuenta en otro sitio: {nombre: (tipo, valor)}
+    for name, (kind, value) in (extra or {}).items():
+      lines.append(f'# TYPE scoutml_{name} {kind}')
+      lines.append(f'scoutml_{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+  if not labels:
+    return ''
+  return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+registry = Registry()
+
+
+class _Stage:
+  __slots__ = ('name', 'timings', 'start')
+
+  def __init__(self, name, timings):
+    self.name = name
+    self.timings = timings
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    seconds = time.perf_counter() - self.start
+    if ENABLED:
+      registry.observe(self.name, seconds)
+    if self.timings is not None:
+      # Una etapa repetida (p. ej. un bloque de archivo tras otro) se acumula
+      self.timings[self.name] = self.timings.get(self.name, 0.0) + seconds
+    return False
+
+
+def stage(name):
+  """Context manager que mide una etapa. Sin métricas ni desglose activos no hace nada."""
+  timings = _request_timings.get()
+  if not ENABLED and timings is None:
+    return _NOOP
+  return _Stage(name, timings)
+
+
+def timed_iter(iterable, name):
+  """Recorre `iterable` midiendo en la etapa `name` el tiempo de obtener cada elemento."""
+  iterator = iter(iterable)
+  while True:
+    with stage(name):
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+    yield item
+
+
+def increment(name, amount=1, **labels):
+  if ENABLED:
+    registry.increment(name, amount, **labels)
+
+
+def _server_timing(timings):
+  return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.items())
+
+
+class TimingMiddleware:
+  """Mide la petición completa y, con SCOUTML_SERVER_TIMING, devuelve el desglose en Server-Timing."""
+
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    self.is_async = iscoroutinefunction(get_response)
+    if self.is_async:
+      markcoroutinefunction(self)
+
+  def _start(self):
+    if not (ENABLED or SERVER_TIMING):
+      return None, None
+    token = _request_timings.set({}) if SERVER_TIMING else None
+    return token, stage('request')
+
+  def _finish(self, token, response):
+    if token is None:
+      return response
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    if timings:
+      response['Server-Timing'] = _server_timing(timings)
+    return response
+
+  def __call__(self, request):
+    if self.is_async:
+      return self.__acall__(request)
+    token, request_stage = self._start()
+    if request_stage is None:
+      return self.get_response(request)
+    with request_stage:
+      response = self.get_response(request)
+    return self._finish(token, response)
+
+  async def __acall__(self, request):
+    token, request_stage = self._start()
+    if request_stage is None:
+      return await self.get_response(request)
+    with request_stage:
+      response = await self.get_response(request)
+    return self._finish(token, response)
+
+
+def metrics_view(request):
+  """Endpoint de Prometheus con los histogramas y contadores de este proceso."""
+  if not ENABLED:
+    return HttpResponseNotFound("Métricas desactivadas (SCOUTML_METRICS=1 para activarlas).")
+  from .predictor import prediction_cache
+
+  cache = prediction_cache.stats()
+  extra = {
+    'prediction_cache_hits_total': ('counter', cache['hits']),
+    'prediction_cache_misses_total': ('counter', cache['misses']),
+    'prediction_cache_size': ('gauge', cache['size']),
+  }
+  return HttpResponse(registry.render(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
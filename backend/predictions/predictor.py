@@ -1,151 +1,431 @@
-import joblib
+import hashlib
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import repeat
 import pandas as pd
 import numpy as np
-import requests 
-from pathlib import Path
-from io import BytesIO
+from sklearn.preprocessing import StandardScaler
+from . import metrics
+from .cache import PredictionCache, canonical
+from .forest import CompiledForest
+from .indexes import PercentileIndex, ComparableIndex
+from .registry import ModelRegistry, load_pipeline, manifest_path, resolve
+from .snapshot import snapshot_for
 
-#  URLs DE ARCHIVOS EN SUPABASE STORAGE
+#  URLs DE ARCHIVOS EN SUPABASE STORAGE (por defecto; SCOUTML_MODEL_MANIFEST las reemplaza, ver registry.py)
 PITCHER_MODEL_URL = "https://cbapxmchljrtvfiqozoy.supabase.co/storage/v1/object/public/ml_models/Modelo_RF_Pitchers.pkl"
 PITCHER_DATASET_URL = "https://cbapxmchljrtvfiqozoy.supabase.co/storage/v1/object/public/ml_models/Pitchers.csv"
 BATTER_MODEL_URL = "https://cbapxmchljrtvfiqozoy.supabase.co/storage/v1/object/public/ml_models/Modelo_RF_Bateadores.pkl"
 BATTER_DATASET_URL = "https://cbapxmchljrtvfiqozoy.supabase.co/storage/v1/object/public/ml_models/Bateadores.csv"
 
-
-# FUNCIÓN  PARA DESCARGAR Y CARGAR MODELOS
-def load_pipeline_from_url(url: str):
-  """Descarga un pipeline de modelo (.pkl) desde una URL y lo carga."""
-  print(f"Descargando pipeline desde {url}...")
-  try:
-    response = requests.get(url)
-    # Esto lanzará un error si la URL no es válida o la descarga falla
-    response.raise_for_status()
-    # Carga el pipeline directamente desde los bytes descargados
-    pipeline = joblib.load(BytesIO(response.content))
-    print("Pipeline cargado exitosamente.")
-    return pipeline
-  except Exception as e:
-    raise RuntimeError(f"Error al cargar el pipeline desde {url}: {e}")
-
-#  CARGA DE MODELOS Y DATASETS
-try:
-  # Carga de Pitchers
-  pitcher_pipeline = load_pipeline_from_url(PITCHER_MODEL_URL)
-  pitcher_model = pitcher_pipeline['model']
-  pitcher_scaler = pitcher_pipeline['scaler']
-  pitcher_features = pitcher_pipeline['features']
-  print(f"Descargando dataset de pitchers desde {PITCHER_DATASET_URL}...")
-  pitcher_dataset = pd.read_csv(PITCHER_DATASET_URL)
-  print("Dataset de pitchers cargado.")
-
-  # Carga de Bateadores
-  batter_pipeline = load_pipeline_from_url(BATTER_MODEL_URL)
-  batter_model = batter_pipeline['model']
-  batter_scaler = batter_pipeline['scaler']
-  batter_features = batter_pipeline['features']
-  print(f"Descargando dataset de bateadores desde {BATTER_DATASET_URL}...")
-  batter_dataset = pd.read_csv(BATTER_DATASET_URL)
-  print("Dataset de bateadores cargado.")
-
-except RuntimeError as e:
-  # Si algo falla (la descarga, la carga), el programa se detendrá con un error claro.
-  raise e
-
 #Constantes de Métricas
+UMBRAL = 0.7
 metricas_invertidas_p = ['ERA', 'WHIP', 'BB/9']
 metricas_invertidas_b = ['K%']
 pesos_bateo = {'AVG': 0.15, 'OBP': 0.20, 'SLG': 0.15, 'OPS': 0.25, 'K%': 0.10, 'BB/K': 0.05, 'FPCT': 0.05, 'RF': 0.05}
 pesos_pitcheo = {'ERA': 0.20, 'WHIP': 0.25, 'K/9': 0.20, 'BB/9': 0.15, 'K/BB': 0.15, 'FPCT': 0.025, 'RF': 0.025}
 
-# Genera un reporte completo para un solo jugador
-def single(player_data, player_type, plan='gratis'):
-  UMBRAL = 0.7
-  
-  if player_type == 'pitcher':
-    model, scaler, features, dataset, metricas_invertidas, pesos = \
-    pitcher_model, pitcher_scaler, pitcher_features, pitcher_dataset, metricas_invertidas_p, pesos_pitcheo
-  elif player_type == 'batter':
-    model, scaler, features, dataset, metricas_invertidas, pesos = \
-    batter_model, batter_scaler, batter_features, batter_dataset, metricas_invertidas_b, pesos_bateo
-  else:
-    return {"error": "Tipo de jugador no válido."}
+#  MOTOR DE INFERENCIA (variable de entorno SCOUTML_INFERENCE)
+# 'sklearn' (por defecto): predict_proba del modelo
+# 'compiled': el bosque compilado a arrays de NumPy (forest.py), comprobado contra sklearn al cargar
+# 'verify': como 'compiled', pero además cada predicción se compara con sklearn (y se devuelve la de sklearn)
+INFERENCE = os.getenv('SCOUTML_INFERENCE', 'sklearn')
+
+PLAYER_TYPES = {
+  'pitcher': (PITCHER_MODEL_URL, PITCHER_DATASET_URL, metricas_invertidas_p, pesos_pitcheo),
+  'batter': (BATTER_MODEL_URL, BATTER_DATASET_URL, metricas_invertidas_b, pesos_bateo),
+}
+
+
+class ModelBundle:
+  """Pipeline, dataset de referencia e índices derivados de un tipo de jugador."""
+
+  def __init__(self, pipeline, snapshot, dataset_path, metricas_invertidas, pesos, version='', fingerprint=None):
+    # `version`: la del manifiesto (o la huella si no hay); `fingerprint`: cambia con el contenido de los archivos
+    self.version = version
+    self.fingerprint = fingerprint or version
+    self.model = pipeline['model']
+    self.scaler = pipeline['scaler']
+    self.features = list(pipeline['features'])
+    self.pesos = pesos
+    _validate_pipeline(self.scaler, self.features, pesos, snapshot)
+    # Pesos del ranking en el orden de las features (no en el orden del dict)
+    self.weights = _readonly(np.array([pesos[m] for m in self.features], dtype=np.float64))
+    # Escalado precalculado: (x - media) / escala, lo mismo que StandardScaler.transform sin pasar por pandas
+    self._offset, self._scale = _affine(self.scaler, len(self.features))
+    # Dataset de referencia en formato columnar, mapeado en memoria y compartido entre workers
+    self.snapshot = snapshot
+    self.dataset_path = dataset_path
+    # Matrices de referencia (filas x features) en bruto y escaladas, de solo lectura
+    self.reference = snapshot.matrix
+    self.reference_scaled = _readonly(self.transform(np.asarray(snapshot.matrix)))
+    # Índices de percentiles y comparables (se construyen una sola vez al cargar el dataset)
+    self.percentiles = PercentileIndex(snapshot.sorted_columns(), snapshot.rows, self.features, metricas_invertidas)
+    self.comparables = ComparableIndex(self.reference, snapshot.labels, self.features)
+    self.forest = _compile_forest(self) if INFERENCE in ('compiled', 'verify') else None
+
+  def transform(self, matrix):
+    """Escala una matriz (jugadores x features) al espacio del modelo."""
+    if self._offset is None:
+      # Scaler que no es un StandardScaler: se usa su propio transform
+      return np.asarray(self.scaler.transform(pd.DataFrame(matrix, columns=self.features)), dtype=np.float64)
+    return (matrix - self._offset) / self._scale
+
+  def predict_proba(self, matrix):
+    """Probabilidad de prospecto de cada fila de una matriz en bruto (jugadores x features).
+
+    Mide por separado las etapas 'scale' y 'predict_proba', que no se solapan.
+    """
+    if self.forest is not None and INFERENCE == 'compiled':
+      # El escalado va plegado en los umbrales (salvo con scalers que no son StandardScaler)
+      if self._offset is None:
+        with metrics.stage('scale'):
+          matrix = self.transform(matrix)
+      with metrics.stage('predict_proba'):
+        return self.forest.predict_proba(matrix)
+    with metrics.stage('scale'):
+      scaled = self.transform(matrix)
+    with metrics.stage('predict_proba'):
+      probabilidades = self.model.predict_proba(scaled)[:, 1]
+      if self.forest is not None:
+        try:
+          self.forest.verify(self.model, matrix if self._offset is not None else scaled, scaled)
+        except ValueError as e:
+          print(f"Verificación del bosque compilado ({self.version}): {e}")
+    return probabilidades
+
+  @property
+  def dataset(self):
+    """DataFrame completo del dataset; solo se lee el CSV si alguien lo pide."""
+    if not hasattr(self, '_dataset'):
+      self._dataset = pd.read_csv(self.dataset_path)
+    return self._dataset
+
+
+def _readonly(array):
+  array = np.ascontiguousarray(array)
+  array.flags.writeable = False
+  return array
+
+# Media y escala de un StandardScaler como vectores, o (None, None) si el scaler es de otro tipo
+def _affine(scaler, n_features):
+  if not isinstance(scaler, StandardScaler):
+    return None, None
+  offset = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+  scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+  return _readonly(np.asarray(offset, dtype=np.float64)), _readonly(np.asarray(scale, dtype=np.float64))
 
+# Bosque compilado del modelo, verificado contra sklearn con el dataset de referencia.
+# Si el modelo no se puede compilar o no coincide, se sigue usando sklearn
+def _compile_forest(bundle):
   try:
-    # Se limpian los datos para asegurar que todas las features requeridas están presentes
-    cleaned_player_data = {k: player_data.get(k, 0) for k in features}
-    player_df = pd.DataFrame([cleaned_player_data], columns=features)
-    player_scaled = scaler.transform(player_df)
-  except KeyError as e:
-    return {"error": f"Falta la métrica requerida: {str(e)}"}
-
-  # 1. Booleano de Prospecto y Probabilidad
-  prospect_percentage = model.predict_proba(player_scaled)[0][1]
-  is_prospect = bool(prospect_percentage >= UMBRAL)
-
-  # 2. Percentiles, Fortalezas y Debilidades
-  percentiles, fortalezas, mejoras = {}, [], []
-  for m in features:
-    valor = player_data.get(m, 0)
-    percentil = ((dataset[m] > valor).mean() if m in metricas_invertidas else (dataset[m] < valor).mean()) * 100
-    percentil = int(percentil)
-    percentiles[m] = percentil
-    if percentil >= 80:
-      fortalezas.append({"metrica": m, "valor": valor, "percentil": percentil})
-    elif percentil <= 20:
-      mejoras.append({"metrica": m, "actual": valor, "percentil": percentil})
-
-  # 3. Ranking
-  ranking = int(np.average(pd.Series(percentiles), weights=pd.Series(pesos)))
-
-  # 4. Jugador Comparable
-  distancias = np.linalg.norm(dataset[features].values - player_df.values.flatten(), axis=1)
-  comparable = dataset.iloc[np.argmin(distancias)]
-  jugador_comparable = f"{comparable.get('nameFirst', '')} {comparable.get('nameLast', '')} ({comparable.get('yearID', '')})"
-
-  # 5. Resumen
-  if is_prospect:
-    resumen = f"Presenta un perfil de prospecto con un rendimiento del {ranking}%."
+    forest = CompiledForest(bundle.model, bundle._offset, bundle._scale)
+    reference = np.asarray(bundle.reference)
+    forest.verify(bundle.model, reference if bundle._offset is not None else bundle.reference_scaled, bundle.reference_scaled)
+  except (TypeError, ValueError) as e:
+    print(f"Bosque compilado no disponible, se usa sklearn: {e}")
+    return None
+  return forest
+
+# Comprueba al cargar que el scaler, los pesos y el dataset coinciden con las features del modelo
+def _validate_pipeline(scaler, features, pesos, snapshot):
+  if list(snapshot.features) != features:
+    raise ValueError("El snapshot del dataset no corresponde a las features del modelo.")
+  n_features = getattr(scaler, 'n_features_in_', len(features))
+  if n_features != len(features):
+    raise ValueError(f"El scaler espera {n_features} features pero el modelo declara {len(features)}.")
+  nombres = getattr(scaler, 'feature_names_in_', None)
+  if nombres is not None and list(nombres) != features:
+    raise ValueError(f"El scaler se ajustó con otras features u otro orden: {list(nombres)}")
+  sin_peso = [m for m in features if m not in pesos]
+  if sin_peso:
+    raise ValueError(f"Faltan pesos de ranking para: {', '.join(sin_peso)}")
+  sobrantes = [m for m in pesos if m not in features]
+  if sobrantes:
+    raise ValueError(f"Pesos de ranking para métricas que el modelo no usa: {', '.join(sobrantes)}")
+
+
+#  CARGA DE MODELOS Y DATASETS (perezosa: se descargan en el primer uso y se guardan en caché en disco)
+# `spec`: versión, modelo y dataset del tipo de jugador según el manifiesto (registry.read_manifest)
+def _load_bundle(player_type, spec):
+  _, _, metricas_invertidas, pesos = PLAYER_TYPES[player_type]
+  with metrics.stage('model_load'):
+    model_path = resolve(spec['model'])
+    pipeline = load_pipeline(model_path)
+    dataset_path = resolve(spec['dataset'])
+    snapshot = snapshot_for(dataset_path, pipeline['features'])
+    print(f"Dataset de referencia ({player_type}) cargado.")
+    fingerprint = _version(model_path, snapshot)
+    return ModelBundle(pipeline, snapshot, dataset_path, metricas_invertidas, pesos, spec.get('version') or fingerprint, fingerprint)
+
+# Versión de un modelo: cambia si cambia el .pkl o el dataset de referencia (el snapshot ya depende de él)
+def _version(model_path, snapshot):
+  stat = model_path.stat()
+  key = f"{model_path.name}:{stat.st_size}:{stat.st_mtime_ns}:{snapshot.path.name}"
+  return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+registry = ModelRegistry(
+  _load_bundle,
+  {player_type: {'model': model_url, 'dataset': dataset_url} for player_type, (model_url, dataset_url, _, _) in PLAYER_TYPES.items()},
+  manifest=manifest_path(),
+)
+
+# Compatibilidad: predictor.pitcher_model, predictor.batter_dataset, etc. cargan el modelo al accederlos
+def __getattr__(name):
+  player_type, _, attr = name.partition('_')
+  if player_type in PLAYER_TYPES and attr in ('model', 'scaler', 'features', 'dataset'):
+    return getattr(registry.get(player_type), attr)
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Devuelve los artefactos del modelo según el tipo de jugador
+def _resolve(player_type):
+  if player_type not in PLAYER_TYPES:
+    return None
+  return registry.get(player_type)
+
+# Motor de puntuación: una sola matriz y un solo predict_proba para toda la lista
+def _reports(players_list, player_type):
+  bundle = _resolve(player_type)
+  if bundle is None:
+    # range(len()): iterar un DataFrame recorre sus columnas, no sus filas
+    return [{"error": "Tipo de jugador no válido."} for _ in range(len(players_list))]
+  if len(players_list) == 0:
+    return []
+  features = bundle.features
+
+  # Se limpian los datos para asegurar que todas las features requeridas están presentes
+  if isinstance(players_list, pd.DataFrame):
+    # DataFrame de file_reader.player_file(as_frame=True): las métricas ausentes valen 0
+    players_df = players_list.reindex(columns=features, fill_value=0).reset_index(drop=True)
+    cleaned_players = players_df.to_dict('records')
+    players_matrix = players_df.to_numpy(dtype=np.float64)
   else:
-    if mejoras:
-      metricas_a_mejorar_nombres = [m['metrica'] for m in mejoras]
-      resumen = f"Aún no alcanza el perfil de prospecto. Áreas clave a mejorar: {', '.join(metricas_a_mejorar_nombres)}."
-    else:
-      resumen = "Aún no alcanza el perfil de prospecto. Sus estadísticas generales son sólidas pero necesitan desarrollo igualmente."
-      
-  # Formatear respuesta para coincidir con la BD
-  return {
-    "is_prospect": is_prospect,
-    "prospect_percentage": prospect_percentage,
-    "ranking": ranking,
-    "factores_positivos": fortalezas,
-    "factores_a_mejorar": mejoras,
-    "jugador_comparable": jugador_comparable,
-    "resumen": resumen,
-    "calculated_stats": cleaned_player_data,
-  }
-    
+    cleaned_players = [{k: player_data.get(k, 0) for k in features} for player_data in players_list]
+    players_matrix = np.array([list(player.values()) for player in cleaned_players], dtype=np.float64)
+
+  # 1. Probabilidad de prospecto para todos los jugadores a la vez (etapas 'scale' y 'predict_proba')
+  prospect_percentages = bundle.predict_proba(players_matrix)
+
+  # 2. Percentiles de todos los jugadores con búsqueda binaria sobre las columnas ordenadas
+  with metrics.stage('percentiles'):
+    percentiles_lote = bundle.percentiles.percentiles(players_matrix)
+
+  # 4. Jugador comparable más cercano de todos los jugadores en una sola consulta al KD-tree
+  with metrics.stage('comparables'):
+    _, comparables_lote = bundle.comparables.query(players_matrix, k=1)
+
+  metrics.increment('players_scored_total', len(cleaned_players), player_type=player_type)
+  with metrics.stage('report'):
+    return _build_reports(bundle, cleaned_players, prospect_percentages, percentiles_lote, comparables_lote)
+
+# Arma el reporte de cada jugador a partir de los resultados vectorizados
+def _build_reports(bundle, cleaned_players, prospect_percentages, percentiles_lote, comparables_lote):
+  features = bundle.features
 
-#Predice un DataFrame completo
-def batch(players_list: list, player_type: str) -> list:
   all_reports = []
-  for player_stats in players_list:
+  for i, cleaned_player_data in enumerate(cleaned_players):
+    prospect_percentage = prospect_percentages[i]
+    is_prospect = bool(prospect_percentage >= UMBRAL)
+
+    # Fortalezas y Debilidades
+    fortalezas, mejoras = [], []
+    for j, m in enumerate(features):
+      valor = cleaned_player_data[m]
+      percentil = int(percentiles_lote[i, j])
+      if percentil >= 80:
+        fortalezas.append({"metrica": m, "valor": valor, "percentil": percentil})
+      elif percentil <= 20:
+        mejoras.append({"metrica": m, "actual": valor, "percentil": percentil})
+
+    # 3. Ranking
+    ranking = int(np.average(percentiles_lote[i], weights=bundle.weights))
 
-    report = single(player_stats, player_type)
-    
+    jugador_comparable = bundle.comparables.label(comparables_lote[i, 0])
+
+    # 5. Resumen
+    if is_prospect:
+      resumen = f"Presenta un perfil de prospecto con un rendimiento del {ranking}%."
+    else:
+      if mejoras:
+        metricas_a_mejorar_nombres = [m['metrica'] for m in mejoras]
+        resumen = f"Aún no alcanza el perfil de prospecto. Áreas clave a mejorar: {', '.join(metricas_a_mejorar_nombres)}."
+      else:
+        resumen = "Aún no alcanza el perfil de prospecto. Sus estadísticas generales son sólidas pero necesitan desarrollo igualmente."
+
+    # Formatear respuesta para coincidir con la BD
+    all_reports.append({
+      "is_prospect": is_prospect,
+      "prospect_percentage": prospect_percentage,
+      "ranking": ranking,
+      "factores_positivos": fortalezas,
+      "factores_a_mejorar": mejoras,
+      "jugador_comparable": jugador_comparable,
+      "resumen": resumen,
+      "calculated_stats": cleaned_player_data,
+      "model_version": bundle.version,
+    })
+
+  return all_reports
+
+#  CACHÉ DE REPORTES
+# Los reportes de entradas repetidas se sirven desde la caché en lugar de volver a puntuarse
+prediction_cache = PredictionCache()
+
+# Copia de un reporte: quien lo recibe puede modificarlo sin tocar el guardado en la caché
+def _copy_report(report):
+  copia = dict(report)
+  copia['factores_positivos'] = [dict(f) for f in report['factores_positivos']]
+  copia['factores_a_mejorar'] = [dict(f) for f in report['factores_a_mejorar']]
+  copia['calculated_stats'] = dict(report['calculated_stats'])
+  return copia
+
+# Claves de la caché: tipo de jugador + versión y huella del modelo + valores de las features del jugador
+def _cache_keys(players_list, player_type, bundle):
+  if isinstance(players_list, pd.DataFrame):
+    rows = players_list.reindex(columns=bundle.features, fill_value=0).itertuples(index=False, name=None)
+  else:
+    rows = ([player_data.get(k, 0) for k in bundle.features] for player_data in players_list)
+  return [(player_type, bundle.version, bundle.fingerprint, tuple(canonical(v) for v in row)) for row in rows]
+
+# Puntúa solo los jugadores que no están en la caché (con `score`) y guarda sus reportes
+def _cached_reports(players_list, player_type, score=_reports):
+  bundle = _resolve(player_type)
+  if bundle is None or not prediction_cache.enabled or len(players_list) == 0:
+    return score(players_list, player_type)
+
+  with metrics.stage('cache_lookup'):
+    keys = _cache_keys(players_list, player_type, bundle)
+    reports = [prediction_cache.get(key) for key in keys]
+  faltantes = [i for i, report in enumerate(reports) if report is None]
+  if faltantes:
+    if isinstance(players_list, pd.DataFrame):
+      nuevos = score(players_list.iloc[faltantes], player_type)
+    else:
+      nuevos = score([players_list[i] for i in faltantes], player_type)
+    # Los errores (p. ej. métricas inválidas) no se guardan, ni los puntuados con otra versión si hubo un cambio a mitad
+    prediction_cache.set_many([
+      (keys[i], report) for i, report in zip(faltantes, nuevos)
+      if 'error' not in report and report['model_version'] == bundle.version
+    ])
+    for i, report in zip(faltantes, nuevos):
+      reports[i] = report
+  return [_copy_report(report) if 'error' not in report else report for report in reports]
+
+# Devuelve los k jugadores históricos más parecidos a un jugador
+def comparables(player_data, player_type, k=5):
+  bundle = _resolve(player_type)
+  if bundle is None:
+    return {"error": "Tipo de jugador no válido."}
+  valores = [player_data.get(m, 0) for m in bundle.features]
+  distancias, posiciones = bundle.comparables.query(valores, k=k)
+  return [
+    {"jugador": bundle.comparables.label(posicion), "distancia": float(distancia)}
+    for distancia, posicion in zip(distancias[0], posiciones[0])
+  ]
+
+# Genera un reporte completo para un solo jugador
+def single(player_data, player_type, plan='gratis'):
+  return _cached_reports([player_data], player_type)[0]
+
+
+# Datos personales de cada fila de un DataFrame de jugadores, con la misma forma que los dicts de player_file
+def _personal_info(players_df):
+  columnas = [c for c in ('name', 'birth_date', 'weight', 'height') if c in players_df.columns]
+  if not columnas:
+    # Un DataFrame sin columnas da [] en to_dict: un dict vacío por fila, como un jugador sin datos
+    return [{}] * len(players_df)
+  return players_df[columnas].to_dict('records')
+
+
+#  EJECUCIÓN EN PARALELO
+# SCOUTML_BATCH_WORKERS / SCOUTML_BATCH_EXECUTOR: valores por defecto de `workers` y `executor` en batch()
+# ('thread' por defecto, o 'process')
+MIN_SHARD_SIZE = 256
+_pools = {}
+_pools_lock = threading.RLock()
+
+def _pool(executor, workers):
+  with _pools_lock:
+    pool = _pools.get((executor, workers))
+    if pool is None:
+      if executor == 'thread':
+        # NumPy, el KD-tree y los árboles de sklearn liberan el GIL en sus bucles internos
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scoutml-batch')
+      else:
+        # 'forkserver': bifurcar el worker web, que ya tiene hilos en marcha (recargas del manifiesto,
+        # pools), puede dejar locks tomados en el hijo. Cada proceso carga los modelos de la caché en disco
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(method)
+        if method == 'forkserver':
+          # El servidor importa este módulo una vez y los procesos se bifurcan ya con él importado
+          context.set_forkserver_preload([__name__])
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_pin_registry)
+      _pools[(executor, workers)] = pool
+    return pool
+
+# Los procesos del pool no siguen el manifiesto: al cambiar de versión se reemplaza el pool entero
+def _pin_registry():
+  registry.pin()
+
+# Cierra los pools sin esperar: lo ya enviado termina, lo siguiente va a pools nuevos
+def _reset_pools():
+  with _pools_lock:
+    pools = list(_pools.values())
+    _pools.clear()
+  for pool in pools:
+    pool.shutdown(wait=False)
+
+# Reparte los jugadores en bloques contiguos y los puntúa en paralelo, conservando el orden
+def _reports_parallel(players_list, player_type, workers, executor):
+  total = len(players_list)
+  shard_size = max(MIN_SHARD_SIZE, -(-total // workers))
+  if total <= shard_size or _resolve(player_type) is None:
+    return _reports(players_list, player_type)
+
+  if isinstance(players_list, pd.DataFrame):
+    shards = [players_list.iloc[i:i + shard_size] for i in range(0, total, shard_size)]
+  else:
+    shards = [players_list[i:i + shard_size] for i in range(0, total, shard_size)]
+  # _resolve() ya cargó el modelo en este proceso antes de crear el pool. map() envía todos los bloques
+  # de inmediato, así que con el lock un cambio de versión no cierra el pool a mitad del envío
+  with _pools_lock:
+    results = _pool(executor, workers).map(_reports, shards, repeat(player_type))
+  return [report for shard_reports in results for report in shard_reports]
+
+
+#Predice un DataFrame completo
+def batch(players_list, player_type: str, workers: int = None, executor: str = None) -> list:
+  workers = workers or int(os.getenv('SCOUTML_BATCH_WORKERS', 1))
+  executor = executor or os.getenv('SCOUTML_BATCH_EXECUTOR', 'thread')
+  if workers > 1:
+    all_reports = _cached_reports(players_list, player_type, partial(_reports_parallel, workers=workers, executor=executor))
+  else:
+    all_reports = _cached_reports(players_list, player_type)
+  if isinstance(players_list, pd.DataFrame):
+    players_list = _personal_info(players_list)
+  for report, player_stats in zip(all_reports, players_list):
     # Añadir la información personal del jugador al reporte para el frontend
     report['Player'] = player_stats.get('name', 'Nombre Desconocido')
     report['Birth_Date'] = player_stats.get('birth_date')
     report['Weight'] = player_stats.get('weight')
     report['Height'] = player_stats.get('height')
-        
-    all_reports.append(report)
-
-  # Limpieza final para asegurar compatibilidad con JSON
-  for record in all_reports:
-    for key, value in record.items():
-      if isinstance(value, float) and np.isnan(value):
-        record[key] = None
-      if isinstance(value, pd.Timestamp):
-        record[key] = value.strftime('%Y-%m-%d')
-
-  return all_reports
\ No newline at end of file
+
+  # NaN y fechas se quedan como están: los serializa formats.dumps al escribir la respuesta
+
+  return all_reports
+
+
+#  CAMBIO DE VERSIÓN
+# Al activarse una nueva versión solo se borran los reportes en memoria de ese tipo de jugador, y se
+# reemplazan los pools de procesos, cuyos workers se bifurcaron con los modelos anteriores
+def _on_swap(player_type, bundle, previous):
+  prediction_cache.invalidate(player_type)
+  _reset_pools()
+  metrics.increment('model_swaps_total', player_type=player_type)
+  anterior = previous.version if previous is not None else '-'
+  print(f"Modelo de {player_type} actualizado: {anterior} -> {bundle.version}")
+
+registry.on_swap(_on_swap)
@@ -0,0 +1,350 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, replace
+from datetime import datetime
+
+from dateutil import parser
+
+from backend.users.supabase_client import get_async_supabase, get_supabase
+
+#  CONFIGURACIÓN (variables de entorno)
+# SCOUTML_QUOTA_CACHE_TTL: segundos que se reutiliza un perfil leído de Supabase
+DEFAULT_CACHE_TTL = 30
+# Reintentos de una reserva cuando otro proceso cambió el perfil entre la lectura y la escritura
+MAX_RETRIES = 5
+
+PLAN_LIMITS = {
+  'gratis': 1,
+  'basico': 10,
+  'medio': 20,
+  'avanzado': 500,
+}
+
+
+class ProfileNotFound(Exception):
+  """El usuario no tiene perfil."""
+
+
+class QuotaExceeded(Exception):
+  """El usuario ya usó todas las predicciones de su plan este mes."""
+
+  def __init__(self, limit):
+    super().__init__(f"Límite mensual de {limit} predicciones alcanzado.")
+    self.limit = limit
+
+
+def _periodo(fecha):
+  # El contador es mensual: se compara año y mes, no solo el mes
+  return (fecha.year, fecha.month)
+
+
+@dataclass(frozen=True)
+class Profile:
+  """Fila de `profiles` tal como está guardada en Supabase."""
+  user_id: str
+  plan: str
+  stored_count: int
+  last_prediction_date: str
+
+  @property
+  def limit(self):
+    return PLAN_LIMITS.get(self.plan, 0)
+
+  @property
+  def prediction_count(self):
+    """Predicciones usadas en el mes actual (0 si la última fue en otro mes)."""
+    if self.last_prediction_date and _periodo(parser.isoparse(self.last_prediction_date)) != _periodo(datetime.now()):
+      return 0
+    return self.stored_count or 0
+
+  @property
+  def available(self):
+    return max(0, self.limit - self.prediction_count)
+
+
+@dataclass
+class Reservation:
+  """Créditos apartados para una predicción; se confirman con `commit` o se devuelven con `release`."""
+  user_id: str
+  plan: str
+  limit: int
+  granted: int
+  settled: bool = False
+
+
+class QuotaStore:
+  """Cuota mensual de predicciones con caché local de perfiles y reservas atómicas.
+
+  Las escrituras son condicionales (compare-and-swap sobre `prediction_count` y
+  `last_prediction_date`): si otro proceso cambió el perfil, la escritura no afecta
+  ninguna fila, se relee el perfil y se reintenta. Así dos peticiones concurrentes
+  nunca superan el límite del plan, y la caché solo ahorra lecturas.
+  """
+
+  def __init__(self, ttl=None):
+    self.ttl = ttl
+    self._cache = {}
+    self._lock = threading.Lock()
+    self._user_locks = {}
+    self._async_locks = weakref.WeakKeyDictionary()
+
+  def _ttl(self):
+    return float(self.ttl if self.ttl is not None else os.getenv('SCOUTML_QUOTA_CACHE_TTL', DEFAULT_CACHE_TTL))
+
+  def _user_lock(self, user_id):
+    # Las peticiones del mismo usuario en este proceso se serializan para no chocar entre sí
+    with self._lock:
+      return self._user_locks.setdefault(str(user_id), threading.Lock())
+
+  def _store(self, profile):
+    with self._lock:
+      self._cache[profile.user_id] = (time.monotonic() + self._ttl(), profile)
+
+  def invalidate(self, user_id=None):
+    """Olvida el perfil cacheado de `user_id` (o todos). Se llama al cambiar el plan."""
+    with self._lock:
+      if user_id is None:
+        self._cache.clear()
+      else:
+        self._cache.pop(str(user_id), None)
+
+  # Consultas a Supabase: se construyen igual para el cliente síncrono y el asíncrono
+  @staticmethod
+  def _select_query(client, user_id):
+    return client.table("profiles").select(
+      "plan, prediction_count, last_prediction_date"
+    ).eq("user_id", user_id).single()
+
+  @staticmethod
+  def _swap_query(client, profile, new_count, now):
+    query = client.table("profiles").update({
+      "prediction_count": new_count,
+      "last_prediction_date": now,
+    }).eq("user_id", profile.user_id)
+    for column, value in (("prediction_count", profile.stored_count), ("last_prediction_date", profile.last_prediction_date)):
+      query = query.is_(column, "null") if value is None else query.eq(column, value)
+    return query
+
+  def _fetched(self, user_id, response):
+    if not response.data:
+      raise ProfileNotFound(user_id)
+    data = response.data
+    profile = Profile(
+      user_id=str(user_id),
+      plan=data.get('plan') or 'gratis',
+      stored_count=data.get('prediction_count'),
+      last_prediction_date=data.get('last_prediction_date'),
+    )
+    self._store(profile)
+    return profile
+
+  def _swapped(self, profile, new_count, now, response):
+    # Sin filas afectadas: otro proceso cambió el perfil entre la lectura y la escritura
+    if not response.data:
+      self.invalidate(profile.user_id)
+      return None
+    stored = response.data[0]
+    updated = replace(profile, stored_count=new_count, last_prediction_date=stored.get('last_prediction_date', now))
+    self._store(updated)
+    return updated
+
+  def _cached(self, user_id):
+    with self._lock:
+      entry = self._cache.get(str(user_id))
+    if entry and entry[0] > time.monotonic():
+      return entry[1]
+    return None
+
+  def _fetch(self, user_id):
+    return self._fetched(user_id, self._select_query(get_supabase(), user_id).execute())
+
+  def profile(self, user_id, refresh=False):
+    """Perfil del usuario, desde la caché si no ha caducado."""
+    profile = None if refresh else self._cached(user_id)
+    return profile or self._fetch(user_id)
+
+  def available(self, user_id):
+    """Predicciones que le quedan al usuario este mes; si la caché dice 0, se confirma con Supabase."""
+    available = self.profile(user_id).available
+    if available <= 0:
+      available = self.profile(user_id, refresh=True).available
+    return available
+
+  def confirm_plan(self, profile, plan):
+    """Perfil con `plan` confirmado: si la caché dice otro, se relee de Supabase antes de negar el acceso.
+
+    El cambio de plan pudo hacerse en otro proceso, que solo invalida su propia caché.
+    """
+    if profile.plan == plan:
+      return profile
+    return self.profile(profile.user_id, refresh=True)
+
+  def _swap(self, profile, new_count):
+    """Escribe `new_count` solo si el perfil sigue como se leyó. Devuelve el perfil nuevo o None."""
+    now = datetime.now().isoformat()
+    response = self._swap_query(get_supabase(), profile, new_count, now).execute()
+    return self._swapped(profile, new_count, now, response)
+
+  def _update(self, user_id, change):
+    # change(perfil) -> nuevo contador del mes, o None si no hay nada que escribir
+    with self._user_lock(user_id):
+      profile, fresh = self.profile(user_id), False
+      for _ in range(MAX_RETRIES):
+        new_count = change(profile)
+        if new_count is None:
+          # Antes de negar o descartar una escritura se confirma con Supabase: otro proceso pudo liberar cuota
+          if fresh:
+            return profile
+          profile, fresh = self._fetch(user_id), True
+          continue
+        updated = self._swap(profile, new_count)
+        if updated is not None:
+          return updated
+        profile, fresh = self._fetch(user_id), True
+    raise RuntimeError("No se pudo actualizar el contador de predicciones: el perfil cambia demasiado rápido.")
+
+  # Versiones asíncronas para las vistas ASGI: misma caché y mismo compare-and-swap, sin bloquear el event loop
+  async def _afetch(self, user_id):
+    client = await get_async_supabase()
+    return self._fetched(user_id, await self._select_query(client, user_id).execute())
+
+  async def aprofile(self, user_id, refresh=False):
+    profile = None if refresh else self._cached(user_id)
+    return profile or await self._afetch(user_id)
+
+  async def aavailable(self, user_id):
+    available = (await self.aprofile(user_id)).available
+    if available <= 0:
+      available = (await self.aprofile(user_id, refresh=True)).available
+    return available
+
+  async def aconfirm_plan(self, profile, plan):
+    if profile.plan == plan:
+      return profile
+    return await self.aprofile(profile.user_id, refresh=True)
+
+  async def _aswap(self, profile, new_count):
+    now = datetime.now().isoformat()
+    client = await get_async_supabase()
+    response = await self._swap_query(client, profile, new_count, now).execute()
+    return self._swapped(profile, new_count, now, response)
+
+  def _auser_lock(self, user_id):
+    # asyncio.Lock en lugar del lock de hilos, que bloquearía el event loop; uno por loop y usuario
+    locks = self._async_locks.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault(str(user_id), asyncio.Lock())
+
+  async def _aupdate(self, user_id, change):
+    async with self._auser_lock(user_id):
+      profile, fresh = await self.aprofile(user_id), False
+      for _ in range(MAX_RETRIES):
+        new_count = change(profile)
+        if new_count is None:
+          if fresh:
+            return profile
+          profile, fresh = await self._afetch(user_id), True
+          continue
+        updated = await self._aswap(profile, new_count)
+        if updated is not None:
+          return updated
+        profile, fresh = await self._afetch(user_id), True
+    raise RuntimeError("No se pudo actualizar el contador de predicciones: el perfil cambia demasiado rápido.")
+
+  @staticmethod
+  def _reserve_change(amount, reservation):
+    def change(profile):
+      granted = min(amount, profile.available)
+      reservation.update(plan=profile.plan, limit=profile.limit, granted=granted)
+      if granted <= 0:
+        return None
+      return profile.prediction_count + granted
+    return change
+
+  @staticmethod
+  def _reservation(user_id, reservation):
+    if reservation['granted'] <= 0:
+      raise QuotaExceeded(reservation['limit'])
+    return Reservation(user_id=str(user_id), **reservation)
+
+  def reserve(self, user_id, amount=1):
+    """Aparta hasta `amount` predicciones del mes. Lanza QuotaExceeded si no queda ninguna."""
+    reservation = {}
+    self._update(user_id, self._reserve_change(amount, reservation))
+    return self._reservation(user_id, reservation)
+
+  async def areserve(self, user_id, amount=1):
+    reservation = {}
+    await self._aupdate(user_id, self._reserve_change(amount, reservation))
+    return self._reservation(user_id, reservation)
+
+  @staticmethod
+  def _extend_change(amount, added):
+    def change(profile):
+      added['granted'] = min(amount, profile.available)
+      if added['granted'] <= 0:
+        return None
+      return profile.prediction_count + added['granted']
+    return change
+
+  def cover(self, reservation, total):
+    """Amplía la reserva para cubrir `total` predicciones, si quedan en el mes. Devuelve cuántas cubre.
+
+    Permite reservar a medida que se leen los jugadores en lugar de apartar todo el límite de antemano.
+    """
+    missing = total - reservation.granted
+    if missing > 0 and not reservation.settled:
+      added = {'granted': 0}
+      self._update(reservation.user_id, self._extend_change(missing, added))
+      reservation.granted += added['granted']
+    return min(total, reservation.granted)
+
+  def commit(self, reservation, used=None):
+    """Confirma `used` predicciones de la reserva y devuelve las que sobraron."""
+    self._give_back(reservation, self._unused(reservation, used))
+
+  async def acommit(self, reservation, used=None):
+    await self._agive_back(reservation, self._unused(reservation, used))
+
+  def release(self, reservation):
+    """Devuelve todas las predicciones de una reserva que no se llegó a usar."""
+    self._give_back(reservation, reservation.granted)
+
+  async def arelease(self, reservation):
+    await self._agive_back(reservation, reservation.granted)
+
+  @staticmethod
+  def _unused(reservation, used):
+    used = reservation.granted if used is None else used
+    return reservation.granted - min(used, reservation.granted)
+
+  @staticmethod
+  def _give_back_change(reservation, unused):
+    # None si no hay nada que devolver (reserva ya cerrada o completamente usada)
+    if reservation.settled:
+      return None
+    reservation.settled = True
+    if unused <= 0:
+      return None
+
+    def change(profile):
+      # Si el mes cambió desde la reserva, el contador ya se reinició y no hay nada que devolver
+      if profile.prediction_count == 0:
+        return None
+      return max(0, profile.prediction_count - unused)
+    return change
+
+  def _give_back(self, reservation, unused):
+    change = self._give_back_change(reservation, unused)
+    if change is not None:
+      self._update(reservation.user_id, change)
+
+  async def _agive_back(self, reservation, unused):
+    change = self._give_back_change(reservation, unused)
+    if change is not None:
+      await self._aupdate(reservation.user_id, change)
+
+
+quota = QuotaStore()
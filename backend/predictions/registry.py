@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlparse
+
+import joblib
+import requests
+
+try:
+  import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+  fcntl = None
+
+#  CONFIGURACIÓN (variables de entorno)
+# SCOUTML_MODEL_DIR: carpeta local con los .pkl y .csv; si existe no se usa la red
+# SCOUTML_MODEL_CACHE_DIR: caché en disco compartida por todos los workers
+# SCOUTML_MODEL_CACHE_TTL: segundos durante los que una copia en caché se usa sin revalidar
+# SCOUTML_MODEL_MANIFEST: manifiesto JSON local con la versión, el modelo y el dataset de cada tipo de jugador
+# SCOUTML_MODEL_MANIFEST_POLL: segundos entre comprobaciones de cambios en el manifiesto
+DEFAULT_CACHE_DIR = Path(tempfile.gettempdir()) / 'scoutml_models'
+DEFAULT_CACHE_TTL = 600
+DEFAULT_MANIFEST_POLL = 30
+DOWNLOAD_TIMEOUT = 60
+
+
+def cache_dir():
+  return Path(os.getenv('SCOUTML_MODEL_CACHE_DIR') or DEFAULT_CACHE_DIR)
+
+
+def _cache_ttl():
+  return float(os.getenv('SCOUTML_MODEL_CACHE_TTL', DEFAULT_CACHE_TTL))
+
+
+def manifest_path():
+  return os.getenv('SCOUTML_MODEL_MANIFEST') or None
+
+
+def _manifest_poll():
+  return float(os.getenv('SCOUTML_MODEL_MANIFEST_POLL', DEFAULT_MANIFEST_POLL))
+
+
+class FileLock:
+  """Bloqueo exclusivo entre procesos para que un solo worker descargue cada archivo."""
+
+  def __init__(self, path):
+    self.path = path
+
+  def __enter__(self):
+    self.handle = open(self.path, 'a')
+    if fcntl is not None:
+      fcntl.flock(self.handle, fcntl.LOCK_EX)
+    return self
+
+  def __exit__(self, *exc):
+    if fcntl is not None:
+      fcntl.flock(self.handle, fcntl.LOCK_UN)
+    self.handle.close()
+
+
+def fetch(url: str) -> Path:
+  """Devuelve una ruta local con el contenido de `url`, descargándolo solo si no está en caché o cambió."""
+  filename = url.rsplit('/', 1)[-1]
+
+  # Modo offline: los artefactos se leen de una carpeta local
+  local_dir = os.getenv('SCOUTML_MODEL_DIR')
+  if local_dir:
+    path = Path(local_dir) / filename
+    if not path.exists():
+      raise RuntimeError(f"No se encontró {filename} en {local_dir}")
+    return path
+
+  entry = cache_dir() / hashlib.sha256(url.encode()).hexdigest()[:16]
+  entry.mkdir(parents=True, exist_ok=True)
+  meta_path = entry / 'meta.json'
+
+  with FileLock(entry / '.lock'):
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else None
+    cached = entry / meta['file'] if meta else None
+    if cached is not None and not cached.exists():
+      meta, cached = None, None
+
+    # Copia reciente: otro worker acaba de validarla
+    if cached is not None and time.time() - meta['checked_at'] < _cache_ttl():
+      return cached
+
+    headers = {'If-None-Match': meta['etag']} if meta and meta.get('etag') else {}
+    print(f"Descargando {url}...")
+    try:
+      response = requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+      if response.status_code == 304 and cached is not None:
+        print("Sin cambios, se usa la copia en caché.")
+      else:
+        response.raise_for_status()
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=entry, delete=False) as tmp:
+          for block in response.iter_content(1 << 20):
+            digest.update(block)
+            tmp.write(block)
+        sha = digest.hexdigest()
+        # El nombre incluye el hash del contenido para no pisar una versión en uso
+        new_file = f"{sha[:16]}-{filename}"
+        os.replace(tmp.name, entry / new_file)
+        if cached is not None and cached.name != new_file:
+          cached.unlink(missing_ok=True)
+        meta = {'url': url, 'etag': response.headers.get('ETag'), 'sha256': sha, 'file': new_file}
+        cached = entry / new_file
+    except requests.RequestException as e:
+      # Sin red se sigue usando la última copia conocida
+      if cached is None:
+        raise RuntimeError(f"Error al descargar {url}: {e}")
+      print(f"No se pudo revalidar {url} ({e}), se usa la copia en caché.")
+
+    meta['checked_at'] = time.time()
+    meta_path.write_text(json.dumps(meta))
+    return cached
+
+
+def _is_url(source):
+  return urlparse(str(source)).scheme in ('http', 'https')
+
+
+def resolve(source) -> Path:
+  """Ruta local de `source`: una URL (descargada con fetch) o una ruta a un archivo."""
+  if _is_url(source):
+    return fetch(source)
+  path = Path(source)
+  if not path.exists():
+    raise RuntimeError(f"No se encontró {path}")
+  return path
+
+
+# FUNCIÓN  PARA DESCARGAR Y CARGAR MODELOS
+def load_pipeline(source):
+  """Carga un pipeline de modelo (.pkl) desde una URL (descargándolo o tomándolo de la caché) o una ruta."""
+  try:
+    pipeline = joblib.load(BytesIO(resolve(source).read_bytes()))
+    print("Pipeline cargado exitosamente.")
+    return pipeline
+  except Exception as e:
+    raise RuntimeError(f"Error al cargar el pipeline desde {source}: {e}")
+
+
+#  MANIFIESTO DE MODELOS
+# {"pitcher": {"version": "2026-10-01", "model": "pitchers/v12.pkl", "dataset": "https://.../Pitchers.csv"}, ...}
+# "model" y "dataset" son URLs o rutas (relativas a la carpeta del manifiesto). Los tipos de jugador
+# que no aparecen, o los campos que faltan, usan los valores por defecto (las URLs de predictor).
+def read_manifest(path, defaults):
+  """Especificación ({'version', 'model', 'dataset'}) de cada clave: `defaults` combinado con el manifiesto."""
+  specs = {key: {'version': None, **spec} for key, spec in defaults.items()}
+  if path is None:
+    return specs
+  path = Path(path)
+  try:
+    manifest = json.loads(path.read_text())
+  except (OSError, ValueError) as e:
+    raise RuntimeError(f"No se pudo leer el manifiesto de modelos {path}: {e}")
+
+  for key, entry in manifest.items():
+    if key not in specs:
+      print(f"Manifiesto: tipo de jugador desconocido '{key}', se ignora.")
+      continue
+    spec = dict(specs[key], version=entry.get('version'))
+    for field in ('model', 'dataset'):
+      source = entry.get(field)
+      if source:
+        spec[field] = source if _is_url(source) else str((path.parent / source).resolve())
+    specs[key] = spec
+  return specs
+
+
+class ModelRegistry:
+  """Carga perezosa y thread-safe de los artefactos de cada tipo de jugador.
+
+  Cada clave se construye con `builder(clave, spec)` a partir de su especificación en el manifiesto.
+  Si el manifiesto cambia, la nueva versión se construye en segundo plano y reemplaza a la activa de
+  una sola vez: hasta entonces se sigue sirviendo la anterior, y quien ya la tiene la usa hasta terminar.
+  """
+
+  def __init__(self, builder, defaults=None, manifest=None, poll=None):
+    self.builder = builder
+    self.defaults = defaults or {}
+    self.manifest = manifest
+    self.poll = _manifest_poll() if poll is None else poll
+    self.watching = manifest is not None
+    self.specs = read_manifest(manifest, self.defaults)
+    self._stamp = self._manifest_stamp()
+    self._next_check = time.monotonic() + self.poll
+    self._entries = {}
+    self._locks = {}
+    self._loading = {}
+    self._listeners = []
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    if self.watching and time.monotonic() >= self._next_check:
+      self._check_manifest()
+    entry = self._entries.get(key)
+    if entry is not None:
+      return entry
+    with self._lock:
+      key_lock = self._locks.setdefault(key, threading.Lock())
+    # Un lock por clave: cargar pitchers no bloquea a quien ya usa bateadores
+    with key_lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        entry = self.builder(key, self.specs.get(key))
+        self._entries[key] = entry
+      return entry
+
+  def loaded(self):
+    return list(self._entries)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def on_swap(self, listener):
+    """Registra `listener(clave, nueva, anterior)`, llamado cada vez que se activa una nueva versión."""
+    self._listeners.append(listener)
+
+  def pin(self):
+    """Deja de seguir el manifiesto: este proceso se queda con las versiones que ya tiene."""
+    self.watching = False
+
+  def _manifest_stamp(self):
+    try:
+      stat = os.stat(self.manifest)
+    except (TypeError, OSError):
+      return None
+    return stat.st_size, stat.st_mtime_ns
+
+  def _check_manifest(self):
+    # Como mucho un stat del manifiesto cada `poll` segundos, y solo en el hilo que llega primero
+    with self._lock:
+      if time.monotonic() < self._next_check:
+        return
+      self._next_check = time.monotonic() + self.poll
+      stamp = self._manifest_stamp()
+      if stamp == self._stamp:
+        return
+      self._stamp = stamp
+    self.refresh()
+
+  def refresh(self):
+    """Relee el manifiesto y carga en segundo plano las versiones que cambiaron. Devuelve sus claves."""
+    try:
+      specs = read_manifest(self.manifest, self.defaults)
+    except RuntimeError as e:
+      # Puede estar a medio escribir: se vuelve a leer en la siguiente comprobación
+      print(f"{e}. Se mantienen las versiones activas.")
+      self._stamp = None
+      return []
+    changed = [key for key, spec in specs.items() if spec != self.specs.get(key)]
+    for key in changed:
+      if key in self._entries:
+        self.reload(key, specs[key])
+      else:
+        # Aún sin cargar: la nueva versión se construirá en el primer uso
+        self.specs[key] = specs[key]
+    return changed
+
+  def reload(self, key, spec=None):
+    """Construye `spec` (por defecto la especificación actual) en un hilo y la activa al terminar.
+
+    Devuelve el hilo, o None si esa misma versión ya se está cargando.
+    """
+    spec = self.specs.get(key) if spec is None else spec
+    with self._lock:
+      if self._loading.get(key) == spec:
+        return None
+      self._loading[key] = spec
+    thread = threading.Thread(target=self._swap_in, args=(key, spec), name=f'scoutml-reload-{key}', daemon=True)
+    thread.start()
+    return thread
+
+  def _swap_in(self, key, spec):
+    try:
+      entry = self.builder(key, spec)
+    except Exception as e:
+      print(f"No se pudo cargar la versión {spec.get('version')} de '{key}', se mantiene la activa: {e}")
+      entry = None
+    with self._lock:
+      # Si mientras tanto se pidió otra versión, esta ya no se activa
+      current = self._loading.get(key) is spec
+      if current:
+        del self._loading[key]
+      if entry is None or not current:
+        return
+      previous = self._entries.get(key)
+      self._entries[key] = entry
+      self.specs[key] = spec
+    for listener in self._listeners:
+      listener(key, entry, previous)
@@ -0,0 +1,16 @@
+from rest_framework.renderers import BaseRenderer
+
+from .formats import dumps
+
+
+class ORJSONRenderer(BaseRenderer):
+  """Renderer de DRF para las respuestas de predicción, sobre dumps()."""
+
+  media_type = 'application/json'
+  format = 'json'
+  charset = None
+
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    if data is None:
+      return b''
+    return dumps(data)
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .registry import FileLock, cache_dir
+
+# Versión del formato en disco; cambiarla invalida los snapshots existentes
+SNAPSHOT_FORMAT = 1
+
+# Formato del snapshot (una carpeta por dataset + lista de features):
+#   matrix.npy  features del dataset (filas x features), float64 contigua
+#   sorted.npy  cada feature ordenada (features x filas), con los NaN al final
+#   labels.npy  'Nombre Apellido (Año)' de cada fila, para el jugador comparable
+#   meta.json   features, número de filas y valores válidos por feature
+
+
+def _snapshot_dir():
+  return Path(os.getenv('SCOUTML_SNAPSHOT_DIR') or cache_dir() / 'snapshots')
+
+
+def dataset_labels(dataset: pd.DataFrame) -> np.ndarray:
+  """Etiquetas 'Nombre Apellido (Año)' de todas las filas del dataset."""
+  def columna(nombre):
+    if nombre not in dataset.columns:
+      return pd.Series([''] * len(dataset), index=dataset.index)
+    return dataset[nombre].astype(str)
+  etiquetas = columna('nameFirst') + ' ' + columna('nameLast') + ' (' + columna('yearID') + ')'
+  return etiquetas.to_numpy(dtype=str)
+
+
+def validate_features(dataset: pd.DataFrame, features):
+  """Comprueba que el dataset tiene todas las features del modelo y que son numéricas."""
+  faltantes = [f for f in features if f not in dataset.columns]
+  if faltantes:
+    raise ValueError(f"El dataset de referencia no tiene las features del modelo: {', '.join(faltantes)}")
+  no_numericas = [f for f in features if not pd.api.types.is_numeric_dtype(dataset[f])]
+  if no_numericas:
+    raise ValueError(f"Features no numéricas en el dataset de referencia: {', '.join(no_numericas)}")
+
+
+def write_snapshot(dataset: pd.DataFrame, features, path):
+  """Convierte un dataset de referencia al formato binario columnar en `path`."""
+  path = Path(path)
+  validate_features(dataset, features)
+  matrix = np.ascontiguousarray(dataset[list(features)].to_numpy(dtype=np.float64))
+  ordenadas = np.ascontiguousarray(np.sort(matrix, axis=0).T)
+  validos = (~np.isnan(matrix)).sum(axis=0)
+
+  # Se escribe en una carpeta temporal y se renombra, así nunca se lee un snapshot a medias
+  tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix='.tmp-'))
+  try:
+    np.save(tmp / 'matrix.npy', matrix)
+    np.save(tmp / 'sorted.npy', ordenadas)
+    np.save(tmp / 'labels.npy', dataset_labels(dataset))
+    meta = {
+      'format': SNAPSHOT_FORMAT,
+      'features': list(features),
+      'rows': int(len(matrix)),
+      'valid': [int(v) for v in validos],
+    }
+    (tmp / 'meta.json').write_text(json.dumps(meta))
+    if path.exists():
+      shutil.rmtree(path)
+    os.replace(tmp, path)
+  except BaseException:
+    shutil.rmtree(tmp, ignore_errors=True)
+    raise
+  return path
+
+
+class Snapshot:
+  """Snapshot de un dataset de referencia mapeado en memoria en modo solo lectura.
+
+  Todos los workers que abren el mismo snapshot comparten una única copia física
+  a través de la caché de páginas del sistema operativo.
+  """
+
+  def __init__(self, path):
+    self.path = Path(path)
+    meta = json.loads((self.path / 'meta.json').read_text())
+    self.features = meta['features']
+    self.rows = meta['rows']
+    self.valid = meta['valid']
+    self.matrix = np.load(self.path / 'matrix.npy', mmap_mode='r')
+    self.sorted = np.load(self.path / 'sorted.npy', mmap_mode='r')
+    self.labels = np.load(self.path / 'labels.npy', mmap_mode='r')
+
+  def sorted_columns(self):
+    """Columnas ordenadas y sin NaN de cada feature (vistas sin copia sobre el mapa en memoria)."""
+    return [self.sorted[j, :n] for j, n in enumerate(self.valid)]
+
+
+def snapshot_for(csv_path, features) -> Snapshot:
+  """Abre el snapshot de un CSV de referencia, creándolo la primera vez."""
+  csv_path = Path(csv_path).resolve()
+  stat = csv_path.stat()
+  # Los archivos de la caché son inmutables, así que ruta + tamaño + fecha identifican el contenido
+  key = f"{csv_path}:{stat.st_size}:{stat.st_mtime_ns}:{','.join(features)}:{SNAPSHOT_FORMAT}"
+  base = _snapshot_dir()
+  base.mkdir(parents=True, exist_ok=True)
+  path = base / f"{csv_path.stem}-{hashlib.sha256(key.encode()).hexdigest()[:16]}"
+
+  if not (path / 'meta.json').exists():
+    with FileLock(base / f".{path.name}.lock"):
+      # Otro worker pudo haberlo creado mientras se esperaba el lock
+      if not (path / 'meta.json').exists():
+        print(f"Creando snapshot de {csv_path.name}...")
+        write_snapshot(pd.read_csv(csv_path), features, path)
+  return Snapshot(path)
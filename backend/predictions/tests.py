@@ -1,3 +1,1535 @@
-from django.test import TestCase
+import asyncio
+import atexit
+import codecs
+import copy
+import datetime as dt
+import gc
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from functools import lru_cache, partial
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+import joblib
+import numpy as np
+import pandas as pd
+import requests
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+from openpyxl import Workbook
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from . import async_views, export, formats, jobs, metrics, registry, views
+from .async_views import AsyncProspectPredictionView
+from .benchmark import compare
+from .cache import PredictionCache, canonical
+from .forest import CompiledForest
+from .file_reader import PlayerFileError, PlayerFileReader, player_file, resolve_columns, sniff_type
+from .indexes import ComparableIndex, PercentileIndex
+from .renderers import ORJSONRenderer
+from .quota import Profile, QuotaExceeded, QuotaStore, quota
+from .snapshot import Snapshot, dataset_labels, snapshot_for, validate_features, write_snapshot
+
+UMBRAL = 0.7
+# Features de cada tipo de jugador (en el orden de los pesos del ranking) y nombres de sus archivos en Supabase
+FEATURES = {
+  'pitcher': ['ERA', 'WHIP', 'K/9', 'BB/9', 'K/BB', 'FPCT', 'RF'],
+  'batter': ['AVG', 'OBP', 'SLG', 'OPS', 'K%', 'BB/K', 'FPCT', 'RF'],
+}
+ARCHIVOS = {
+  'pitcher': ('Modelo_RF_Pitchers.pkl', 'Pitchers.csv'),
+  'batter': ('Modelo_RF_Bateadores.pkl', 'Bateadores.csv'),
+}
+METRICAS_INVERTIDAS = {'pitcher': ['ERA', 'WHIP', 'BB/9'], 'batter': ['K%']}
+PESOS = {
+  'pitcher': {'ERA': 0.20, 'WHIP': 0.25, 'K/9': 0.20, 'BB/9': 0.15, 'K/BB': 0.15, 'FPCT': 0.025, 'RF': 0.025},
+  'batter': {'AVG': 0.15, 'OBP': 0.20, 'SLG': 0.15, 'OPS': 0.25, 'K%': 0.10, 'BB/K': 0.05, 'FPCT': 0.05, 'RF': 0.05},
+}
+
+
+@lru_cache(maxsize=None)
+def directorio_modelos():
+  """Carpeta con modelos y datasets sintéticos, con los mismos nombres que los archivos de Supabase."""
+  directory = Path(tempfile.mkdtemp(prefix='scoutml-tests-'))
+  atexit.register(shutil.rmtree, directory, ignore_errors=True)
+  rng = np.random.default_rng(7)
+  filas = 300
+  for player_type, features in FEATURES.items():
+    X = rng.gamma(2.0, 1.0, size=(filas, len(features))).round(3)
+    dataset = pd.DataFrame(X, columns=features)
+    dataset.insert(0, 'yearID', rng.integers(1990, 2024, filas))
+    dataset.insert(0, 'nameLast', [f'Apellido{i}' for i in range(filas)])
+    dataset.insert(0, 'nameFirst', [f'Nombre{i}' for i in range(filas)])
+    y = (X[:, 0] + rng.normal(0, 1, filas) > 2).astype(int)
+    model_name, dataset_name = ARCHIVOS[player_type]
+    dataset.to_csv(directory / dataset_name, index=False)
+    scaler = StandardScaler().fit(dataset[features])
+    model = RandomForestClassifier(n_estimators=10, max_depth=8, random_state=7)
+    model.fit(scaler.transform(dataset[features]), y)
+    joblib.dump({'model': model, 'scaler': scaler, 'features': features}, directory / model_name)
+  return directory
+
+
+def cargar_predictor():
+  """Importa predictor con los artefactos leídos de directorio_modelos() (SCOUTML_MODEL_DIR), sin red."""
+  os.environ['SCOUTML_MODEL_DIR'] = str(directorio_modelos())
+  os.environ['SCOUTML_SNAPSHOT_DIR'] = str(directorio_modelos() / 'snapshots')
+  from . import predictor
+  predictor.registry.clear()
+  return predictor
+
+
+def jugadores(player_type, n, seed=3):
+  rng = np.random.default_rng(seed)
+  return [dict(zip(FEATURES[player_type], map(float, fila))) for fila in rng.gamma(2.0, 1.0, size=(n, len(FEATURES[player_type]))).round(3)]
+
+
+def reporte_original(player_data, player_type):
+  """El reporte de un jugador tal como lo calculaba single() jugador a jugador, con pandas."""
+  model_name, dataset_name = ARCHIVOS[player_type]
+  pipeline = joblib.load(directorio_modelos() / model_name)
+  dataset = pd.read_csv(directorio_modelos() / dataset_name)
+  model, scaler, features = pipeline['model'], pipeline['scaler'], pipeline['features']
+
+  cleaned = {k: player_data.get(k, 0) for k in features}
+  player_df = pd.DataFrame([cleaned], columns=features)
+  prospect_percentage = model.predict_proba(scaler.transform(player_df))[0][1]
+
+  percentiles, fortalezas, mejoras = {}, [], []
+  for m in features:
+    valor = player_data.get(m, 0)
+    invertida = m in METRICAS_INVERTIDAS[player_type]
+    percentil = int(((dataset[m] > valor).mean() if invertida else (dataset[m] < valor).mean()) * 100)
+    percentiles[m] = percentil
+    if percentil >= 80:
+      fortalezas.append({"metrica": m, "valor": valor, "percentil": percentil})
+    elif percentil <= 20:
+      mejoras.append({"metrica": m, "actual": valor, "percentil": percentil})
+  ranking = int(np.average(pd.Series(percentiles), weights=pd.Series(PESOS[player_type])))
+
+  distancias = np.linalg.norm(dataset[features].values - player_df.values.flatten(), axis=1)
+  comparable = dataset.iloc[np.argmin(distancias)]
+  return {
+    "is_prospect": bool(prospect_percentage >= UMBRAL),
+    "prospect_percentage": prospect_percentage,
+    "ranking": ranking,
+    "factores_positivos": fortalezas,
+    "factores_a_mejorar": mejoras,
+    "jugador_comparable": f"{comparable['nameFirst']} {comparable['nameLast']} ({comparable['yearID']})",
+    "calculated_stats": cleaned,
+  }
+
+
+class PredictorTestCase(SimpleTestCase):
+  """Pruebas que puntúan con los modelos sintéticos de directorio_modelos()."""
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.predictor = cargar_predictor()
+
+  def setUp(self):
+    self.predictor.prediction_cache.invalidate()
+
+  def assertReporteOriginal(self, report, player_data, player_type):
+    esperado = reporte_original(player_data, player_type)
+    self.assertAlmostEqual(report['prospect_percentage'], esperado.pop('prospect_percentage'), places=12)
+    self.assertEqual({k: report[k] for k in esperado if k != 'resumen'}, {k: v for k, v in esperado.items() if k != 'resumen'})
+
+
+class BatchTests(PredictorTestCase):
+  def test_batch_coincide_con_el_calculo_por_jugador(self):
+    for player_type in FEATURES:
+      lista = jugadores(player_type, 40)
+      # Métricas ausentes: valen 0, como antes
+      for jugador in lista[::5]:
+        jugador.pop(FEATURES[player_type][1])
+      reports = self.predictor.batch([dict(j) for j in lista], player_type)
+      self.assertEqual(len(reports), len(lista))
+      for jugador, report in zip(lista, reports):
+        self.assertReporteOriginal(report, jugador, player_type)
+
+  def test_single_igual_que_batch(self):
+    jugador = jugadores('pitcher', 1)[0]
+    report = self.predictor.batch([dict(jugador)], 'pitcher')[0]
+    for campo in ('Player', 'Birth_Date', 'Weight', 'Height'):
+      report.pop(campo)
+    self.assertEqual(self.predictor.single(dict(jugador), 'pitcher'), report)
+
+  def test_reporte_de_la_cache_es_una_copia(self):
+    jugador = jugadores('pitcher', 1)[0]
+    primero = self.predictor.single(dict(jugador), 'pitcher')
+    primero['factores_positivos'].append({'metrica': 'x'})
+    primero['calculated_stats']['ERA'] = -1
+    segundo = self.predictor.single(dict(jugador), 'pitcher')
+    self.assertNotEqual(segundo, primero)
+    self.assertReporteOriginal(segundo, jugador, 'pitcher')
+
+  def test_solo_se_puntuan_los_jugadores_que_no_estan_en_la_cache(self):
+    lista = jugadores('batter', 10)
+    self.predictor.batch([dict(j) for j in lista[:6]], 'batter')
+    antes = self.predictor.prediction_cache.stats()
+    reports = self.predictor.batch([dict(j) for j in lista], 'batter')
+    despues = self.predictor.prediction_cache.stats()
+    self.assertEqual((despues['hits'] - antes['hits'], despues['misses'] - antes['misses']), (6, 4))
+    for jugador, report in zip(lista, reports):
+      self.assertReporteOriginal(report, jugador, 'batter')
+
+  def test_datos_personales_en_batch(self):
+    jugador = dict(jugadores('batter', 1)[0], name='Ana Díaz', birth_date='2004-05-06', weight=80.0, height=180)
+    report = self.predictor.batch([jugador], 'batter')[0]
+    self.assertEqual((report['Player'], report['Birth_Date'], report['Weight'], report['Height']), ('Ana Díaz', '2004-05-06', 80.0, 180))
+    self.assertEqual(self.predictor.batch([{}], 'batter')[0]['Player'], 'Nombre Desconocido')
+
+  def test_batch_con_dataframe_igual_que_con_dicts(self):
+    # Con las columnas de datos personales de player_file(as_frame=True)
+    lista = [dict(j, name=f'Jugador {i}', birth_date='2004-05-06', weight=80.0, height=180) for i, j in enumerate(jugadores('batter', 30))]
+    desde_dicts = self.predictor.batch([dict(j) for j in lista], 'batter')
+    self.assertEqual(self.predictor.batch(pd.DataFrame(lista), 'batter'), desde_dicts)
+
+  def test_dataframe_sin_datos_personales(self):
+    lista = jugadores('batter', 3)
+    reports = self.predictor.batch(pd.DataFrame(lista), 'batter')
+    self.assertEqual(reports, self.predictor.batch([dict(j) for j in lista], 'batter'))
+    self.assertEqual([r['Player'] for r in reports], ['Nombre Desconocido'] * 3)
+
+  def test_hilos_y_procesos_igual_que_en_serie(self):
+    self.addCleanup(self.predictor._reset_pools)
+    lista = jugadores('batter', 600)
+    en_serie = self.predictor.batch([dict(j) for j in lista], 'batter')
+    for executor in ('thread', 'process'):
+      self.predictor.prediction_cache.invalidate()
+      en_paralelo = self.predictor.batch([dict(j) for j in lista], 'batter', workers=2, executor=executor)
+      self.assertEqual(en_paralelo, en_serie, executor)
+    frame = pd.DataFrame(lista)
+    self.predictor.prediction_cache.invalidate()
+    self.assertEqual(self.predictor.batch(frame, 'batter', workers=2, executor='process'), en_serie)
+
+  def test_hilos_por_defecto(self):
+    self.predictor._reset_pools()
+    self.addCleanup(self.predictor._reset_pools)
+    with mock.patch.dict(os.environ, {'SCOUTML_BATCH_WORKERS': '2'}):
+      os.environ.pop('SCOUTML_BATCH_EXECUTOR', None)
+      self.predictor.batch(jugadores('batter', 600), 'batter')
+    self.assertEqual(list(self.predictor._pools), [('thread', 2)])
+
+  def test_tipo_de_jugador_invalido(self):
+    self.assertEqual(self.predictor.single({}, 'goalie'), {"error": "Tipo de jugador no válido."})
+    # Un error por jugador también con un DataFrame (no uno por columna)
+    frame = pd.DataFrame(jugadores('batter', 3))
+    self.assertEqual([r['error'] for r in self.predictor.batch(frame, 'goalie')], ["Tipo de jugador no válido."] * 3)
+
+  def test_reportes_indican_la_version_del_modelo(self):
+    bundle = self.predictor.registry.get('pitcher')
+    report = self.predictor.single(jugadores('pitcher', 1)[0], 'pitcher')
+    self.assertEqual(report['model_version'], bundle.version)
+
+
+def indice_percentiles(dataset, features, invertidas):
+  return PercentileIndex.from_matrix(dataset[features].to_numpy(), features, invertidas)
+
+
+class PercentileIndexTests(SimpleTestCase):
+  def setUp(self):
+    rng = np.random.default_rng(11)
+    # Valores repetidos (empates) y NaN en el dataset de referencia
+    self.dataset = pd.DataFrame({'ERA': rng.integers(0, 10, 200).astype(float), 'K/9': rng.gamma(2.0, 1.0, 200)})
+    self.dataset.loc[::17, 'K/9'] = np.nan
+    self.index = indice_percentiles(self.dataset, ['ERA', 'K/9'], ['ERA'])
+
+  def test_igual_que_recorrer_el_dataset_con_pandas(self):
+    k9 = self.dataset['K/9'].iloc[1]
+    valores = [[era, w] for era in (-1, 0, 3, 3.5, 9, 12, np.nan) for w in (0.0, 1.5, k9, 100, np.nan)]
+    esperado = [[int((self.dataset['ERA'] > era).mean() * 100), int((self.dataset['K/9'] < w).mean() * 100)] for era, w in valores]
+    np.testing.assert_array_equal(self.index.percentiles(np.array(valores)), esperado)
+
+  def test_percentil_de_un_valor(self):
+    self.assertEqual(self.index.percentile('ERA', 3), int((self.dataset['ERA'] > 3).mean() * 100))
+    self.assertEqual(self.index.percentile('K/9', 2.0), int((self.dataset['K/9'] < 2.0).mean() * 100))
+
+
+def indice_comparables(dataset, features):
+  return ComparableIndex(dataset[features].to_numpy(), dataset_labels(dataset), features)
+
+
+class ComparableIndexTests(SimpleTestCase):
+  def setUp(self):
+    rng = np.random.default_rng(5)
+    self.features = ['AVG', 'OBP', 'SLG']
+    self.dataset = pd.DataFrame(rng.gamma(2.0, 1.0, size=(300, 3)), columns=self.features)
+    self.dataset.insert(0, 'yearID', rng.integers(1990, 2024, 300))
+    self.dataset.insert(0, 'nameLast', [f'Apellido{i}' for i in range(300)])
+    self.dataset.insert(0, 'nameFirst', [f'Nombre{i}' for i in range(300)])
+    self.dataset.loc[7, 'OBP'] = np.nan
+    self.index = indice_comparables(self.dataset, self.features)
+
+  def test_igual_que_la_busqueda_por_fuerza_bruta(self):
+    puntos = np.random.default_rng(6).gamma(2.0, 1.0, size=(50, 3))
+    distancias, posiciones = self.index.query(puntos, k=3)
+    matriz = self.dataset[self.features].to_numpy()
+    for punto, distancia, posicion in zip(puntos, distancias, posiciones):
+      todas = np.linalg.norm(matriz - punto, axis=1)
+      # Las filas con NaN no tienen distancia definida
+      esperadas = np.argsort(np.where(np.isnan(todas), np.inf, todas))[:3]
+      np.testing.assert_array_equal(posicion, esperadas)
+      np.testing.assert_allclose(distancia, todas[esperadas])
+
+  def test_etiqueta_del_comparable(self):
+    _, posiciones = self.index.query(self.dataset.loc[[42], self.features].to_numpy(), k=1)
+    self.assertEqual(self.index.label(posiciones[0, 0]), f"Nombre42 Apellido42 ({self.dataset.loc[42, 'yearID']})")
+
+
+class _Descarga:
+  def __init__(self, status_code, content=b'', etag=None):
+    self.status_code, self.content, self.headers = status_code, content, {'ETag': etag} if etag else {}
+
+  def raise_for_status(self):
+    if self.status_code >= 400:
+      raise requests.HTTPError(self.status_code)
+
+  def iter_content(self, size):
+    yield self.content
+
+
+class FetchTests(SimpleTestCase):
+  url = 'https://example.com/ml_models/Pitchers.csv'
+
+  def setUp(self):
+    cache = tempfile.mkdtemp(prefix='scoutml-cache-')
+    self.addCleanup(shutil.rmtree, cache, ignore_errors=True)
+    env = mock.patch.dict(os.environ, {'SCOUTML_MODEL_CACHE_DIR': cache, 'SCOUTML_MODEL_CACHE_TTL': '0'})
+    env.start()
+    self.addCleanup(env.stop)
+    os.environ.pop('SCOUTML_MODEL_DIR', None)
+
+  def test_carpeta_local_sin_red(self):
+    with mock.patch.dict(os.environ, {'SCOUTML_MODEL_DIR': str(directorio_modelos())}), mock.patch('requests.get') as get:
+      self.assertEqual(registry.fetch(self.url), directorio_modelos() / 'Pitchers.csv')
+      with self.assertRaises(RuntimeError):
+        registry.fetch('https://example.com/ml_models/Otro.csv')
+    get.assert_not_called()
+
+  def test_revalida_con_etag_y_sin_red_usa_la_cache(self):
+    with mock.patch('requests.get', return_value=_Descarga(200, b'a,b\n1,2\n', etag='"v1"')):
+      path = registry.fetch(self.url)
+    self.assertEqual(path.read_bytes(), b'a,b\n1,2\n')
+
+    with mock.patch('requests.get', return_value=_Descarga(304)) as get:
+      self.assertEqual(registry.fetch(self.url), path)
+    self.assertEqual(get.call_args.kwargs['headers'], {'If-None-Match': '"v1"'})
+
+    with mock.patch('requests.get', side_effect=requests.ConnectionError('sin red')):
+      self.assertEqual(registry.fetch(self.url), path)
+
+  def test_copia_reciente_no_se_revalida(self):
+    with mock.patch('requests.get', return_value=_Descarga(200, b'x')):
+      path = registry.fetch(self.url)
+    with mock.patch.dict(os.environ, {'SCOUTML_MODEL_CACHE_TTL': '600'}), mock.patch('requests.get') as get:
+      self.assertEqual(registry.fetch(self.url), path)
+    get.assert_not_called()
+
+  def test_sin_red_ni_cache_es_un_error(self):
+    with mock.patch('requests.get', side_effect=requests.ConnectionError('sin red')), self.assertRaises(RuntimeError):
+      registry.fetch(self.url)
+
+
+class ModelRegistryTests(SimpleTestCase):
+  def setUp(self):
+    self.directory = Path(tempfile.mkdtemp())
+    self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+    self.manifest = self.directory / 'manifest.json'
+    self.construidos, self.escrituras = [], 0
+    self.escribir({'pitcher': {'version': 'v1', 'model': 'v1.pkl'}})
+
+  def escribir(self, manifest):
+    self.manifest.write_text(json.dumps(manifest))
+    # Otra fecha en cada escritura: el cambio se ve aunque el sistema de archivos tenga poca resolución
+    self.escrituras += 1
+    os.utime(self.manifest, ns=(0, self.manifest.stat().st_mtime_ns + self.escrituras))
+
+  def builder(self, key, spec):
+    if spec['model'].endswith('roto.pkl'):
+      raise RuntimeError("pkl corrupto")
+    self.construidos.append((key, spec['version']))
+    return {'key': key, 'version': spec['version'], 'model': spec['model']}
+
+  def registry(self):
+    defaults = {'pitcher': {'model': 'https://x/p.pkl', 'dataset': 'https://x/p.csv'}, 'batter': {'model': 'https://x/b.pkl', 'dataset': 'https://x/b.csv'}}
+    return registry.ModelRegistry(self.builder, defaults, manifest=str(self.manifest), poll=0)
+
+  def test_carga_cada_clave_una_sola_vez(self):
+    construidos = []
+
+    def builder(key, spec):
+      construidos.append(key)
+      return object()
+
+    models = registry.ModelRegistry(builder)
+    self.assertEqual(models.loaded(), [])
+    hilos = [threading.Thread(target=models.get, args=('pitcher',)) for _ in range(8)]
+    for hilo in hilos:
+      hilo.start()
+    for hilo in hilos:
+      hilo.join()
+    self.assertIs(models.get('pitcher'), models.get('pitcher'))
+    self.assertEqual(construidos, ['pitcher'])
+    models.clear()
+    models.get('pitcher')
+    self.assertEqual(construidos, ['pitcher', 'pitcher'])
+
+  def test_manifiesto_y_valores_por_defecto(self):
+    models = self.registry()
+    self.assertEqual(models.get('pitcher')['model'], str(self.directory.resolve() / 'v1.pkl'))
+    self.assertEqual(models.get('pitcher')['version'], 'v1')
+    self.assertEqual(models.get('batter'), {'key': 'batter', 'version': None, 'model': 'https://x/b.pkl'})
+
+  def test_cambio_de_version_en_segundo_plano(self):
+    models = self.registry()
+    activo = models.get('pitcher')
+    models.get('batter')
+    cambios = []
+    models.on_swap(lambda key, nueva, anterior: cambios.append((key, nueva['version'], anterior['version'])))
+
+    self.escribir({'pitcher': {'version': 'v2', 'model': 'v2.pkl'}})
+    self.assertEqual(models.refresh(), ['pitcher'])
+    for thread in threading.enumerate():
+      if thread.name == 'scoutml-reload-pitcher':
+        thread.join()
+    self.assertEqual(models.get('pitcher')['version'], 'v2')
+    self.assertEqual(cambios, [('pitcher', 'v2', 'v1')])
+    # Quien ya tenía la versión anterior la sigue usando
+    self.assertEqual(activo['version'], 'v1')
+
+  def test_version_que_no_carga_mantiene_la_activa(self):
+    models = self.registry()
+    models.get('pitcher')
+    models.reload('pitcher', dict(models.specs['pitcher'], version='v2', model='roto.pkl')).join()
+    self.assertEqual(models.get('pitcher')['version'], 'v1')
+    self.assertEqual(models.specs['pitcher']['version'], 'v1')
+
+  def test_manifiesto_ilegible_mantiene_las_versiones(self):
+    models = self.registry()
+    models.get('pitcher')
+    self.manifest.write_text('{roto')
+    self.assertEqual(models.refresh(), [])
+    self.assertEqual(models.get('pitcher')['version'], 'v1')
+
+  def test_pin_deja_de_seguir_el_manifiesto(self):
+    models = self.registry()
+    models.get('pitcher')
+    models.pin()
+    self.escribir({'pitcher': {'version': 'v2', 'model': 'v2.pkl'}})
+    models.get('pitcher')
+    self.assertEqual(self.construidos, [('pitcher', 'v1')])
+
+  def test_la_version_del_manifiesto_llega_al_bundle(self):
+    predictor = cargar_predictor()
+    model_name, dataset_name = ARCHIVOS['pitcher']
+    self.escribir({'pitcher': {'version': 'v7', 'model': str(directorio_modelos() / model_name), 'dataset': str(directorio_modelos() / dataset_name)}})
+    models = registry.ModelRegistry(predictor._load_bundle, {'pitcher': {}}, manifest=str(self.manifest), poll=0)
+    bundle = models.get('pitcher')
+    self.assertEqual(bundle.version, 'v7')
+    self.assertNotEqual(bundle.fingerprint, 'v7')
+
+
+class SnapshotTests(SimpleTestCase):
+  def setUp(self):
+    self.directory = Path(tempfile.mkdtemp(prefix='scoutml-snapshots-'))
+    self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+    self.features = FEATURES['batter']
+    self.dataset = pd.read_csv(directorio_modelos() / 'Bateadores.csv')
+    self.dataset.loc[::13, 'OBP'] = np.nan
+
+  def test_ida_y_vuelta_en_solo_lectura(self):
+    snapshot = Snapshot(write_snapshot(self.dataset, self.features, self.directory / 'bateadores'))
+    matriz = self.dataset[self.features].to_numpy()
+    np.testing.assert_array_equal(snapshot.matrix, matriz)
+    for columna, ordenada in zip(matriz.T, snapshot.sorted_columns()):
+      np.testing.assert_array_equal(ordenada, np.sort(columna[~np.isnan(columna)]))
+    self.assertEqual(list(snapshot.labels), list(dataset_labels(self.dataset)))
+    self.assertEqual((snapshot.features, snapshot.rows), (self.features, len(self.dataset)))
+    # Mapeado en memoria y de solo lectura: los workers comparten las páginas
+    for array in (snapshot.matrix, snapshot.sorted, snapshot.labels):
+      self.assertIsInstance(array, np.memmap)
+      self.assertFalse(array.flags.writeable)
+
+  def test_escritura_fallida_conserva_el_snapshot_anterior(self):
+    path = write_snapshot(self.dataset, self.features, self.directory / 'bateadores')
+    with mock.patch('numpy.save', side_effect=OSError('disco lleno')), self.assertRaises(OSError):
+      write_snapshot(self.dataset.iloc[:10], self.features, path)
+    self.assertEqual(Snapshot(path).rows, len(self.dataset))
+    # Sin carpetas temporales a medias
+    self.assertEqual([p.name for p in self.directory.iterdir()], ['bateadores'])
+
+  def test_snapshot_for_se_crea_una_sola_vez(self):
+    csv = self.directory / 'Bateadores.csv'
+    self.dataset.to_csv(csv, index=False)
+    with mock.patch.dict(os.environ, {'SCOUTML_SNAPSHOT_DIR': str(self.directory / 'cache')}):
+      primero = snapshot_for(csv, self.features)
+      with mock.patch(f'{__package__}.snapshot.write_snapshot') as escribir:
+        self.assertEqual(snapshot_for(csv, self.features).path, primero.path)
+      escribir.assert_not_called()
+      # Otra lista de features es otro snapshot
+      self.assertNotEqual(snapshot_for(csv, self.features[:3]).path, primero.path)
+
+
+  def test_comando_build_snapshots(self):
+    cargar_predictor()
+    salida = io.StringIO()
+    with mock.patch.dict(os.environ, {'SCOUTML_SNAPSHOT_DIR': str(self.directory / 'cache')}):
+      call_command('build_snapshots', stdout=salida)
+    lineas = salida.getvalue().splitlines()
+    self.assertEqual([linea.split(':')[0] for linea in lineas], ['pitcher (-)', 'batter (-)'])
+    self.assertTrue(all(linea.split(': ')[1].startswith('300 filas en ') for linea in lineas))
+    self.assertEqual(sorted(p.parent.name.split('-')[0] for p in (self.directory / 'cache').glob('*/meta.json')), ['Bateadores', 'Pitchers'])
+
+class FileReaderTests(SimpleTestCase):
+  BATEADOR = {'Nombre': 'josé', 'Apellido': 'pérez', 'Fecha de Nacimiento': '2004-05-06', 'AB': 100, 'H': 30, '2B': 5, '3B': 1,
+              'HR': 4, 'BB': 10, 'SO': 20, 'HBP': 2, 'SF': 3, 'PO': 40, 'A': 10, 'E': 2, 'G': 25}
+
+  def archivo(self, contenido, nombre='jugadores.csv'):
+    path = Path(tempfile.mkdtemp(prefix='scoutml-archivo-')) / nombre
+    self.addCleanup(shutil.rmtree, path.parent, ignore_errors=True)
+    path.write_bytes(contenido)
+    return str(path)
+
+  def leer(self, filas, **kwargs):
+    return player_file(self.archivo(pd.DataFrame(filas).to_csv(index=False).encode()), 'csv', **kwargs)
+
+  def test_estadisticas_derivadas_de_bateo(self):
+    jugador = self.leer([self.BATEADOR])[0]
+    self.assertEqual(jugador['name'], 'José Pérez')
+    self.assertEqual(jugador['birth_date'], '2004-05-06')
+    self.assertEqual(jugador['position'], 'batter')
+    self.assertAlmostEqual(jugador['AVG'], 0.3)
+    self.assertAlmostEqual(jugador['OBP'], 42 / 115)
+    self.assertAlmostEqual(jugador['SLG'], (20 + 10 + 3 + 16) / 100)
+    self.assertAlmostEqual(jugador['OPS'], jugador['OBP'] + jugador['SLG'])
+    self.assertAlmostEqual(jugador['K%'], 20.0)
+    self.assertAlmostEqual(jugador['BB/K'], 0.5)
+    self.assertAlmostEqual(jugador['FPCT'], 50 / 52)
+    self.assertAlmostEqual(jugador['RF'], 2.0)
+
+  def test_estadisticas_derivadas_de_pitcheo_y_division_por_cero(self):
+    jugadores = self.leer([{'IP': 9, 'ER': 3, 'H': 6, 'BB': 3, 'SO': 9}, {'IP': 0, 'ER': 1, 'H': 0, 'BB': 0, 'SO': 0}])
+    self.assertEqual(jugadores[0]['position'], 'pitcher')
+    self.assertAlmostEqual(jugadores[0]['ERA'], 3.0)
+    self.assertAlmostEqual(jugadores[0]['WHIP'], 1.0)
+    self.assertAlmostEqual(jugadores[0]['K/BB'], 3.0)
+    self.assertEqual((jugadores[1]['ERA'], jugadores[1]['K/BB']), (0, 0))
+
+  def test_columna_derivada_del_archivo_tiene_prioridad(self):
+    jugadores = self.leer([dict(self.BATEADOR, AVG=0.412), dict(self.BATEADOR, AVG=None)])
+    # Si la celda está vacía se usa el valor calculado
+    self.assertEqual([j['AVG'] for j in jugadores], [0.412, 0.3])
+
+  def test_dataframe_igual_que_lista_de_dicts(self):
+    filas = [dict(self.BATEADOR, AB=100 + i, **{'Fecha de Nacimiento': 'no es una fecha'} if i == 2 else {}) for i in range(4)]
+    frame = self.leer(filas, as_frame=True)
+    self.assertIsInstance(frame, pd.DataFrame)
+    self.assertEqual(frame.to_dict('records'), self.leer(filas))
+    self.assertEqual(frame['birth_date'].iloc[2], 'no es una fecha')
+
+  def test_xlsx_igual_que_csv(self):
+    workbook = Workbook()
+    workbook.active.append(list(self.BATEADOR))
+    for i in range(3):
+      workbook.active.append(list(dict(self.BATEADOR, AB=100 + i).values()))
+    output = io.BytesIO()
+    workbook.save(output)
+    xlsx = player_file(self.archivo(output.getvalue(), 'jugadores.xlsx'), 'xlsx')
+    self.assertEqual(xlsx, self.leer([dict(self.BATEADOR, AB=100 + i) for i in range(3)]))
+
+  def test_reintenta_con_latin1_sin_repetir_filas(self):
+    filas = [dict(self.BATEADOR, AB=100 + i, Nombre='josé' if i == 3 else 'ana') for i in range(5)]
+    path = self.archivo(pd.DataFrame(filas).to_csv(index=False).encode('latin1'))
+    # El carácter latin1 aparece después del primer bloque ya entregado
+    jugadores = pd.concat(list(PlayerFileReader(path, chunksize=2)), ignore_index=True)
+    self.assertEqual(list(jugadores['AB']), [100, 101, 102, 103, 104])
+    self.assertEqual(jugadores['name'][3], 'José Pérez')
+
+  def test_limite_y_truncado(self):
+    path = self.archivo(pd.DataFrame([dict(self.BATEADOR, AB=100 + i) for i in range(5)]).to_csv(index=False).encode())
+    reader = PlayerFileReader(path, chunksize=2, limit=3)
+    self.assertEqual(list(pd.concat(list(reader), ignore_index=True)['AB']), [100, 101, 102])
+    self.assertEqual((reader.rows_read, reader.truncated), (3, True))
+
+    reader = PlayerFileReader(path, chunksize=2, limit=5)
+    self.assertEqual(sum(len(chunk) for chunk in reader), 5)
+    self.assertFalse(reader.truncated)
+
+  def test_errores_de_lectura(self):
+    with self.assertRaises(PlayerFileError):
+      list(PlayerFileReader('/no/existe.csv'))
+    with self.assertRaises(PlayerFileError):
+      list(PlayerFileReader(self.archivo(b'AB,H\n1,2\n'), 'pdf'))
+    self.assertEqual(player_file('/no/existe.csv'), {"error": "Archivo no encontrado en la ruta especificada."})
+
+  def test_reconoce_el_tipo_por_el_contenido(self):
+    self.assertEqual(sniff_type(b'PK\x03\x04resto'), 'xlsx')
+    self.assertEqual(sniff_type(b'AB,H\n1,2\n'), 'csv')
+    self.assertIsNone(sniff_type(b'%PDF-1.7'))
+    self.assertIsNone(sniff_type(b'\xd0\xcf\x11\xe0'))
+    self.assertIsNone(sniff_type(b'AB\x00H'))
+    self.assertIn('error', player_file(b'%PDF-1.7 binario'))
+    # La extensión no decide el formato
+    self.assertEqual(player_file(self.archivo(pd.DataFrame([self.BATEADOR]).to_csv(index=False).encode(), 'jugadores.xlsx')), self.leer([self.BATEADOR]))
+
+  def test_bytes_y_archivos_en_memoria_igual_que_una_ruta(self):
+    contenido = pd.DataFrame([dict(self.BATEADOR, AB=100 + i) for i in range(3)]).to_csv(index=False).encode('latin1')
+    desde_ruta = player_file(self.archivo(contenido))
+    self.assertEqual(desde_ruta[0]['name'], 'José Pérez')
+    self.assertEqual(player_file(contenido), desde_ruta)
+    self.assertEqual(player_file(io.BytesIO(contenido)), desde_ruta)
+    self.assertEqual(player_file(SimpleUploadedFile('jugadores.csv', contenido)), desde_ruta)
+
+  def test_alias_y_coincidencia_aproximada(self):
+    mapped = resolve_columns(('turnos_al_bate', 'hits', 'homeruns', 'pdb', 'xb', 'cms'))
+    self.assertEqual(mapped['AB'], 'turnos_al_bate')
+    self.assertEqual(mapped['H'], 'hits')
+    self.assertEqual(mapped['HR'], 'homeruns')
+    self.assertEqual(mapped['AVG'], 'pdb')
+    # Cabeceras y alias cortos nunca coinciden de forma aproximada
+    self.assertIsNone(mapped['2B'])
+    self.assertIsNone(mapped['estatura'])
+    # Entre dos cabeceras del mismo campo gana el alias de más prioridad
+    self.assertEqual(resolve_columns(('player', 'nombre'))['nombre'], 'nombre')
+
+  def test_aproximada_solo_con_las_mismas_palabras(self):
+    # Una errata en una palabra sí; otra palabra que se parece en conjunto, no
+    mapped = resolve_columns(('juegos_ganados', 'carreras_limpia', 'hits_totale'))
+    self.assertIsNone(mapped['G'])
+    self.assertEqual(mapped['ER'], 'carreras_limpia')
+    self.assertEqual(mapped['H'], 'hits_totale')
+    self.assertIsNone(resolve_columns(('juegos_perdidos',))['G'])
+
+
+class _Response:
+  def __init__(self, data):
+    self.data = data
+
+
+class _Query:
+  # Subconjunto del query builder de supabase-py que usa QuotaStore
+  def __init__(self, db, table):
+    self.db, self.table_name, self.filters, self.payload, self.one = db, table, [], None, False
+
+  def select(self, *args):
+    return self
+
+  def update(self, payload):
+    self.payload = payload
+    return self
+
+  def eq(self, column, value):
+    self.filters.append((column, value))
+    return self
+
+  def is_(self, column, value):
+    self.filters.append((column, None))
+    return self
+
+  def single(self):
+    self.one = True
+    return self
+
+  def execute(self):
+    rows = [row for row in self.db.rows if all(row.get(k) == v for k, v in self.filters)]
+    if self.payload is not None:
+      self.db.before_update()
+      # Se vuelve a filtrar: otro proceso pudo cambiar la fila entre la lectura y la escritura
+      rows = [row for row in rows if all(row.get(k) == v for k, v in self.filters)]
+      for row in rows:
+        row.update(self.payload)
+      self.db.updates += 1
+      return _Response(copy.deepcopy(rows))
+    self.db.selects += 1
+    if self.one:
+      return _Response(copy.deepcopy(rows[0]) if rows else None)
+    return _Response(copy.deepcopy(rows))
+
+
+class _FakeSupabase:
+  """Tabla `profiles` en memoria."""
+
+  def __init__(self, **profile):
+    self.rows = [{'user_id': 'u1', 'plan': 'avanzado', 'prediction_count': 0, 'last_prediction_date': None, **profile}]
+    self.selects = self.updates = 0
+    self.before_update = lambda: None
+
+  def table(self, name):
+    return _Query(self, name)
+
+  @property
+  def row(self):
+    return self.rows[0]
+
+
+class _AsyncQuery:
+  # El cliente asíncrono usa los mismos builders; solo execute() es awaitable
+  def __init__(self, query):
+    self.query = query
+
+  def __getattr__(self, name):
+    attr = getattr(self.query, name)
+    if name == 'execute':
+      async def execute():
+        return attr()
+      return execute
+    return lambda *args: _AsyncQuery(attr(*args))
+
+
+class _AsyncSupabase:
+  def __init__(self, db):
+    self.db = db
+
+  def table(self, name):
+    return _AsyncQuery(self.db.table(name))
+
+
+def perfiles_en_memoria(test):
+  """Sustituye la tabla `profiles` de Supabase (clientes síncrono y asíncrono) durante la prueba."""
+  db = _FakeSupabase()
+  for target, client in (('get_supabase', lambda: db), ('get_async_supabase', supabase_asincrono(db))):
+    patcher = mock.patch(f'backend.predictions.quota.{target}', client)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+  quota.invalidate()
+  test.addCleanup(quota.invalidate)
+  return db
+
+
+def supabase_asincrono(db):
+  """Sustituto de get_async_supabase() sobre la tabla en memoria de `db`."""
+  async def get_async_supabase():
+    return _AsyncSupabase(db)
+  return get_async_supabase
+
+
+class QuotaStoreTests(SimpleTestCase):
+  def setUp(self):
+    self.db = _FakeSupabase()
+    patcher = mock.patch('backend.predictions.quota.get_supabase', return_value=self.db)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.quota = QuotaStore(ttl=30)
+
+  def test_reserva_y_confirma_lo_usado(self):
+    reservation = self.quota.reserve('u1', 100)
+    self.assertEqual(reservation.granted, 100)
+    self.assertEqual(self.db.row['prediction_count'], 100)
+    self.quota.commit(reservation, 40)
+    self.assertEqual(self.db.row['prediction_count'], 40)
+    # Una reserva ya cerrada no devuelve nada más
+    self.quota.release(reservation)
+    self.assertEqual(self.db.row['prediction_count'], 40)
+
+  def test_release_devuelve_toda_la_reserva(self):
+    reservation = self.quota.reserve('u1', 10)
+    self.quota.release(reservation)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+  def test_reserva_limitada_a_lo_disponible(self):
+    self.db.row.update(prediction_count=495, last_prediction_date=datetime.now().isoformat())
+    self.assertEqual(self.quota.reserve('u1', 100).granted, 5)
+    with self.assertRaises(QuotaExceeded):
+      self.quota.reserve('u1', 1)
+
+  def test_escritura_concurrente_se_reintenta(self):
+    self.quota.profile('u1')
+
+    def otro_proceso():
+      # Otro worker reserva entre la lectura y la escritura de esta petición
+      self.db.before_update = lambda: None
+      self.db.row.update(prediction_count=498, last_prediction_date=datetime.now().isoformat())
+    self.db.before_update = otro_proceso
+
+    reservation = self.quota.reserve('u1', 10)
+    self.assertEqual(reservation.granted, 2)
+    self.assertEqual(self.db.row['prediction_count'], 500)
+
+  def test_contador_se_reinicia_con_otro_año_y_mismo_mes(self):
+    hace_un_año = datetime.now().replace(year=datetime.now().year - 1, day=1)
+    self.db.row.update(plan='gratis', prediction_count=1, last_prediction_date=hace_un_año.isoformat())
+    self.assertEqual(self.quota.profile('u1').available, 1)
+    self.quota.reserve('u1')
+    self.assertEqual(self.db.row['prediction_count'], 1)
+
+  def test_perfil_en_cache_hasta_el_ttl(self):
+    self.quota.profile('u1')
+    self.quota.profile('u1')
+    self.assertEqual(self.db.selects, 1)
+    self.assertEqual(self.quota.profile('u1', refresh=True).plan, 'avanzado')
+    self.assertEqual(self.db.selects, 2)
+
+  def test_contador_del_mes_actual_se_conserva(self):
+    profile = Profile('u1', 'gratis', 1, datetime.now().isoformat())
+    self.assertEqual(profile.prediction_count, 1)
+    self.assertEqual(profile.available, 0)
+
+  def test_cover_amplia_la_reserva_hasta_lo_disponible(self):
+    self.db.row.update(prediction_count=490, last_prediction_date=datetime.now().isoformat())
+    reservation = self.quota.reserve('u1', 1)
+    self.assertEqual(self.quota.cover(reservation, 4), 4)
+    self.assertEqual((reservation.granted, self.db.row['prediction_count']), (4, 494))
+    # Lo ya cubierto no se vuelve a reservar
+    self.assertEqual(self.quota.cover(reservation, 3), 3)
+    self.assertEqual(self.quota.cover(reservation, 20), 10)
+    self.assertEqual((reservation.granted, self.db.row['prediction_count']), (10, 500))
+    self.quota.commit(reservation, 8)
+    self.assertEqual(self.db.row['prediction_count'], 498)
+    # Una reserva ya liquidada no crece
+    self.assertEqual(self.quota.cover(reservation, 12), 10)
+    self.assertEqual(self.db.row['prediction_count'], 498)
+
+  def test_confirm_plan_relee_un_plan_cambiado_en_otro_proceso(self):
+    self.db.row['plan'] = 'gratis'
+    cached = self.quota.profile('u1')
+    self.db.row['plan'] = 'avanzado'
+    self.assertEqual(self.quota.profile('u1').plan, 'gratis')
+    self.assertEqual(self.quota.confirm_plan(cached, 'avanzado').plan, 'avanzado')
+
+  def test_confirm_plan_no_relee_si_el_plan_coincide(self):
+    cached = self.quota.profile('u1')
+    self.quota.confirm_plan(cached, 'avanzado')
+    self.assertEqual(self.db.selects, 1)
+
+  async def test_reserva_asincrona(self):
+    with mock.patch('backend.predictions.quota.get_async_supabase', supabase_asincrono(self.db)):
+      reservation = await self.quota.areserve('u1', 10)
+      self.assertEqual(self.db.row['prediction_count'], 10)
+      await self.quota.acommit(reservation, 3)
+    self.assertEqual(self.db.row['prediction_count'], 3)
+
+
+class PredictionCacheTests(SimpleTestCase):
+  def test_claves_canonicas(self):
+    self.assertEqual(canonical(0.3), canonical(np.float64(0.3)))
+    self.assertEqual(canonical(3), canonical(np.int64(3)))
+    self.assertNotEqual(canonical(0.3), canonical('0.3'))
+    self.assertEqual(canonical(float('nan')), canonical(np.nan))
+
+  def test_lru_y_caducidad(self):
+    cache = PredictionCache(maxsize=2, ttl=60, db_path='')
+    cache.set_many([(('batter', 'v1', 1), 'a'), (('batter', 'v1', 2), 'b')])
+    cache.get(('batter', 'v1', 1))
+    cache.set_many([(('batter', 'v1', 3), 'c')])
+    # Se descarta el menos usado recientemente
+    self.assertIsNone(cache.get(('batter', 'v1', 2)))
+    self.assertEqual(cache.get(('batter', 'v1', 1)), 'a')
+    self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (2, 1))
+
+    caducada = PredictionCache(maxsize=2, ttl=0, db_path='')
+    caducada.set_many([(('batter', 'v1', 1), 'a')])
+    self.assertIsNone(caducada.get(('batter', 'v1', 1)))
+
+  def test_otra_version_del_modelo_no_coincide(self):
+    cache = PredictionCache(maxsize=10, ttl=60, db_path='')
+    cache.set_many([(('pitcher', 'v1', 1), 'a'), (('batter', 'v1', 1), 'b')])
+    self.assertIsNone(cache.get(('pitcher', 'v2', 1)))
+    cache.invalidate('pitcher')
+    self.assertIsNone(cache.get(('pitcher', 'v1', 1)))
+    self.assertEqual(cache.get(('batter', 'v1', 1)), 'b')
+
+  def test_capa_en_disco_compartida_entre_procesos(self):
+    directory = tempfile.mkdtemp(prefix='scoutml-cache-')
+    self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    db_path = str(Path(directory) / 'reports.db')
+    PredictionCache(maxsize=10, ttl=60, db_path=db_path).set_many([(('batter', 'v1', 1), {'ranking': 50})])
+    otro = PredictionCache(maxsize=10, ttl=60, db_path=db_path)
+    self.assertEqual(otro.get(('batter', 'v1', 1)), {'ranking': 50})
+    self.assertEqual(otro.stats()['disk_hits'], 1)
+
+
+# URLs de las pruebas de vistas asíncronas (con ASGI, predictions/urls.py monta estas mismas vistas)
+urlpatterns = [path('api/predictions/predict/', AsyncProspectPredictionView.as_view())]
+
+
+class VistaTestCase(PredictorTestCase):
+  """Pruebas de las vistas con la tabla de perfiles en memoria y los archivos subidos en una carpeta temporal."""
+
+  def setUp(self):
+    super().setUp()
+    self.db = perfiles_en_memoria(self)
+    self.media = Path(tempfile.mkdtemp(prefix='scoutml-media-'))
+    self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+    settings = override_settings(MEDIA_ROOT=str(self.media))
+    settings.enable()
+    self.addCleanup(settings.disable)
+
+  def archivo(self, n, nombre='jugadores.csv', contenido=None):
+    filas = [dict(zip(FEATURES['batter'], fila), nombre=f'Jugador {i}') for i, fila in enumerate(jugadores('batter', n))]
+    if contenido is None:
+      contenido = pd.DataFrame(filas).to_csv(index=False).encode()
+    return SimpleUploadedFile(nombre, contenido, content_type='text/csv')
+
+  def bloques_de(self, n):
+    """Lee los archivos subidos en bloques de `n` filas."""
+    patcher = mock.patch('backend.predictions.views.PlayerFileReader', partial(PlayerFileReader, chunksize=n))
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncPredictionViewTests(VistaTestCase):
+  """La vista asíncrona (la que se sirve con ASGI)."""
+
+  async def test_prediccion_individual(self):
+    jugador = jugadores('pitcher', 1)[0]
+    response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'pitcher', 'player_data': jugador}, content_type='application/json')
+    self.assertEqual(response.status_code, 200)
+    self.assertReporteOriginal(response.json(), jugador, 'pitcher')
+    self.assertEqual(self.db.row['prediction_count'], 1)
+
+  async def test_tipo_invalido_devuelve_la_reserva(self):
+    response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'goalie', 'player_data': {'ERA': 1}}, content_type='application/json')
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+  async def test_cuerpo_que_no_es_un_objeto(self):
+    for body in ([1, 2], '{roto'):
+      response = await self.async_client.post('/api/predictions/predict/', body, content_type='application/json')
+      self.assertEqual(response.status_code, 400)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+  async def test_player_data_que_no_es_un_objeto(self):
+    response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'pitcher', 'player_data': [1]}, content_type='application/json')
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+  async def test_archivo_se_cobra_por_jugador_procesado(self):
+    response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'file': self.archivo(5)})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual([r['Player'] for r in response.json()['results']], [f'Jugador {i}' for i in range(5)])
+    self.assertEqual(self.db.row['prediction_count'], 5)
+
+  async def test_ndjson_leido_hasta_el_final(self):
+    self.bloques_de(2)
+    response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'response_format': 'ndjson', 'file': self.archivo(5)})
+    registros = ndjson(b''.join([bloque async for bloque in response.streaming_content]))
+    self.assertEqual([r['Player'] for r in registros[:-1]], [f'Jugador {i}' for i in range(5)])
+    self.assertEqual(registros[-1], {'summary': {'processed': 5}})
+    self.assertEqual(self.db.row['prediction_count'], 5)
+
+  async def test_cancelado_a_mitad_de_un_bloque(self):
+    self.bloques_de(2)
+    segundo, seguir, cerrado = threading.Event(), threading.Event(), threading.Event()
+    puntuar, cerrar = views.batch, async_views._close
+    llamadas = []
+
+    def batch(*args):
+      llamadas.append(args)
+      if len(llamadas) == 2:
+        segundo.set()
+        seguir.wait(5)
+      return puntuar(*args)
+
+    def close(body, events):
+      cerrar(body, events)
+      cerrado.set()
+
+    with mock.patch.object(views, 'batch', batch), mock.patch.object(async_views, '_close', close):
+      response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'response_format': 'ndjson', 'file': self.archivo(6)})
+      contenido = aiter(response.streaming_content)
+      self.assertEqual(len(ndjson(await anext(contenido))), 2)
+      # El cliente se desconecta mientras el segundo bloque se puntúa en el pool
+      siguiente = asyncio.ensure_future(anext(contenido))
+      self.assertTrue(await asyncio.to_thread(segundo.wait, 5))
+      siguiente.cancel()
+      with self.assertRaises(asyncio.CancelledError):
+        await siguiente
+      # Se cobra lo ya puntuado; el generador se cierra cuando el pool termina el bloque en curso
+      self.assertEqual(self.db.row['prediction_count'], 2)
+      self.assertFalse(cerrado.is_set())
+      seguir.set()
+      self.assertTrue(await asyncio.to_thread(cerrado.wait, 5))
+    self.assertEqual(len(llamadas), 2)
+    self.assertEqual(self.db.row['prediction_count'], 2)
+
+  async def test_archivo_truncado_al_limite(self):
+    self.db.row.update(prediction_count=497, last_prediction_date=datetime.now().isoformat())
+    response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'file': self.archivo(5)})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(response.json()['results']), 3)
+    self.assertIn('warning', response.json())
+    self.assertEqual(self.db.row['prediction_count'], 500)
+
+  async def test_archivo_solo_en_el_plan_avanzado(self):
+    self.db.row['plan'] = 'basico'
+    response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'file': self.archivo(1)})
+    self.assertEqual(response.status_code, 403)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+  async def test_plan_mejorado_en_otro_proceso(self):
+    # El perfil en caché aún dice 'basico': se relee antes de devolver un 403
+    self.db.row['plan'] = 'basico'
+    await quota.aprofile('u1')
+    self.db.row['plan'] = 'avanzado'
+    response = await self.async_client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'file': self.archivo(2)})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(self.db.row['prediction_count'], 2)
+
+
+class ModelSchemaTests(SimpleTestCase):
+  """Validación del pipeline al cargarlo: los errores de esquema aparecen al arrancar, no en una petición."""
+
+  def setUp(self):
+    self.predictor = cargar_predictor()
+    self.pipeline = joblib.load(directorio_modelos() / 'Modelo_RF_Bateadores.pkl')
+    self.dataset = pd.read_csv(directorio_modelos() / 'Bateadores.csv')
+    self.snapshot = snapshot_for(directorio_modelos() / 'Bateadores.csv', FEATURES['batter'])
+
+  def bundle(self, pipeline=None, pesos=None, snapshot=None):
+    return self.predictor.ModelBundle(pipeline or self.pipeline, snapshot or self.snapshot, directorio_modelos() / 'Bateadores.csv',
+                                      METRICAS_INVERTIDAS['batter'], pesos or PESOS['batter'])
+
+  def test_arrays_precalculados(self):
+    bundle = self.bundle()
+    matriz = self.dataset[FEATURES['batter']].to_numpy()
+    np.testing.assert_array_equal(bundle.transform(matriz), self.pipeline['scaler'].transform(self.dataset[FEATURES['batter']]))
+    np.testing.assert_array_equal(bundle.weights, [PESOS['batter'][m] for m in FEATURES['batter']])
+    for array in (bundle.weights, bundle.reference, bundle.reference_scaled):
+      self.assertFalse(array.flags.writeable)
+
+  def test_scaler_con_otro_orden_de_features(self):
+    desordenadas = FEATURES['batter'][::-1]
+    scaler = StandardScaler().fit(self.dataset[desordenadas])
+    with self.assertRaisesRegex(ValueError, 'otro orden'):
+      self.bundle(dict(self.pipeline, scaler=scaler))
+
+  def test_pesos_que_no_cubren_las_features(self):
+    with self.assertRaisesRegex(ValueError, 'Faltan pesos'):
+      self.bundle(pesos={m: 1 for m in FEATURES['batter'][1:]})
+    with self.assertRaisesRegex(ValueError, 'no usa'):
+      self.bundle(pesos=dict(PESOS['batter'], HR=0.1))
+
+  def test_snapshot_de_otras_features(self):
+    with self.assertRaisesRegex(ValueError, 'snapshot'):
+      self.bundle(snapshot=snapshot_for(directorio_modelos() / 'Bateadores.csv', FEATURES['batter'][:3]))
+
+  def test_dataset_sin_las_features_del_modelo(self):
+    with self.assertRaisesRegex(ValueError, 'OPS'):
+      validate_features(self.dataset.drop(columns=['OPS']), FEATURES['batter'])
+    with self.assertRaisesRegex(ValueError, 'no numéricas'):
+      validate_features(self.dataset.assign(AVG='alto'), FEATURES['batter'])
+
+
+class BenchmarkTests(SimpleTestCase):
+  def test_quick_termina_bien_y_escribe_json(self):
+    # En otro proceso: el benchmark cambia el entorno y el registro de modelos del proceso que lo ejecuta
+    salida = subprocess.run([sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark', '--quick'],
+                            capture_output=True, text=True, timeout=300)
+    self.assertEqual(salida.returncode, 0, salida.stderr)
+    results = json.loads(salida.stdout)
+    for player_type in FEATURES:
+      self.assertGreater(results['single'][player_type]['p50_ms'], 0)
+    self.assertIn('csv', results['player_file'])
+    self.assertTrue(all(ratio == 1 for ratio in compare(results, results).values()))
+
+
+class MetricsTests(PredictorTestCase):
+  ETAPAS = ('profile', 'quota_reserve', 'cache_lookup', 'scale', 'predict_proba', 'percentiles', 'comparables', 'report', 'request')
+
+  def setUp(self):
+    super().setUp()
+    self.db = perfiles_en_memoria(self)
+    # Registro de métricas y caché propios: los contadores del proceso no dependen de otras pruebas
+    for patcher in (mock.patch.object(metrics, 'registry', metrics.Registry()),
+                    mock.patch.object(self.predictor, 'prediction_cache', PredictionCache(maxsize=100, ttl=60, db_path=''))):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def predecir(self):
+    jugador = jugadores('pitcher', 1)[0]
+    return self.client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'pitcher', 'player_data': jugador}, content_type='application/json')
+
+  def test_cabecera_server_timing(self):
+    with mock.patch.object(metrics, 'SERVER_TIMING', True):
+      response = self.predecir()
+    self.assertEqual(response.status_code, 200)
+    tiempos = dict(parte.split(';dur=') for parte in response['Server-Timing'].split(', '))
+    for etapa in self.ETAPAS:
+      self.assertIn(etapa, tiempos)
+    # Cada etapa aparece una vez y ninguna suma más que la petición completa
+    self.assertEqual(len(tiempos), len(response['Server-Timing'].split(', ')))
+    etapas = sum(float(ms) for nombre, ms in tiempos.items() if nombre != 'request')
+    self.assertLessEqual(etapas, float(tiempos['request']) + 0.01 * len(tiempos))
+
+  def escalado_lento(self):
+    """Escalado que tarda 50 ms, para ver en qué etapas se cuenta."""
+    bundle = self.predictor.registry.get('pitcher')
+    escalar = bundle.transform
+
+    def transform(matrix):
+      time.sleep(0.05)
+      return escalar(matrix)
+    return mock.patch.object(bundle, 'transform', transform)
+
+  def test_escalado_fuera_de_predict_proba(self):
+    with mock.patch.object(metrics, 'SERVER_TIMING', True), self.escalado_lento():
+      response = self.predecir()
+    tiempos = {nombre: float(ms) for nombre, ms in (parte.split(';dur=') for parte in response['Server-Timing'].split(', '))}
+    # El escalado se cuenta una sola vez: en 'scale', no también dentro de 'predict_proba'
+    self.assertGreaterEqual(tiempos['scale'], 50)
+    self.assertLess(tiempos['predict_proba'], 50)
+    self.assertLessEqual(sum(ms for nombre, ms in tiempos.items() if nombre != 'request'), tiempos['request'] + 0.01 * len(tiempos))
+
+  def test_etapas_en_prometheus_sin_solaparse(self):
+    with mock.patch.object(metrics, 'ENABLED', True), self.escalado_lento():
+      self.predecir()
+      texto = self.client.get('/api/predictions/metrics/').content.decode()
+    sumas = {linea.split('"')[1]: float(linea.rsplit(' ', 1)[1]) for linea in texto.splitlines() if linea.startswith('scoutml_stage_seconds_sum')}
+    self.assertGreaterEqual(sumas['scale'], 0.05)
+    self.assertLess(sumas['predict_proba'], 0.05)
+
+  def test_sin_configurar_no_hay_cabecera_ni_endpoint(self):
+    self.assertNotIn('Server-Timing', self.predecir())
+    self.assertEqual(self.client.get('/api/predictions/metrics/').status_code, 404)
+
+  def test_endpoint_de_prometheus(self):
+    with mock.patch.object(metrics, 'ENABLED', True):
+      self.predecir()
+      response = self.client.get('/api/predictions/metrics/')
+    self.assertEqual(response.status_code, 200)
+    texto = response.content.decode()
+    for etapa in self.ETAPAS:
+      self.assertIn(f'scoutml_stage_seconds_count{{stage="{etapa}"}} 1\n', texto)
+    self.assertIn('scoutml_stage_seconds_bucket{stage="predict_proba",le="+Inf"} 1\n', texto)
+    self.assertIn('scoutml_players_scored_total{player_type="pitcher"} 1\n', texto)
+    self.assertIn('scoutml_prediction_cache_misses_total 1\n', texto)
+
+  def test_histograma_acumulado(self):
+    registro = metrics.Registry()
+    for segundos in (0.0002, 0.003, 0.003, 20):
+      registro.observe('scale', segundos)
+    lineas = registro.render().splitlines()
+    self.assertIn('scoutml_stage_seconds_bucket{stage="scale",le="0.0005"} 1', lineas)
+    self.assertIn('scoutml_stage_seconds_bucket{stage="scale",le="0.005"} 3', lineas)
+    self.assertIn('scoutml_stage_seconds_bucket{stage="scale",le="10.0"} 3', lineas)
+    self.assertIn('scoutml_stage_seconds_bucket{stage="scale",le="+Inf"} 4', lineas)
+    self.assertIn('scoutml_stage_seconds_count{stage="scale"} 4', lineas)
+
+
+class FormatsTests(PredictorTestCase):
+  def test_numpy_nan_y_fechas(self):
+    data = {'a': np.float64(0.5), 'b': np.int64(3), 'c': np.array([1.5, np.nan]), 'd': float('nan'), 'e': np.float32(np.nan),
+            'f': pd.Timestamp('2004-05-06 13:45'), 'g': dt.date(2001, 2, 3), 'h': 'José'}
+    esperado = {'a': 0.5, 'b': 3, 'c': [1.5, None], 'd': None, 'e': None, 'f': '2004-05-06', 'g': '2001-02-03', 'h': 'José'}
+    self.assertEqual(json.loads(formats.dumps(data)), esperado)
+    # Sin orjson, el respaldo con json da el mismo resultado
+    with mock.patch.object(formats, 'orjson', None):
+      self.assertEqual(json.loads(formats.dumps(data)), esperado)
+
+  def test_formato_columnar(self):
+    lista = [dict(j, name=f'Jugador {i}') for i, j in enumerate(jugadores('batter', 20))]
+    reports = self.predictor.batch(lista, 'batter')
+    data = formats.columnar(reports)
+    self.assertEqual((data['format'], data['count'], data['features']), ('columnar', 20, FEATURES['batter']))
+    columns = data['columns']
+    self.assertTrue(all(len(column) == 20 for column in columns.values()))
+    for i, report in enumerate(reports):
+      self.assertEqual(columns['Player'][i], report['Player'])
+      self.assertEqual(columns['ranking'][i], report['ranking'])
+      self.assertEqual(dict(zip(data['features'], columns['calculated_stats'][i])), report['calculated_stats'])
+      # Los factores se reconstruyen con el índice de la feature y su valor en calculated_stats
+      positivos = [{'metrica': data['features'][j], 'valor': columns['calculated_stats'][i][j], 'percentil': p} for j, p in columns['factores_positivos'][i]]
+      self.assertEqual(positivos, report['factores_positivos'])
+      self.assertEqual([[data['features'].index(f['metrica']), f['percentil']] for f in report['factores_a_mejorar']], columns['factores_a_mejorar'][i])
+    vacio = formats.columnar([])
+    self.assertEqual((vacio['count'], vacio['features'], vacio['columns']['Player']), (0, [], []))
+
+  def test_columnar_con_reportes_de_error(self):
+    reports = self.predictor.batch(jugadores('batter', 2), 'batter')
+    reports.insert(1, {"error": "Tipo de jugador no válido."})
+    data = formats.columnar(reports)
+    self.assertEqual(data['features'], FEATURES['batter'])
+    columns = data['columns']
+    self.assertEqual(columns['error'], [None, "Tipo de jugador no válido.", None])
+    self.assertEqual(columns['calculated_stats'][1], [None] * len(FEATURES['batter']))
+    self.assertEqual((columns['factores_positivos'][1], columns['factores_a_mejorar'][1]), ([], []))
+    self.assertEqual(columns['ranking'][1], None)
+    solo_errores = formats.columnar([{"error": "x"}] * 2)
+    self.assertEqual((solo_errores['features'], solo_errores['columns']['error']), ([], ['x', 'x']))
+    self.assertNotIn('error', formats.columnar(reports[::2])['columns'])
+
+  def test_renderer(self):
+    renderer = ORJSONRenderer()
+    self.assertEqual(renderer.render(None), b'')
+    self.assertEqual(renderer.render({'x': np.float64(np.nan)}), b'{"x":null}')
+
+  def test_subida_en_formato_columnar(self):
+    db = perfiles_en_memoria(self)
+    media = tempfile.mkdtemp(prefix='scoutml-media-')
+    self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+    filas = [dict(zip(FEATURES['batter'], fila), nombre=f'Jugador {i}') for i, fila in enumerate(jugadores('batter', 4))]
+    archivo = SimpleUploadedFile('jugadores.csv', pd.DataFrame(filas).to_csv(index=False).encode(), content_type='text/csv')
+    with override_settings(MEDIA_ROOT=media):
+      response = self.client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'response_format': 'columnar', 'file': archivo})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response['Content-Type'], 'application/json')
+    results = response.json()['results']
+    self.assertEqual((results['format'], results['count']), ('columnar', 4))
+    self.assertEqual(results['columns']['Player'], [f'Jugador {i}' for i in range(4)])
+    self.assertEqual(db.row['prediction_count'], 4)
+
+
+def ndjson(contenido):
+  return [json.loads(linea) for linea in contenido.decode().splitlines()]
+
+
+class StreamingTests(VistaTestCase):
+  def setUp(self):
+    super().setUp()
+    self.bloques_de(2)
+
+  def subir(self, n, response_format='ndjson', **kwargs):
+    data = {'user_id': 'u1', 'player_type': 'batter', 'response_format': response_format, 'file': self.archivo(n, **kwargs)}
+    return self.client.post('/api/predictions/predict/', data)
+
+  def test_ndjson_leido_hasta_el_final(self):
+    response = self.subir(5)
+    self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+    registros = ndjson(b''.join(response.streaming_content))
+    self.assertEqual([r['Player'] for r in registros[:-1]], [f'Jugador {i}' for i in range(5)])
+    self.assertEqual(registros[-1], {'summary': {'processed': 5}})
+    self.assertEqual(self.db.row['prediction_count'], 5)
+    self.assertEqual(list(self.media.iterdir()), [])
+
+  def test_sse(self):
+    response = self.subir(3, 'sse')
+    self.assertEqual(response['Content-Type'], 'text/event-stream')
+    eventos = [bloque.split('\ndata: ') for bloque in b''.join(response.streaming_content).decode().strip().split('\n\n')]
+    self.assertEqual([evento for evento, _ in eventos], ['event: result'] * 3 + ['event: summary'])
+    self.assertEqual(json.loads(eventos[-1][1]), {'processed': 3})
+
+  def test_truncado_al_limite(self):
+    self.db.row.update(prediction_count=497, last_prediction_date=datetime.now().isoformat())
+    registros = ndjson(b''.join(self.subir(5).streaming_content))
+    self.assertEqual(len(registros), 4)
+    self.assertEqual(registros[-1]['summary']['processed'], 3)
+    self.assertIn('warning', registros[-1]['summary'])
+    self.assertEqual(self.db.row['prediction_count'], 500)
+
+  def test_cierre_anticipado_cobra_lo_puntuado(self):
+    response = self.subir(6)
+    primero = next(iter(response.streaming_content))
+    self.assertEqual(len(ndjson(primero)), 2)
+    # El cliente se desconecta: solo se cobra el bloque que ya se puntuó
+    response.close()
+    self.assertEqual(self.db.row['prediction_count'], 2)
+    self.assertEqual(list(self.media.iterdir()), [])
+
+  def test_la_cuota_se_reserva_bloque_a_bloque(self):
+    contadores = []
+    puntuar = views.batch
+
+    def batch(*args):
+      contadores.append(self.db.row['prediction_count'])
+      return puntuar(*args)
+
+    with mock.patch.object(views, 'batch', batch):
+      b''.join(self.subir(5).streaming_content)
+    # No se aparta todo el límite del plan mientras se lee el archivo
+    self.assertEqual(contadores, [2, 4, 5])
+    self.assertEqual(self.db.row['prediction_count'], 5)
+
+  def test_cuota_gastada_por_otra_peticion_a_mitad_del_archivo(self):
+    puntuar = views.batch
+
+    def batch(*args):
+      # Otro proceso gasta casi toda la cuota mientras se puntúa el primer bloque
+      if self.db.row['prediction_count'] < 499:
+        self.db.row['prediction_count'] += 497
+      return puntuar(*args)
+
+    with mock.patch.object(views, 'batch', batch):
+      registros = ndjson(b''.join(self.subir(5).streaming_content))
+    self.assertEqual(len(registros), 4)
+    self.assertEqual(registros[-1]['summary']['processed'], 3)
+    self.assertIn('warning', registros[-1]['summary'])
+    self.assertEqual(self.db.row['prediction_count'], 500)
+
+  def test_archivo_ilegible_es_un_400(self):
+    response = self.subir(3, nombre='jugadores.pdf', contenido=b'%PDF-1.7 binario')
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+
+class JobTests(VistaTestCase):
+  def setUp(self):
+    super().setUp()
+    self.directory = Path(tempfile.mkdtemp(prefix='scoutml-jobs-'))
+    self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+    patcher = mock.patch.dict(os.environ, {'SCOUTML_JOBS_DIR': str(self.directory), 'SCOUTML_JOB_EXECUTOR': 'inline'})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.store = jobs.JobStore()
+
+  def trabajo(self, n, reserved=10):
+    """Trabajo pendiente con una reserva de `reserved` predicciones y un archivo de `n` jugadores."""
+    reservation = quota.reserve('u1', reserved)
+    job_id = self.store.create('u1', 'batter', reservation.granted, reserved=reservation.granted)
+    path = self.directory / 'uploads' / job_id
+    path.write_bytes(self.archivo(n).read())
+    return job_id, str(path)
+
+  def ejecutar(self, job_id, path):
+    return jobs.run_job(job_id, path, 'batter', 10, str(self.store.path))
+
+  def test_store_guarda_la_reserva(self):
+    job_id = self.store.create('u1', 'batter', 10, reserved=10)
+    self.store.update(job_id, status=jobs.COMPLETED, processed=3, results=[{'ERA': np.float64(1.5)}])
+    job = self.store.get(job_id, with_results=True)
+    self.assertEqual((job['status'], job['processed'], job['reserved'], job['settled']), ('completed', 3, 10, 0))
+    self.assertEqual(job['results'], [{'ERA': 1.5}])
+    self.assertIsNone(self.store.get('otro'))
+
+  def test_la_reserva_se_liquida_una_sola_vez(self):
+    job_id = self.store.create('u1', 'batter', 10, reserved=10)
+    self.assertEqual(self.store.claim(job_id)['id'], job_id)
+    self.assertIsNone(self.store.claim(job_id))
+
+  def test_purge_conserva_las_reservas_sin_liquidar(self):
+    sin_liquidar = self.store.create('u1', 'batter', 10, reserved=10)
+    liquidado = self.store.create('u1', 'batter', 10, reserved=10)
+    for job_id in (sin_liquidar, liquidado):
+      self.store.update(job_id, status=jobs.COMPLETED)
+    self.store.claim(liquidado)
+    self.store.purge(-1)
+    self.assertIsNotNone(self.store.get(sin_liquidar))
+    self.assertIsNone(self.store.get(liquidado))
+
+  def test_base_anterior_sin_columnas_de_reserva(self):
+    path = self.directory / 'anterior.sqlite3'
+    conn = sqlite3.connect(path)
+    conn.execute(
+      'CREATE TABLE jobs (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, player_type TEXT, status TEXT NOT NULL,'
+      ' processed INTEGER NOT NULL DEFAULT 0, limit_players INTEGER, warning TEXT, error TEXT,'
+      ' results TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+    )
+    conn.close()
+    store = jobs.JobStore(path)
+    self.assertEqual(store.get(store.create('u1', 'batter', 5, reserved=5))['reserved'], 5)
+
+  def test_run_job_cobra_lo_procesado(self):
+    job_id, path = self.trabajo(3)
+    self.assertEqual(self.db.row['prediction_count'], 10)
+    self.assertEqual(self.ejecutar(job_id, path), 3)
+    job = self.store.get(job_id, with_results=True)
+    self.assertEqual((job['status'], job['processed'], job['settled']), ('completed', 3, 1))
+    self.assertEqual([r['Player'] for r in job['results']], ['Jugador 0', 'Jugador 1', 'Jugador 2'])
+    self.assertEqual(self.db.row['prediction_count'], 3)
+    self.assertFalse(os.path.exists(path))
+
+  def test_run_job_fallido_devuelve_la_reserva(self):
+    job_id, path = self.trabajo(3)
+    Path(path).write_bytes(b'%PDF-1.7 binario')
+    self.assertEqual(self.ejecutar(job_id, path), 0)
+    job = self.store.get(job_id)
+    self.assertEqual((job['status'], job['settled']), ('failed', 1))
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+  def test_liquidacion_fallida_la_reintenta_el_reaper(self):
+    job_id, path = self.trabajo(3)
+    with mock.patch.object(quota, 'commit', side_effect=RuntimeError('sin red')):
+      self.ejecutar(job_id, path)
+    self.assertEqual((self.store.get(job_id)['settled'], self.db.row['prediction_count']), (0, 10))
+    jobs.reap_jobs(self.store, timeout=3600)
+    self.assertEqual((self.store.get(job_id)['settled'], self.db.row['prediction_count']), (1, 3))
+
+  def test_reaper_libera_los_trabajos_abandonados(self):
+    # El proceso que lo ejecutaba murió: el trabajo se quedó en 'running' sin más progreso
+    job_id, _ = self.trabajo(3)
+    self.store.update(job_id, status=jobs.RUNNING, processed=2)
+    jobs.reap_jobs(self.store, timeout=3600)
+    self.assertEqual((self.store.get(job_id)['status'], self.db.row['prediction_count']), ('running', 10))
+    jobs.reap_jobs(self.store, timeout=-1)
+    job = self.store.get(job_id)
+    self.assertEqual((job['status'], job['settled']), ('failed', 1))
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+  def test_vistas_de_estado_y_resultados(self):
+    response = self.client.post('/api/predictions/jobs/', {'user_id': 'u1', 'player_type': 'batter', 'file': self.archivo(3)})
+    self.assertEqual(response.status_code, 202)
+    job_id = response.json()['job_id']
+    self.assertEqual(self.db.row['prediction_count'], 3)
+    estado = self.client.get(f'/api/predictions/jobs/{job_id}/', {'user_id': 'u1'}).json()
+    self.assertEqual((estado['status'], estado['processed']), ('completed', 3))
+    resultados = self.client.get(f'/api/predictions/jobs/{job_id}/results/', {'user_id': 'u1'}).json()
+    self.assertEqual([r['Player'] for r in resultados['results']], ['Jugador 0', 'Jugador 1', 'Jugador 2'])
+    # Los trabajos de otro usuario no existen para este
+    self.assertEqual(self.client.get(f'/api/predictions/jobs/{job_id}/', {'user_id': 'u2'}).status_code, 404)
+    self.assertEqual(self.client.get(f'/api/predictions/jobs/{job_id}/results/', {'user_id': 'u2'}).status_code, 404)
+
+  def test_resultados_de_un_trabajo_pendiente(self):
+    job_id = self.store.create('u1', 'batter', 10)
+    response = self.client.get(f'/api/predictions/jobs/{job_id}/results/', {'user_id': 'u1'})
+    self.assertEqual((response.status_code, response.json()['status']), (202, 'pending'))
+
+  def test_el_trabajo_reserva_a_medida_que_lee(self):
+    encolados = []
+    pool = mock.Mock(submit=lambda *args: encolados.append(args) or Future())
+    with mock.patch.dict(os.environ, {'SCOUTML_JOB_EXECUTOR': 'thread'}), mock.patch.object(jobs, '_get_executor', return_value=pool):
+      job_id = self.client.post('/api/predictions/jobs/', {'user_id': 'u1', 'player_type': 'batter', 'file': self.archivo(3)}).json()['job_id']
+    # Encolado: solo una predicción reservada, no el límite del plan
+    self.assertEqual((self.store.get(job_id)['reserved'], self.db.row['prediction_count']), (1, 1))
+    run_job, *args = encolados[0]
+    self.assertEqual(run_job(*args), 3)
+    self.assertEqual((self.store.get(job_id)['reserved'], self.db.row['prediction_count']), (3, 3))
+
+  def test_trabajo_que_no_se_encola_devuelve_la_reserva(self):
+    with mock.patch.dict(os.environ, {'SCOUTML_JOB_EXECUTOR': 'thread'}), mock.patch.object(jobs, '_get_executor', side_effect=RuntimeError('sin workers')):
+      response = self.client.post('/api/predictions/jobs/', {'user_id': 'u1', 'player_type': 'batter', 'file': self.archivo(3)})
+    self.assertEqual(response.status_code, 500)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+    # La vista ya la devolvió: el reaper no la vuelve a devolver
+    jobs.reap_jobs(self.store, timeout=-1)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+    self.assertEqual(list((self.directory / 'uploads').iterdir()), [])
+
+
+class ExportTests(VistaTestCase):
+  def setUp(self):
+    super().setUp()
+    lista = [dict(j, name=f'Jugador {i}', weight=80.0 + i) for i, j in enumerate(jugadores('batter', 6))]
+    self.reports = self.predictor.batch(lista, 'batter')
+
+  def exportar(self, fmt):
+    # Dos bloques, como llegan al puntuar un archivo
+    return b''.join(export.write(fmt, [self.reports[:4], self.reports[4:]]))
+
+  def assertFilasDeLosReportes(self, frame):
+    self.assertEqual(list(frame.columns), [*export._DATOS, *export._RESULTADO, *FEATURES['batter'], *export._FACTORES])
+    self.assertEqual(list(frame['Player']), [r['Player'] for r in self.reports])
+    self.assertEqual(list(frame['Weight']), [r['Weight'] for r in self.reports])
+    self.assertEqual(list(frame['ranking']), [r['ranking'] for r in self.reports])
+    self.assertEqual(list(frame['is_prospect']), [r['is_prospect'] for r in self.reports])
+    np.testing.assert_allclose(frame['prospect_percentage'], [r['prospect_percentage'] for r in self.reports])
+    for feature in FEATURES['batter']:
+      np.testing.assert_allclose(frame[feature], [r['calculated_stats'][feature] for r in self.reports])
+    esperados = [', '.join(f"{f['metrica']} ({f['percentil']})" for f in r['factores_a_mejorar']) for r in self.reports]
+    self.assertEqual([v if isinstance(v, str) else '' for v in frame['factores_a_mejorar']], esperados)
+
+  def test_csv(self):
+    contenido = self.exportar('csv')
+    self.assertTrue(contenido.startswith(codecs.BOM_UTF8))
+    self.assertFilasDeLosReportes(pd.read_csv(io.BytesIO(contenido), encoding='utf-8-sig'))
+
+  def test_xlsx(self):
+    self.assertFilasDeLosReportes(pd.read_excel(io.BytesIO(self.exportar('xlsx')), sheet_name='Predicciones'))
+
+  @skipIf(export.pa is None, "requiere pyarrow")
+  def test_parquet(self):
+    contenido = self.exportar('parquet')
+    self.assertFilasDeLosReportes(pd.read_parquet(io.BytesIO(contenido)))
+    # Un row group por bloque
+    self.assertEqual(export.pq.ParquetFile(io.BytesIO(contenido)).num_row_groups, 2)
+
+  def test_sin_jugadores_solo_la_cabecera(self):
+    columnas = [*export._DATOS, *export._RESULTADO, *export._FACTORES]
+    contenido = b''.join(export.write('csv', []))
+    self.assertEqual(list(pd.read_csv(io.BytesIO(contenido), encoding='utf-8-sig').columns), columnas)
+    frame = pd.read_excel(io.BytesIO(b''.join(export.write('xlsx', []))), sheet_name='Predicciones')
+    self.assertEqual(list(frame.columns), columnas)
+    self.assertEqual(len(frame), 0)
+
+  def test_parquet_sin_pyarrow(self):
+    with mock.patch.object(export, 'pa', None):
+      with self.assertRaises(export.ExportError):
+        export.export_format({'response_format': 'parquet'})
+      response = self.client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'response_format': 'parquet', 'file': self.archivo(3)})
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(self.db.row['prediction_count'], 0)
+
+  def test_descarga_desde_la_vista(self):
+    response = self.client.post('/api/predictions/predict/', {'user_id': 'u1', 'player_type': 'batter', 'response_format': 'xlsx', 'file': self.archivo(3)})
+    self.assertEqual(response['Content-Disposition'], 'attachment; filename="predicciones.xlsx"')
+    frame = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+    self.assertEqual(list(frame['Player']), [f'Jugador {i}' for i in range(3)])
+    self.assertEqual(self.db.row['prediction_count'], 3)
+
+
+class CompiledForestTests(PredictorTestCase):
+  def test_predict_proba_igual_que_sklearn(self):
+    for player_type in FEATURES:
+      bundle = self.predictor.registry.get(player_type)
+      forest = CompiledForest(bundle.model, bundle._offset, bundle._scale)
+      matriz = np.array([list(j.values()) for j in jugadores(player_type, 500)])
+      esperadas = bundle.model.predict_proba(bundle.transform(matriz))[:, 1]
+      self.assertEqual(np.max(np.abs(forest.predict_proba(matriz) - esperadas)), 0.0)
+      # Las filas del propio dataset caen justo en los umbrales del entrenamiento
+      self.assertEqual(forest.verify(bundle.model, np.asarray(bundle.reference), bundle.reference_scaled), 0.0)
+
+  def test_sin_escalado_plegado_compara_en_float32(self):
+    bundle = self.predictor.registry.get('batter')
+    forest = CompiledForest(bundle.model)
+    scaled = bundle.reference_scaled
+    self.assertEqual(np.max(np.abs(forest.predict_proba(scaled) - bundle.model.predict_proba(scaled)[:, 1])), 0.0)
+
+  def test_rechaza_modelos_que_no_son_bosques(self):
+    with self.assertRaises(TypeError):
+      CompiledForest(self.predictor.registry.get('batter').scaler)
+
+  def test_inferencia_compilada_en_el_predictor(self):
+    lista = jugadores('pitcher', 50)
+    esperados = self.predictor.batch([dict(j) for j in lista], 'pitcher')
+    self.addCleanup(self.predictor.registry.clear)
+    with mock.patch.object(self.predictor, 'INFERENCE', 'compiled'):
+      self.predictor.registry.clear()
+      self.predictor.prediction_cache.invalidate()
+      self.assertIsNotNone(self.predictor.registry.get('pitcher').forest)
+      self.assertEqual(self.predictor.batch([dict(j) for j in lista], 'pitcher'), esperados)
+
+
+class WarmupTests(PredictorTestCase):
+  def setUp(self):
+    super().setUp()
+    from . import warmup
+    self.warmup = warmup
+    self.predictor.registry.clear()
+    self.addCleanup(self.predictor.registry.clear)
+
+  def test_preload_carga_todos_los_modelos(self):
+    self.warmup.preload()
+    self.assertEqual(sorted(self.predictor.registry.loaded()), sorted(FEATURES))
+
+  def test_preload_fallido_deja_la_carga_perezosa(self):
+    get = self.predictor.registry.get
+
+    def falla_pitcher(player_type):
+      if player_type == 'pitcher':
+        raise RuntimeError('sin red')
+      return get(player_type)
+
+    with mock.patch.object(self.predictor.registry, 'get', falla_pitcher):
+      self.warmup.preload()
+    self.assertEqual(self.predictor.registry.loaded(), ['batter'])
+
+  def test_warm_up_puntua_los_modelos_cargados_sin_dejar_rastro(self):
+    self.warmup.preload()
+    metrics.registry.observe('request', 0.1)
+    with mock.patch.object(self.warmup, '_reports', wraps=self.warmup._reports) as reports:
+      self.warmup.warm_up()
+    self.assertEqual(sorted({c.args[1] for c in reports.call_args_list}), sorted(FEATURES))
+    # Ni reportes en la caché ni tiempos sintéticos en las métricas
+    self.assertEqual(self.predictor.prediction_cache.stats()['size'], 0)
+    self.assertEqual(metrics.registry.stages, {})
+
+  def test_freeze(self):
+    self.addCleanup(gc.unfreeze)
+    self.warmup.freeze()
+    self.assertGreater(gc.get_freeze_count(), 0)
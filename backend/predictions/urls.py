@@ -1,6 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from .views import ProspectPredictionView
+from .metrics import metrics_view
+from .views import ProspectPredictionView, PredictionJobView, PredictionJobStatusView, PredictionJobResultsView
+
+# Con ASGI la predicción usa la vista asíncrona (misma URL y misma API)
+if settings.SCOUTML_ASYNC:
+    from .async_views import AsyncProspectPredictionView as ProspectPredictionView
 
 urlpatterns = [
     path('predict/', ProspectPredictionView.as_view(), name='predict_prospect'),
+    path('jobs/', PredictionJobView.as_view(), name='prediction_job_submit'),
+    path('jobs/<str:job_id>/', PredictionJobStatusView.as_view(), name='prediction_job_status'),
+    path('jobs/<str:job_id>/results/', PredictionJobResultsView.as_view(), name='prediction_job_results'),
+    path('metrics/', metrics_view, name='prediction_metrics'),
 ]
\ No newline at end of file
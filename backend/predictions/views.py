@@ -1,104 +1,199 @@
-import pandas as pd
 from rest_framework.views import APIView 
 from rest_framework.response import Response 
 from rest_framework import status 
+from rest_framework.renderers import BrowsableAPIRenderer
 from .predictor import single, batch
-from .file_reader import player_file 
-from supabase import create_client
-import os
-from datetime import datetime
-from dateutil import parser
-from django.core.files.storage import FileSystemStorage
-
-PLAN_LIMITS = {
-  'gratis': 1,
-  'basico': 10,
-  'medio': 20,
-  'avanzado': 500, 
-}
+from .file_reader import PlayerFileReader, PlayerFileError
+from django.http import StreamingHttpResponse
+from itertools import chain
+from .jobs import submit_job, get_job, PENDING, RUNNING, COMPLETED
+from .quota import quota, PLAN_LIMITS, ProfileNotFound, QuotaExceeded
+from . import metrics
+from .formats import columnar, wants_columnar, stream_format, encode_event, STREAM_CONTENT_TYPES
+from .renderers import ORJSONRenderer
+from . import export
+from .export import EXPORT_CONTENT_TYPES, ExportError, export_format
+
+# Las respuestas de predicción se serializan con orjson (NumPy, NaN y fechas sin limpieza previa)
+RENDERERS = [ORJSONRenderer, BrowsableAPIRenderer]
+
+
+def limit_warning(rows_read):
+  return f"Límite alcanzado. Se procesaron {rows_read} jugadores del archivo. Los restantes fueron omitidos."
+
+
+class UploadStream:
+  """Al recorrerlo, lee el archivo subido por bloques y puntúa cada uno en cuanto llega.
+
+  Produce ('result', reportes del bloque) por bloque y termina con ('summary', {...}).
+  `processed` son los jugadores puntuados hasta el momento (lo que se cobra de la cuota).
+  """
+
+  def __init__(self, file, player_type, reservation):
+    # Se lee directamente del UploadedFile (en memoria o en el temporal de Django), sin copiarlo a
+    # MEDIA_ROOT; el tipo se reconoce por el contenido. Nunca se leen más filas que el límite del plan
+    self.reader = PlayerFileReader(file, limit=reservation.limit)
+    self.player_type = player_type
+    self.reservation = reservation
+    self.processed = 0
+    self.truncated = False
+
+  def __iter__(self):
+    for players_chunk in metrics.timed_iter(self.reader, 'file_parse'):
+      # La reserva crece con cada bloque leído; se deja de leer al agotar la cuota
+      with metrics.stage('quota_reserve'):
+        covered = quota.cover(self.reservation, self.processed + len(players_chunk)) - self.processed
+      if covered < len(players_chunk):
+        players_chunk, self.truncated = players_chunk.iloc[:covered], True
+      if len(players_chunk):
+        reports = batch(players_chunk, self.player_type)
+        self.processed += len(players_chunk)
+        yield 'result', reports
+      if self.truncated:
+        break
+
+    summary = {"processed": self.processed}
+    if self.truncated or self.reader.truncated:
+      summary["warning"] = limit_warning(self.processed)
+    yield 'summary', summary
+
+
+# Puntúa el archivo subido completo. Devuelve (respuesta, jugadores procesados)
+def score_upload(file, player_type, reservation):
+  stream = UploadStream(file, player_type, reservation)
+  results = []
+  for event, data in stream:
+    if event == 'result':
+      results.extend(data)
+    else:
+      summary = data
+
+  response_data = {"results": results}
+  if "warning" in summary:
+    response_data["warning"] = summary["warning"]
+  return response_data, stream.processed
+
+
+def stream_response(body, fmt):
+  response = StreamingHttpResponse(body, content_type=STREAM_CONTENT_TYPES.get(fmt) or EXPORT_CONTENT_TYPES[fmt])
+  # Que ni la caché ni el proxy (nginx) retengan los bloques
+  response['Cache-Control'] = 'no-cache'
+  response['X-Accel-Buffering'] = 'no'
+  if fmt in EXPORT_CONTENT_TYPES:
+    response['Content-Disposition'] = f'attachment; filename="{export.filename(fmt)}"'
+  return response
+
+
+# NDJSON/SSE de los eventos de UploadStream; un error a mitad del archivo llega como último evento
+def _event_body(fmt, first, events):
+  try:
+    yield encode_event(fmt, *first)
+    for event in events:
+      yield encode_event(fmt, *event)
+  except PlayerFileError as e:
+    yield encode_event(fmt, 'error', {"error": str(e)})
+  except Exception as e:
+    yield encode_event(fmt, 'error', {"error": f"Error al procesar el archivo: {str(e)}"})
+
+
+def upload_body(fmt, first, events):
+  """Bytes de la respuesta en streaming en el formato `fmt` (NDJSON/SSE o exportación)."""
+  if fmt in EXPORT_CONTENT_TYPES:
+    return export.write(fmt, (data for event, data in chain([first], events) if event == 'result'))
+  return _event_body(fmt, first, events)
+
+
+def upload_error(fmt, first):
+  # Con un tipo de jugador no válido no hay filas que exportar: se responde con el error
+  event, data = first
+  if fmt in EXPORT_CONTENT_TYPES and event == 'result' and data and 'error' in data[0]:
+    return {"error": data[0]['error']}
+  return None
+
+
+# La cuota se confirma al terminar el stream (o al cortarse la conexión) con los jugadores ya puntuados
+def _settled(body, stream, events, reservation):
+  try:
+    yield from body
+  finally:
+    body.close()
+    events.close()
+    quota.commit(reservation, stream.processed)
+
 
 class ProspectPredictionView(APIView): 
+  renderer_classes = RENDERERS
+
   def post(self, request, *args, **kwargs): 
     user_id = request.data.get('user_id') 
     if not user_id:
       return Response({"error": "Falta el user_id del usuario."}, status=status.HTTP_401_UNAUTHORIZED)
 
     try:
-      supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
-      
-      profile_response = supabase.table("profiles").select(
-        "plan, prediction_count, last_prediction_date"
-      ).eq("user_id", user_id).single().execute()
-      
-      if not profile_response.data:
-        return Response({"error": "Perfil de usuario no encontrado."}, status=status.HTTP_404_NOT_FOUND)
-      
-      profile = profile_response.data
-      user_plan = profile.get('plan') or 'gratis'
-      prediction_count = profile.get('prediction_count') or 0
-      last_prediction_str = profile.get('last_prediction_date')
-      
-      # Reinicio del contador mensual 
-      current_month = datetime.now().month
-      if last_prediction_str and parser.isoparse(last_prediction_str).month != current_month:
-        prediction_count = 0 
-
+      # Perfil desde la caché de cuotas: normalmente sin ir a Supabase
+      with metrics.stage('profile'):
+        profile = quota.profile(user_id)
+    except ProfileNotFound:
+      return Response({"error": "Perfil de usuario no encontrado."}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
       return Response({"error": f"Error al verificar el perfil: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    user_plan = profile.plan
+    limit = PLAN_LIMITS.get(user_plan, 0)
+
     #  Lógica para carga de archivos (Plan Avanzado)
     if 'file' in request.FILES:
       if user_plan != 'avanzado':
-        return Response({"error": "La carga de archivos solo está disponible en el plan Avanzado."}, status=status.HTTP_403_FORBIDDEN)
-
-      limit = PLAN_LIMITS.get(user_plan, 0)
-
-      fs = FileSystemStorage()
-      file = request.FILES['file']
-      filename = fs.save(file.name, file)
-      file_path = fs.path(filename)
-      file_type = filename.split('.')[-1].lower()
+        # Antes de negar se confirma con Supabase: el cambio de plan pudo hacerse en otro worker
+        try:
+          profile = quota.confirm_plan(profile, 'avanzado')
+        except Exception as e:
+          return Response({"error": f"Error al verificar el perfil: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if profile.plan != 'avanzado':
+          return Response({"error": "La carga de archivos solo está disponible en el plan Avanzado."}, status=status.HTTP_403_FORBIDDEN)
+        user_plan, limit = profile.plan, PLAN_LIMITS.get(profile.plan, 0)
 
       try:
-        # Usar el nuevo parser para leer y procesar el archivo
-        parsed_players = player_file(file_path, file_type)
-
-        if isinstance(parsed_players, dict) and "error" in parsed_players:
-          return Response(parsed_players, status=status.HTTP_400_BAD_REQUEST)
-
-        players_in_file = len(parsed_players)
-        predictions_available = limit - prediction_count
+        fmt = stream_format(request.data) or export_format(request.data)
+      except ExportError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if predictions_available <= 0:
-          return Response({"error": f"Ya has alcanzado tu límite mensual de {limit} predicciones."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
-
-        players_to_process = min(players_in_file, predictions_available)
+      # Se reserva una predicción antes de leer el archivo (sin cuota no se parsea nada) y el resto
+      # bloque a bloque: las peticiones concurrentes no gastan las mismas predicciones, y tampoco
+      # se aparta todo el límite mientras se lee un archivo que puede tener pocos jugadores
+      try:
+        with metrics.stage('quota_reserve'):
+          reservation = quota.reserve(user_id, 1)
+      except QuotaExceeded:
+        return Response({"error": f"Ya has alcanzado tu límite mensual de {limit} predicciones."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+      except Exception as e:
+        return Response({"error": f"Error al verificar el perfil: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        # Pasar la lista de jugadores procesados a la función batch
-        results = batch(parsed_players[:players_to_process], request.data.get('player_type'))
+      if fmt:
+        return self.stream_upload(request, reservation, fmt)
 
-        response_data = {"results": results}
-        if players_to_process < players_in_file:
-          response_data["warning"] = f"Límite alcanzado. Se procesaron {players_to_process} de {players_in_file} jugadores. Los restantes fueron omitidos."
+      try:
+        response_data, players_to_process = score_upload(request.FILES['file'], request.data.get('player_type'), reservation)
+        if wants_columnar(request.data):
+          response_data["results"] = columnar(response_data["results"])
 
-        new_count = prediction_count + players_to_process
-        supabase.table("profiles").update({
-          "prediction_count": new_count,
-          "last_prediction_date": datetime.now().isoformat()
-        }).eq("user_id", user_id).execute()
+        # Se devuelven las predicciones reservadas que no se usaron
+        with metrics.stage('quota_commit'):
+          quota.commit(reservation, players_to_process)
 
         return Response(response_data, status=status.HTTP_200_OK)
 
+      except PlayerFileError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
       except Exception as e:
         return Response({"error": f"Error al procesar el archivo: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
       finally:
-        if os.path.exists(file_path):
-          os.remove(file_path)
+        # Si algo falló antes de confirmar, la reserva completa vuelve al usuario
+        quota.release(reservation)
 
     # Lógica para Predicción Individual 
     else:
-      limit = PLAN_LIMITS.get(user_plan, 0)
-      if prediction_count >= limit:
+      if quota.available(user_id) <= 0:
         return Response({"error": f"Has alcanzado tu límite mensual de {limit} predicciones."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
       
       player_data = request.data.get('player_data') 
@@ -106,20 +201,137 @@ class ProspectPredictionView(APIView):
 
       if not all([player_data, player_type]): 
         return Response({"error": "Faltan 'player_data' o 'player_type'."}, status=status.HTTP_400_BAD_REQUEST) 
+
+      try:
+        with metrics.stage('quota_reserve'):
+          reservation = quota.reserve(user_id, 1)
+      except QuotaExceeded:
+        return Response({"error": f"Has alcanzado tu límite mensual de {limit} predicciones."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+      except Exception as e:
+        return Response({"error": f"Error al verificar el perfil: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
       
       try: 
         result = single(player_data, player_type) 
         if 'error' in result:
+          quota.release(reservation)
           return Response(result, status=status.HTTP_400_BAD_REQUEST)
 
-        # Actualizamos el contador
-        new_count = prediction_count + 1
-        supabase.table("profiles").update({
-          "prediction_count": new_count,
-          "last_prediction_date": datetime.now().isoformat()
-        }).eq("user_id", user_id).execute()
-
+        with metrics.stage('quota_commit'):
+          quota.commit(reservation)
         return Response(result, status=status.HTTP_200_OK) 
       
       except Exception as e: 
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        quota.release(reservation)
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+  def stream_upload(self, request, reservation, fmt):
+    # El primer bloque se puntúa antes de responder: un archivo ilegible todavía devuelve un 400
+    try:
+      stream = UploadStream(request.FILES['file'], request.data.get('player_type'), reservation)
+      events = iter(stream)
+      first = next(events)
+    except PlayerFileError as e:
+      quota.release(reservation)
+      return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+      quota.release(reservation)
+      return Response({"error": f"Error al procesar el archivo: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    error = upload_error(fmt, first)
+    if error is not None:
+      events.close()
+      quota.release(reservation)
+      return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+    return stream_response(_settled(upload_body(fmt, first, events), stream, events, reservation), fmt)
+
+
+# Trabajos de predicción por archivo: se encolan y se consultan después
+class PredictionJobView(APIView):
+  renderer_classes = RENDERERS
+
+  def post(self, request, *args, **kwargs):
+    user_id = request.data.get('user_id')
+    if not user_id:
+      return Response({"error": "Falta el user_id del usuario."}, status=status.HTTP_401_UNAUTHORIZED)
+
+    if 'file' not in request.FILES:
+      return Response({"error": "Falta el archivo de jugadores."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+      profile = quota.confirm_plan(quota.profile(user_id), 'avanzado')
+    except ProfileNotFound:
+      return Response({"error": "Perfil de usuario no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+      return Response({"error": f"Error al verificar el perfil: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    if profile.plan != 'avanzado':
+      return Response({"error": "La carga de archivos solo está disponible en el plan Avanzado."}, status=status.HTTP_403_FORBIDDEN)
+
+    limit = PLAN_LIMITS.get(profile.plan, 0)
+    try:
+      # Una predicción para encolarlo; el trabajo reserva el resto a medida que lee el archivo
+      reservation = quota.reserve(user_id, 1)
+    except QuotaExceeded:
+      return Response({"error": f"Ya has alcanzado tu límite mensual de {limit} predicciones."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    except Exception as e:
+      return Response({"error": f"Error al verificar el perfil: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    try:
+      # El trabajo guarda la reserva y la liquida al terminar (con lo procesado, o nada si falla)
+      job_id = submit_job(request.FILES['file'], reservation, request.data.get('player_type'))
+    except Exception as e:
+      quota.release(reservation)
+      return Response({"error": f"Error al crear el trabajo: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({"job_id": job_id, "status": PENDING}, status=status.HTTP_202_ACCEPTED)
+
+
+def _job_status(job):
+  return {
+    "job_id": job['id'],
+    "status": job['status'],
+    "processed": job['processed'],
+    "limit": job['limit_players'],
+    "warning": job['warning'],
+    "error": job['error'],
+  }
+
+
+class PredictionJobStatusView(APIView):
+  renderer_classes = RENDERERS
+
+  def get(self, request, job_id, *args, **kwargs):
+    job = get_job(job_id, request.query_params.get('user_id'))
+    if job is None:
+      return Response({"error": "Trabajo no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(_job_status(job), status=status.HTTP_200_OK)
+
+
+class PredictionJobResultsView(APIView):
+  renderer_classes = RENDERERS
+
+  def get(self, request, job_id, *args, **kwargs):
+    job = get_job(job_id, request.query_params.get('user_id'), with_results=True)
+    if job is None:
+      return Response({"error": "Trabajo no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+
+    if job['status'] in (PENDING, RUNNING):
+      return Response(_job_status(job), status=status.HTTP_202_ACCEPTED)
+    if job['status'] != COMPLETED:
+      return Response({"error": job['error'], "status": job['status']}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = job['results']
+    try:
+      fmt = export_format(request.query_params)
+    except ExportError as e:
+      return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if fmt:
+      return stream_response(export.write(fmt, [results]), fmt)
+    if wants_columnar(request.query_params):
+      results = columnar(results)
+    response_data = {"results": results}
+    if job['warning']:
+      response_data["warning"] = job['warning']
+    return Response(response_data, status=status.HTTP_200_OK)
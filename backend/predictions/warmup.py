@@ -0,0 +1,53 @@
+import gc
+import time
+
+import numpy as np
+
+from . import metrics
+from .file_reader import PlayerFileReader
+from .formats import dumps
+from .predictor import PLAYER_TYPES, _reports, registry
+
+#  PRE-FORK (gunicorn.conf.py)
+# El maestro carga los modelos e índices antes de crear los workers y congela el heap con
+# gc.freeze(): los workers comparten esas páginas copy-on-write y el recolector no las toca.
+# Cada worker hace después una predicción sintética antes de aceptar tráfico.
+
+# Archivo mínimo para calentar la lectura de CSV (pandas, resolución de cabeceras)
+_WARMUP_CSV = b'nombre,apellido,g,ab,h,2b,3b,hr,bb,so\nAna,Ruiz,10,30,9,2,0,1,3,5\n'
+
+
+def preload():
+  """Carga en este proceso los modelos e índices de todos los tipos de jugador."""
+  inicio = time.perf_counter()
+  for player_type in PLAYER_TYPES:
+    try:
+      registry.get(player_type)
+    except Exception as e:
+      # Sin modelos en el maestro cada worker los cargará en su primera petición
+      print(f"No se pudo precargar el modelo '{player_type}': {e}")
+  print(f"Modelos precargados en {time.perf_counter() - inicio:.2f} s: {', '.join(registry.loaded())}")
+
+
+def freeze():
+  """Deja fuera del recolector todo lo cargado hasta ahora (llamar en el maestro justo antes del fork)."""
+  gc.collect()
+  gc.freeze()
+
+
+def warm_up():
+  """Predicción sintética por tipo de jugador para pagar en el arranque los costes de la primera llamada.
+
+  Pasa por el motor de puntuación sin la caché de reportes, y las métricas que genera se descartan.
+  """
+  inicio = time.perf_counter()
+  for player_type in registry.loaded():
+    bundle = registry.get(player_type)
+    # Jugador mediano del dataset de referencia, solo y en un lote de dos
+    jugador = dict(zip(bundle.features, np.median(np.asarray(bundle.reference), axis=0).tolist()))
+    dumps(_reports([jugador], player_type))
+    dumps(_reports([jugador, jugador], player_type))
+  for _ in PlayerFileReader(_WARMUP_CSV):
+    pass
+  metrics.registry.clear()
+  print(f"Worker calentado en {time.perf_counter() - inicio:.2f} s")
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -61,6 +63,9 @@ if DEBUG:
         "http://127.0.0.1:8000",
     ])
 
+# El frontend puede mandar Idempotency-Key para repetir un pago sin cobrarlo dos veces
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -70,6 +75,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.predictions.metrics.TimingMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -149,4 +155,9 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 PAYPAL_CLIENT_ID = os.getenv('PAYPAL_CLIENT_ID')
 PAYPAL_CLIENT_SECRET = os.getenv('PAYPAL_CLIENT_SECRET')
-PAYPAL_MODE = 'live'  # Cambia a 'live' en producción sin es sandbox
\ No newline at end of file
+PAYPAL_MODE = 'live'  # Cambia a 'live' en producción sin es sandbox
+# URL base de la API de PayPal (https://api-m.paypal.com en producción, o un servidor local para pruebas)
+PAYPAL_API_BASE = os.getenv('PAYPAL_API_BASE', 'https://api.sandbox.paypal.com')
+
+# Vistas asíncronas para predicción y pagos (asgi.py lo activa; con WSGI se usan las vistas síncronas)
+SCOUTML_ASYNC = os.getenv('SCOUTML_ASYNC', '0') == '1'
\ No newline at end of file
@@ -1,4 +1,109 @@
+import asyncio
 import os
-from supabase import create_client
+import threading
+import weakref
 
-supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
\ No newline at end of file
+import httpx
+from supabase import AsyncClientOptions, ClientOptions, acreate_client, create_client
+from supabase_auth import AsyncMemoryStorage, SyncGoTrueClient, SyncMemoryStorage
+
+# Configuración de la conexión (variables de entorno):
+# SUPABASE_TIMEOUT: segundos máximos por petición
+# SUPABASE_RETRIES: reintentos ante fallos de conexión (no repite peticiones ya enviadas)
+# SUPABASE_MAX_CONNECTIONS: tamaño del pool de conexiones keep-alive
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+DEFAULT_MAX_CONNECTIONS = 20
+
+_lock = threading.Lock()
+_http_client = None
+_supabase = None
+# Clientes asíncronos por event loop: las conexiones de httpx.AsyncClient pertenecen al loop que las abrió
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _http_settings():
+    max_connections = int(os.getenv('SUPABASE_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS))
+    return {
+        'timeout': float(os.getenv('SUPABASE_TIMEOUT', DEFAULT_TIMEOUT)),
+        'limits': httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        'follow_redirects': True,
+        'http2': True,
+    }
+
+
+def get_http_client():
+    """Cliente HTTP compartido: reutiliza conexiones TLS keep-alive hacia Supabase entre peticiones."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                transport=httpx.HTTPTransport(retries=int(os.getenv('SUPABASE_RETRIES', DEFAULT_RETRIES)), http2=True),
+                **_http_settings(),
+            )
+        return _http_client
+
+
+def get_supabase():
+    """Cliente Supabase compartido con la service key, para tablas y auth.admin.
+
+    Se crea en el primer uso (después del fork de cada worker) y nunca inicia sesión,
+    así que su cabecera Authorization es siempre la de la service key.
+    """
+    global _supabase
+    if _supabase is None:
+        http_client = get_http_client()
+        with _lock:
+            if _supabase is None:
+                _supabase = create_client(
+                    os.getenv('SUPABASE_URL'),
+                    os.getenv('SUPABASE_KEY'),
+                    options=ClientOptions(
+                        httpx_client=http_client,
+                        auto_refresh_token=False,
+                        persist_session=False,
+                        storage=SyncMemoryStorage(),
+                    ),
+                )
+    return _supabase
+
+
+def get_auth_client():
+    """Cliente de Auth para registrar o iniciar sesión, sobre el mismo pool HTTP.
+
+    Es uno por petición porque iniciar sesión guarda la sesión del usuario en el cliente;
+    hacerlo en el cliente compartido haría que las siguientes consultas usaran su token.
+    """
+    key = os.getenv('SUPABASE_KEY')
+    return SyncGoTrueClient(
+        url=f"{os.getenv('SUPABASE_URL')}/auth/v1",
+        headers={"apiKey": key, "Authorization": f"Bearer {key}"},
+        http_client=get_http_client(),
+        auto_refresh_token=False,
+        persist_session=False,
+        storage=SyncMemoryStorage(),
+    )
+
+
+async def get_async_supabase():
+    """Cliente Supabase asíncrono con la service key, compartido por las vistas async del mismo event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(retries=int(os.getenv('SUPABASE_RETRIES', DEFAULT_RETRIES)), http2=True),
+            **_http_settings(),
+        )
+        client = await acreate_client(
+            os.getenv('SUPABASE_URL'),
+            os.getenv('SUPABASE_KEY'),
+            options=AsyncClientOptions(
+                httpx_client=http_client,
+                auto_refresh_token=False,
+                persist_session=False,
+                storage=AsyncMemoryStorage(),
+            ),
+        )
+        # Si otra corrutina del mismo loop lo creó mientras se esperaba, se usa el suyo
+        client = _async_clients.setdefault(loop, client)
+    return client
@@ -1,3 +1,40 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from . import supabase_client
+
+ENTORNO = {'SUPABASE_URL': 'https://proyecto.supabase.co', 'SUPABASE_KEY': 'service-key'}
+
+
+class SupabaseClientTests(SimpleTestCase):
+    def setUp(self):
+        # Cada prueba empieza sin clientes creados, como un worker recién arrancado
+        for name in ('_http_client', '_supabase'):
+            patcher = mock.patch.object(supabase_client, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        entorno = mock.patch.dict('os.environ', ENTORNO)
+        entorno.start()
+        self.addCleanup(entorno.stop)
+
+    def test_un_solo_cliente_compartido(self):
+        with mock.patch.object(supabase_client, 'create_client', side_effect=lambda *a, **k: object()) as create:
+            clientes = []
+            hilos = [threading.Thread(target=lambda: clientes.append(supabase_client.get_supabase())) for _ in range(8)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        self.assertEqual(create.call_count, 1)
+        self.assertTrue(all(cliente is clientes[0] for cliente in clientes))
+        # Sobre el pool HTTP compartido
+        self.assertIs(create.call_args.kwargs['options'].httpx_client, supabase_client.get_http_client())
+
+    def test_cliente_de_auth_por_peticion_sobre_el_mismo_pool(self):
+        primero, segundo = supabase_client.get_auth_client(), supabase_client.get_auth_client()
+        self.assertIsNot(primero, segundo)
+        self.assertIs(primero._http_client, segundo._http_client)
+        self.assertIs(primero._http_client, supabase_client.get_http_client())
+        self.assertEqual(primero._url, 'https://proyecto.supabase.co/auth/v1')
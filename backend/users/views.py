@@ -1,17 +1,13 @@
 from django.shortcuts import render
-import os
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from supabase import create_client
+from .supabase_client import get_supabase, get_auth_client
 from datetime import datetime
 
 class AuthView(APIView):
     def post(self, request, *args, **kwargs):
-        supabase_service_role = create_client(
-            os.getenv('SUPABASE_URL'), 
-            os.getenv('SUPABASE_KEY') 
-        )
+        supabase_service_role = get_supabase()
 
         email = request.data.get('email')
         password = request.data.get('password')
@@ -25,7 +21,7 @@ class AuthView(APIView):
         try:
             #  Registrar el usuario en Supabase Auth.
             
-            user_response = supabase_service_role.auth.sign_up({
+            user_response = get_auth_client().sign_up({
                 "email": email,
                 "password": password,
             })
@@ -66,10 +62,7 @@ class AuthView(APIView):
 
 class LoginView(APIView):
     def post(self, request, *args, **kwargs):
-        supabase = create_client(
-            os.getenv('SUPABASE_URL'), 
-            os.getenv('SUPABASE_KEY') 
-        )
+        supabase = get_supabase()
         email = request.data.get('email')
         password = request.data.get('password')
 
@@ -77,7 +70,8 @@ class LoginView(APIView):
             return Response({"error": "Email y contraseña son requeridos"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            user_response = supabase.auth.sign_in_with_password({"email": email, "password": password})
+            # La sesión del usuario queda en un cliente de Auth propio, no en el compartido
+            user_response = get_auth_client().sign_in_with_password({"email": email, "password": password})
             user_data = user_response.user
             
             profile_data = supabase.table("profiles").select("*").eq('user_id', user_data.id).single().execute()
@@ -91,10 +85,7 @@ class LoginView(APIView):
         
 class ProfileView(APIView):
     def post(self, request, *args, **kwargs):
-        supabase_admin = create_client(
-            os.getenv('SUPABASE_URL'), 
-            os.getenv('SUPABASE_KEY') 
-        )
+        supabase_admin = get_supabase()
 
         user_id = request.data.get('user_id')
         if not user_id:
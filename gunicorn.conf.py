@@ -0,0 +1,38 @@
+"""
+Configuración de gunicorn con carga previa de modelos (pre-fork).
+
+  gunicorn backend.wsgi -c gunicorn.conf.py
+  gunicorn backend.asgi -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker
+
+El maestro importa la aplicación, carga los modelos y los índices de referencia y congela el
+heap antes de crear los workers, que comparten esas páginas en lugar de cargar cada uno su
+copia. Cada worker hace una predicción sintética antes de aceptar peticiones, también al
+reciclarse por max_requests.
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+# Reciclado de workers (0 lo desactiva); el jitter evita que se reinicien todos a la vez
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 50))
+
+# La aplicación se importa en el maestro antes del fork
+preload_app = True
+
+
+def when_ready(server):
+  # Maestro, justo antes de crear los workers
+  from backend.predictions import warmup
+
+  warmup.preload()
+  warmup.freeze()
+
+
+def post_worker_init(worker):
+  # Worker recién creado, antes de aceptar peticiones
+  from backend.predictions import warmup
+
+  warmup.warm_up()